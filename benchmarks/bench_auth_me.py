@@ -0,0 +1,90 @@
+"""
+Requests/sec of GET /api/auth/me/ with the access token cache disabled (before) and enabled (after).
+
+Every request sends the same access token, as a client does between two refreshes.
+The user comes from the user cache in both modes, so the difference is the JWT signature verification.
+
+Usage:
+    python -m benchmarks.bench_auth_me --requests 20000 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from main import app
+from src.database.db import get_db
+from src.database.models import Base, User
+from src.services.auth import auth_service
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
+
+
+def seed(path: str) -> User:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with Session(engine, expire_on_commit=False) as db:
+        user = User(username="bench", email="bench@example.com", password="x", confirmed=True, avatar="bench.webp")
+        db.add(user)
+        db.commit()
+    engine.dispose()
+    return user
+
+
+async def run(maxsize: int, path: str, token: str, requests: int, concurrency: int) -> float:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_db():
+        async with session_maker() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    token_cache.maxsize = maxsize
+    token_cache._claims.clear()
+    user_cache.clear()
+
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                response = await client.get("/api/auth/me/", headers=headers)
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    app.dependency_overrides.clear()
+    await engine.dispose()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        user = seed(path)
+        token = asyncio.run(auth_service.create_access_token(data={"sub": user.email}))
+        for name, maxsize in (("uncached", 0), ("cached", token_cache.maxsize)):
+            rps = asyncio.run(run(maxsize, path, token, args.requests, args.concurrency))
+            print(f"{name:>8}: {rps:8.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Latency of the birthday query for one user with 100k contacts.
+
+"python" is the previous implementation: load every contact of the user and filter with date.replace().
+"sql" is find_contacts_bday, which filters on the indexed (user_id, birth_md) pair in the database.
+
+Usage:
+    python -m benchmarks.bench_bday --contacts 100000 --days 7 --repeat 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database.models import Base, Contact, User, birth_month_day
+from src.repository.contacts import find_contacts_bday
+
+
+def seed(path: str, contacts_count: int) -> User:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    user = User(id=1, username="bench", email="bench@example.com", password="x")
+    rows = []
+    for i in range(contacts_count):
+        birthday = date(1950, 1, 1) + timedelta(days=random.randrange(365 * 60))
+        rows.append({"firstname": f"first{i}", "lastname": f"last{i}", "email": f"c{i}@example.com",
+                     "phone_number": "000", "date_of_birth": birthday, "birth_md": birth_month_day(birthday),
+                     "description": "bench", "user_id": user.id})
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": user.id, "username": user.username, "email": user.email,
+                                     "password": user.password}])
+        conn.execute(insert(Contact), rows)
+    engine.dispose()
+    return user
+
+
+async def python_filter(days: int, user: User, db: AsyncSession) -> list[Contact]:
+    date_now = datetime.now().date()
+    end_date = date_now + timedelta(days=days)
+    result = await db.execute(select(Contact).filter(Contact.user_id == user.id))
+    bdays_list = []
+    for contact in result.scalars().all():
+        try:
+            contact_bday_this_year = contact.date_of_birth.replace(year=date_now.year)
+        except ValueError:
+            continue
+        if date_now <= contact_bday_this_year <= end_date:
+            bdays_list.append(contact)
+    return bdays_list
+
+
+async def measure(path: str, user: User, days: int, repeat: int) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    for name, query in (("python", python_filter), ("sql", find_contacts_bday)):
+        timings = []
+        for _ in range(repeat):
+            async with session_maker() as db:
+                started = time.perf_counter()
+                found = await query(days, user, db)
+                timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"{name:>6}: median {timings[len(timings) // 2] * 1000:8.1f} ms, {len(found)} contacts")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        user = seed(path, args.contacts)
+        asyncio.run(measure(path, user, args.days, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
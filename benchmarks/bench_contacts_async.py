@@ -0,0 +1,141 @@
+"""
+Requests/sec of GET /api/contacts/ with the blocking session (before) and the async session (after).
+
+The "sync" mode serves the awaitable repository API from a blocking psycopg2/sqlite3 style Session,
+which is what the application did before the async data layer: every query runs on the event loop.
+The "async" mode uses the aiosqlite AsyncSession the application uses now.
+
+--latency-ms emulates the network round-trip of a remote database inside the driver thread,
+so the difference between blocking the loop and awaiting the driver becomes visible locally.
+
+Usage:
+    python -m benchmarks.bench_contacts_async --requests 2000 --concurrency 50 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date
+
+import httpx
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+from main import app
+from src.database.db import get_db
+from src.database.models import Base, Contact, User
+from src.routes import contacts
+from src.services.auth import auth_service
+
+
+class BlockingSession:
+    """The awaitable session API on top of a blocking Session, as the repositories used it before."""
+
+    def __init__(self, session: Session):
+        self._session = session
+
+    async def execute(self, *args, **kwargs):
+        return self._session.execute(*args, **kwargs)
+
+
+def seed(path: str, contacts_count: int) -> User:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with Session(engine, expire_on_commit=False) as db:
+        user = User(username="bench", email="bench@example.com", password="x", confirmed=True)
+        db.add(user)
+        db.commit()
+        db.add_all(Contact(firstname=f"first{i}", lastname=f"last{i}", email=f"c{i}@example.com",
+                           phone_number="000", date_of_birth=date(1990, 1, 1 + i % 28),
+                           description="bench", user_id=user.id) for i in range(contacts_count))
+        db.commit()
+    engine.dispose()
+    return user
+
+
+def add_latency(sync_engine, latency: float) -> None:
+    def trace(_statement):
+        time.sleep(latency)
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, _record):
+        if hasattr(dbapi_connection, "run_async"):
+            # aiosqlite: install the hook in the driver thread, where the statements run
+            dbapi_connection.run_async(lambda conn: conn._execute(conn._conn.set_trace_callback, trace))
+        else:
+            dbapi_connection.set_trace_callback(trace)
+
+
+async def run(mode: str, path: str, user: User, requests: int, concurrency: int, latency: float) -> float:
+    if mode == "sync":
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        if latency:
+            add_latency(engine, latency)
+
+        async def override_get_db():
+            with Session(engine) as db:
+                yield BlockingSession(db)
+    else:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=AsyncAdaptedQueuePool,
+                                     pool_size=concurrency)
+        if latency:
+            add_latency(engine.sync_engine, latency)
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def override_get_db():
+            async with session_maker() as db:
+                yield db
+
+    async def override_current_user():
+        return user
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[auth_service.get_current_user] = override_current_user
+    for route in contacts.router.routes:
+        for dependency in route.dependencies:
+            app.dependency_overrides[dependency.dependency] = lambda: None
+
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                response = await client.get("/api/contacts/", params={"limit": 20})
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    app.dependency_overrides.clear()
+    if mode == "sync":
+        engine.dispose()
+    else:
+        await engine.dispose()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--contacts", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        user = seed(path, args.contacts)
+        for mode in ("sync", "async"):
+            rps = asyncio.run(run(mode, path, user, args.requests, args.concurrency, args.latency_ms / 1000))
+            print(f"{mode:>5}: {rps:8.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Per-request overhead of the access control checks.
+
+"none" is the bare application, "stacked" the two previous @app.middleware("http") functions
+(user-agent ban, then ip ban) and "asgi" the single AccessControlMiddleware.
+Requests are sent straight to the ASGI application, so the numbers exclude the server and the network.
+
+Usage:
+    python -m benchmarks.bench_middleware --requests 20000
+"""
+import argparse
+import asyncio
+import time
+from typing import Callable
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from src.middleware import AccessControlMiddleware
+from src.services.banned_ips import banned_ips
+from src.services.user_agent_bans import user_agent_bans
+
+
+def bare_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return PlainTextResponse("pong")
+
+    return app
+
+
+def stacked_app() -> FastAPI:
+    app = bare_app()
+
+    @app.middleware("http")
+    async def user_agent_ban_middleware(request: Request, call_next: Callable):
+        if user_agent_bans.is_banned(request.headers.get("user-agent")):
+            return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"})
+        return await call_next(request)
+
+    @app.middleware("http")
+    async def limit_access_by_ip(request: Request, call_next: Callable):
+        if banned_ips.is_banned(request.client.host if request.client else None):
+            return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "Not allowed IP address"})
+        return await call_next(request)
+
+    return app
+
+
+def asgi_app() -> FastAPI:
+    app = bare_app()
+    app.add_middleware(AccessControlMiddleware)
+    return app
+
+
+async def call(app, scope: dict) -> None:
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    disconnected = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            disconnected.set()
+
+    await app(dict(scope), receive, send)
+
+
+async def measure(requests: int) -> None:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/ping", "raw_path": b"/ping", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"localhost"), (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) Firefox/115.0")],
+        "client": ("10.0.0.1", 50000), "server": ("localhost", 8000),
+    }
+    banned_ips.load(f"10.1.{i // 250}.{i % 250}" for i in range(10_000))
+    baseline = None
+    for name, factory in (("none", bare_app), ("stacked", stacked_app), ("asgi", asgi_app)):
+        app = factory()
+        for _ in range(500):
+            await call(app, scope)
+        started = time.perf_counter()
+        for _ in range(requests):
+            await call(app, scope)
+        per_request = (time.perf_counter() - started) / requests * 1e6
+        baseline = per_request if baseline is None else baseline
+        print(f"{name:>8}: {per_request:7.1f} us/request, overhead {per_request - baseline:6.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(measure(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,37 @@
+from pathlib import Path
+
 import redis.asyncio as async_redis
-import re
-from typing import Callable
-from ipaddress import ip_address
 
-from fastapi_limiter import FastAPILimiter
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
 
 from src.config.config import settings
-from src.routes import contacts, auth
+from src.database.db import SessionLocal, pool_monitor, replicas, sticky_writes
+from src.middleware import AccessControlMiddleware, MetricsMiddleware
+from src.routes import contacts, auth, metrics, well_known
 from src.repository.users import get_user_by_bunned_field
+from src.services.avatars import avatar_pipeline
+from src.services.banned_ips import banned_ips
+from src.services.contact_cache import contact_cache
+from src.services.rate_limit import rate_limiter
+from src.services.email_outbox import email_outbox
+from src.services.metrics import TimedRedis
+from src.services.refresh_tokens import refresh_store
+from src.services.signing_keys import key_ring
+from src.services.token_cache import token_cache
+from src.services.user_agent_bans import user_agent_bans
+from src.services.user_cache import user_cache
 
 app = FastAPI(title="OSA-SWAGGER", swagger_ui_parameters={"operationsSorter": "method"})
-user_agent_ban_list = [r"Python-urllib"]
 
 app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
+app.include_router(well_known.router)
+app.include_router(metrics.router)
+if settings.avatar_storage == "local":
+    Path(settings.avatar_local_dir).mkdir(parents=True, exist_ok=True)
+    app.mount(settings.avatar_local_url.rstrip("/"), StaticFiles(directory=settings.avatar_local_dir), name="avatars")
 
 
 origins = [
@@ -29,52 +44,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
-
-
-@app.middleware("http")
-async def user_agent_ban_middleware(request: Request, call_next: Callable):
-    """
-    The user_agent_ban_middleware function is a middleware function
-    that checks the user-agent header of an incoming request.
-    If the user-agent matches any of the patterns in our ban list,
-    then we return a 403 Forbidden response with a detail message.
-    Otherwise, we call next and return whatever response comes back from it.
-
-    :param request: Request: Access the request object
-    :param call_next: Callable: Pass the next middleware function in the chain
-    :return: A json-response with a status code of 403 and content of {&quot;detail&quot;: &quot;you are banned&quot;}
-     if the user-agent header matches any pattern in the user_agent_ban_list
-    """
-    user_agent = request.headers.get("user-agent")
-    for ban_pattern in user_agent_ban_list:
-        if re.search(ban_pattern, user_agent):
-            return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"})
-    response = await call_next(request)
-    return response
-
-
-@app.middleware("http")
-async def limit_access_by_ip(request: Request, call_next: Callable):
-    """
-    The limit_access_by_ip function is a middleware function that limits access to the API by IP address.
-    It checks if the client's IP address is in BANNED_IPS, and if so, returns an HTTP 403 Forbidden response.
-    Otherwise, it calls call_next() to continue processing.
-
-    :param request: Request: Get the client ip address
-    :param call_next: Callable: Pass the next function in the pipeline
-    :return: A json-response object
-    """
-    BUNNED_IPS = [ip_address(x.ip) for x in get_user_by_bunned_field() if get_user_by_bunned_field()]
-    try:
-        ip = ip_address(request.client.host)
-        if ip in BUNNED_IPS:
-            print(f'I am in BANNED LIST {ip}')
-            return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "Not allowed IP address"})
-    except ValueError as err:
-        print(err)
-    response = await call_next(request)
-    return response
+app.add_middleware(AccessControlMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.on_event("startup")
@@ -85,9 +58,54 @@ async def startup():
 
     :return: A list of objects
     """
-    r = await async_redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+    key_ring.reload()
+    await pool_monitor.start()
+    await replicas.start()
+    pool = async_redis.BlockingConnectionPool(host=settings.redis_host, port=settings.redis_port, db=0,
+                                              encoding="utf-8", decode_responses=True,
+                                              max_connections=settings.redis_max_connections,
+                                              timeout=settings.redis_pool_timeout,
+                                              socket_connect_timeout=settings.redis_connect_timeout)
+    r = app.state.redis = TimedRedis(connection_pool=pool)
+    await rate_limiter.start(r)
+    await key_ring.start(r)
+    async with SessionLocal() as db:
+        banned_ips.load(user.ip for user in await get_user_by_bunned_field(db))
+    await banned_ips.start(r)
+    await user_cache.start(r)
+    await user_agent_bans.start(r)
+    await email_outbox.start(r)
+    await avatar_pipeline.start(r)
+    await token_cache.start(r)
+    await refresh_store.start(r)
+    await contact_cache.start(r)
+    await sticky_writes.start(r)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    The shutdown function is called when the application stops.
+    It cancels the Redis subscriptions of the banned ip set, the user cache, the user-agent bans, the token cache
+    and the signing keys, disconnects the email outbox, the refresh token store, the contact cache and the sticky writes,
+    stops the pool watchdog and the replica lag watcher, waits for the avatar jobs and closes the Redis connections.
+
+    :return: Nothing
+    """
+    await banned_ips.stop()
+    await user_cache.stop()
+    await user_agent_bans.stop()
+    await email_outbox.stop()
+    await avatar_pipeline.stop()
+    await token_cache.stop()
+    await key_ring.stop()
+    await refresh_store.stop()
+    await contact_cache.stop()
+    await sticky_writes.stop()
+    await pool_monitor.stop()
+    await replicas.stop()
+    await rate_limiter.stop()
+    await app.state.redis.close(close_connection_pool=True)
 
 
 @app.post("/reset-password")
@@ -0,0 +1,25 @@
+"""users bunned partial index
+
+Revision ID: 1a6e3c95d8f2
+Revises: e91b6d0f7a3c
+Create Date: 2023-07-31 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a6e3c95d8f2'
+down_revision = 'e91b6d0f7a3c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_bunned', 'users', ['id'], unique=False,
+                    postgresql_where=sa.text('bunned'), sqlite_where=sa.text('bunned'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_bunned', table_name='users')
@@ -0,0 +1,53 @@
+"""initial schema
+
+Revision ID: 3b1c9d2e4f50
+Revises: 
+Create Date: 2023-07-11 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1c9d2e4f50'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=150), nullable=False),
+        sa.Column('email', sa.String(length=150), nullable=False),
+        sa.Column('password', sa.String(length=255), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('avatar', sa.String(length=255), nullable=True),
+        sa.Column('refresh_token', sa.String(length=255), nullable=True),
+        sa.Column('confirmed', sa.Boolean(), nullable=True),
+        sa.Column('bunned', sa.Boolean(), nullable=True),
+        sa.Column('ip', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+    )
+    op.create_table(
+        'contacts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('firstname', sa.String(length=50), nullable=False),
+        sa.Column('lastname', sa.String(length=50), nullable=False),
+        sa.Column('email', sa.String(length=50), nullable=False),
+        sa.Column('phone_number', sa.String(length=50), nullable=False),
+        sa.Column('date_of_birth', sa.Date(), nullable=False),
+        sa.Column('description', sa.String(length=150), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('contacts')
+    op.drop_table('users')
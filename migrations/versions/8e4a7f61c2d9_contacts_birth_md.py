@@ -0,0 +1,33 @@
+"""contacts birth_md
+
+Revision ID: 8e4a7f61c2d9
+Revises: 3b1c9d2e4f50
+Create Date: 2023-07-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4a7f61c2d9'
+down_revision = '3b1c9d2e4f50'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birth_md', sa.SmallInteger(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE contacts SET birth_md = "
+                   "EXTRACT(MONTH FROM date_of_birth) * 100 + EXTRACT(DAY FROM date_of_birth)")
+    else:
+        op.execute("UPDATE contacts SET birth_md = "
+                   "CAST(strftime('%m', date_of_birth) AS INTEGER) * 100 "
+                   "+ CAST(strftime('%d', date_of_birth) AS INTEGER)")
+    op.create_index('ix_contacts_user_id_birth_md', 'contacts', ['user_id', 'birth_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birth_md', table_name='contacts')
+    op.drop_column('contacts', 'birth_md')
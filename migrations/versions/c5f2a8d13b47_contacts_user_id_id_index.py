@@ -0,0 +1,24 @@
+"""contacts user_id id index
+
+Revision ID: c5f2a8d13b47
+Revises: 8e4a7f61c2d9
+Create Date: 2023-07-24 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f2a8d13b47'
+down_revision = '8e4a7f61c2d9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
@@ -0,0 +1,34 @@
+"""contacts trigram search
+
+Revision ID: e91b6d0f7a3c
+Revises: c5f2a8d13b47
+Create Date: 2023-07-27 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b6d0f7a3c'
+down_revision = 'c5f2a8d13b47'
+branch_labels = None
+depends_on = None
+
+FIELDS = ('firstname', 'lastname', 'email')
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field in FIELDS:
+        op.create_index(f'ix_contacts_{field}_trgm', 'contacts', [field], unique=False,
+                        postgresql_using='gin', postgresql_ops={field: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for field in FIELDS:
+        op.drop_index(f'ix_contacts_{field}_trgm', table_name='contacts')
@@ -1,15 +1,27 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from src.config.config import settings
+from src.database.pool import PoolMonitor, engine_options
+from src.database.replicas import ReplicaSet, RoutingSession, StickyWrites
+from src.services.metrics import instrument_engine
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, **engine_options(settings))
+pool_monitor = PoolMonitor(settings.db_leak_threshold, settings.db_leak_stack)
+pool_monitor.attach(engine)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+replicas = ReplicaSet([create_async_engine(url, **engine_options(settings.copy(update={"sqlalchemy_database_url": url})))
+                       for url in settings.sqlalchemy_replica_urls],
+                      settings.db_replica_max_lag, settings.db_replica_lag_interval)
+sticky_writes = StickyWrites(settings.db_sticky_seconds)
+for instrumented in (engine, *replicas.engines):
+    instrument_engine(instrumented)
+
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, sync_session_class=RoutingSession,
+                                  autoflush=False, expire_on_commit=False)
 
 
 # Dependency
-def get_db():
+async def get_db():
     """
     The get_db function is a context manager that returns the database session.
     It also ensures that the connection to the database is closed after each request.
@@ -17,8 +29,21 @@ def get_db():
     :return: A database session
     :doc-author: OSA
     """
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+
+async def route_reads(db: AsyncSession, user_id: int) -> AsyncSession:
+    """
+    The route_reads function sends the plain SELECTs of a session to a read replica,
+    unless the user has written in the last db_sticky_seconds or every replica is lagging.
+    Writes made through the session still go to the primary.
+
+    :param db: AsyncSession: The session of the request
+    :param user_id: int: The id of the user the reads are made for
+    :return: The same session
+    :doc-author: OSA
+    """
+    if replicas and not await sticky_writes.is_sticky(user_id):
+        db.info["replica"] = replicas.choose()
+    return db
@@ -1,12 +1,26 @@
-from sqlalchemy import Column, Date, Integer, String, ForeignKey, Boolean
+from datetime import date
+
+from sqlalchemy import Column, Date, Integer, SmallInteger, String, ForeignKey, Boolean, Index, DDL, event, text
 from sqlalchemy.sql.sqltypes import DateTime
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy.orm import relationship, declarative_base, validates
 from sqlalchemy.sql import func
 
 
 Base = declarative_base()
 
 
+def birth_month_day(value: date) -> int:
+    """
+    The birth_month_day function encodes the month and the day of a date as one sortable number,
+    e.g. 9 July becomes 709. The year is dropped, so the number is the same every year.
+
+    :param value: date: The date of birth
+    :return: The month multiplied by 100 plus the day
+    :doc-author: OSA
+    """
+    return value.month * 100 + value.day
+
+
 class Contact(Base):
     """
         Represents a contact in the application.
@@ -21,6 +35,8 @@ class Contact(Base):
             description (str): A description or additional information about the contact.
             created_at (datetime.datetime): The timestamp when the contact was created.
             user_id (int): The foreign key referencing the user associated with the contact.
+            birth_md (int): The month and day of birth as month * 100 + day, kept in sync with date_of_birth
+            and indexed together with user_id for the birthday queries.
 
         Relationships:
             user (User): The user associated with the contact.
@@ -29,6 +45,15 @@ class Contact(Base):
             formatted_date_of_birth (str): The formatted date of birth in "dd-mm-yyyy" format. Returns None if date_of_birth is not set.
         """
     __tablename__ = "contacts"
+    __table_args__ = (
+        Index("ix_contacts_user_id_id", "user_id", "id"),
+        Index("ix_contacts_user_id_birth_md", "user_id", "birth_md"),
+        *(
+            Index(f"ix_contacts_{field}_trgm", field, postgresql_using="gin",
+                  postgresql_ops={field: "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+            for field in ("firstname", "lastname", "email")
+        ),
+    )
     id = Column(Integer, primary_key=True)
     firstname = Column(String(50), nullable=False)
     lastname = Column(String(50), nullable=False)
@@ -38,9 +63,24 @@ class Contact(Base):
     description = Column(String(150), nullable=False)
     created_at = Column('created_at', DateTime, default=func.now())
     user_id = Column(Integer, ForeignKey('users.id'), default=None)
+    birth_md = Column(SmallInteger, nullable=True)
 
     user = relationship("User", backref='contacts')
 
+    @validates("date_of_birth")
+    def validate_date_of_birth(self, key, value):
+        """
+        The validate_date_of_birth function keeps birth_md in sync every time date_of_birth is set.
+
+        :param self: Represent the instance of the object itself
+        :param key: The name of the attribute
+        :param value: The new date of birth
+        :return: The date of birth unchanged
+        :doc-author: OSA
+        """
+        self.birth_md = birth_month_day(value) if value else None
+        return value
+
     @property
     def formatted_date_of_birth(self):
         """
@@ -56,6 +96,10 @@ class Contact(Base):
         return None
 
 
+event.listen(Contact.__table__, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+
+
 class User(Base):
     """
         Represents a user in the application.
@@ -80,6 +124,9 @@ class User(Base):
         """
 
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_bunned", "id", postgresql_where=text("bunned"), sqlite_where=text("bunned")),
+    )
     id = Column(Integer, primary_key=True)
     username = Column(String(150), nullable=False, unique=False)
     email = Column(String(150), nullable=False, unique=True)
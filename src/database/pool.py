@@ -0,0 +1,221 @@
+import asyncio
+import bisect
+import time
+import traceback
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.config.config import Settings
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class Histogram:
+    """
+    A cumulative histogram with fixed bucket bounds, in seconds, in the shape Prometheus expects.
+
+    Methods:
+    observe(value: float) -> None:
+    Count one observation.
+    snapshot() -> dict:
+    Return the cumulative bucket counts, the sum and the count.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = WAIT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    The async queue pool of SQLAlchemy, timing how long every checkout waits for a connection,
+    including the time to open one when the pool grows into its overflow.
+    """
+
+    wait_histogram: Histogram | None = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.wait_histogram is not None:
+                self.wait_histogram.observe(time.perf_counter() - started)
+
+
+def engine_options(settings: Settings) -> dict:
+    """
+    The engine_options function builds the keyword arguments of create_async_engine from the settings.
+
+    PostgreSQL gets a bounded pool with pre-ping and recycling, and a statement timeout sent at connect time.
+    Behind pgbouncer in transaction mode, a server connection changes between transactions, so asyncpg must not
+    cache prepared statements and the startup parameters are left out: set statement_timeout on the role instead.
+    Other databases (the sqlite files of the tests) keep their defaults.
+
+    :param settings: Settings: The application settings
+    :return: The keyword arguments
+    :doc-author: OSA
+    """
+    url = make_url(settings.sqlalchemy_database_url)
+    if url.get_backend_name() != "postgresql":
+        return {}
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if url.get_driver_name() != "asyncpg":
+        return options
+    if settings.db_pgbouncer:
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4().hex}__",
+        }
+    elif settings.db_statement_timeout_ms:
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(settings.db_statement_timeout_ms)}}
+    return options
+
+
+class PoolMonitor:
+    """
+    Watches the connection pool of an engine: checkout waits and connections held too long.
+
+    A connection checked out for longer than leak_threshold seconds usually belongs to a session that is never closed.
+    The watchdog logs such checkouts once, with the stack of the checkout when capture_stack is on
+    (it costs a stack walk per checkout, so it is meant for debugging).
+
+    Methods:
+    attach(engine: AsyncEngine) -> None:
+    Listen to the pool of an engine.
+    leaks() -> list[dict]:
+    Return the checkouts older than leak_threshold.
+    stats() -> dict:
+    Return the state of the pool and the wait histogram.
+    start() -> None:
+    Run the leak watchdog.
+    stop() -> None:
+    Stop the leak watchdog.
+    """
+
+    def __init__(self, leak_threshold: float, capture_stack: bool = False):
+        self.leak_threshold = leak_threshold
+        self.capture_stack = capture_stack
+        self.wait_histogram = Histogram()
+        self.leaked = 0
+        self._pool = None
+        self._checkouts: dict[int, dict] = {}
+        self._reported: set[int] = set()
+        self._watchdog: asyncio.Task | None = None
+
+    def attach(self, engine: AsyncEngine) -> None:
+        """
+        The attach function starts recording the checkouts of the pool of an engine.
+
+        :param engine: AsyncEngine: The engine
+        :return: Nothing
+        :doc-author: OSA
+        """
+        pool = engine.sync_engine.pool
+        self._pool = pool
+        if isinstance(pool, TimedQueuePool):
+            pool.wait_histogram = self.wait_histogram
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        stack = "".join(traceback.format_stack(limit=12)[:-2]) if self.capture_stack else None
+        self._checkouts[id(connection_record)] = {"since": time.monotonic(), "stack": stack}
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        self._checkouts.pop(id(connection_record), None)
+        self._reported.discard(id(connection_record))
+
+    def leaks(self) -> list[dict]:
+        """
+        The leaks function lists the connections checked out for longer than leak_threshold.
+
+        :return: A list of dictionaries with the id of the checkout, for how long it is held and its stack
+        :doc-author: OSA
+        """
+        now = time.monotonic()
+        return [{"id": key, "held": now - checkout["since"], "stack": checkout["stack"]}
+                for key, checkout in list(self._checkouts.items())
+                if now - checkout["since"] > self.leak_threshold]
+
+    def check(self) -> None:
+        """
+        The check function logs every new leak once.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        for leak in self.leaks():
+            if leak["id"] in self._reported:
+                continue
+            self._reported.add(leak["id"])
+            self.leaked += 1
+            logger.warning(f"Connection checked out for {leak['held']:.1f}s, was its session closed?"
+                           + (f"\n{leak['stack']}" if leak["stack"] else ""))
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the state of the pool, the number of leaks and the checkout wait histogram.
+
+        :return: A dictionary
+        :doc-author: OSA
+        """
+        stats = {"checked_out": len(self._checkouts), "leaked": self.leaked, "wait": self.wait_histogram.snapshot()}
+        if isinstance(self._pool, AsyncAdaptedQueuePool):
+            stats.update(size=self._pool.size(), overflow=self._pool.overflow(), idle=self._pool.checkedin())
+        return stats
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.leak_threshold / 2, 1))
+            self.check()
+
+    async def start(self) -> None:
+        """
+        The start function runs the leak watchdog.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._watchdog is None and self.leak_threshold > 0:
+            self._watchdog = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        """
+        The stop function stops the leak watchdog.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
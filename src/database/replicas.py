@@ -0,0 +1,220 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+
+from redis.asyncio import Redis
+from sqlalchemy import Select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+# A replica that has replayed all the WAL it received is not behind, however old its last transaction is:
+# without that check an idle primary would make every replica look lagging.
+PG_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class RoutingSession(Session):
+    """
+    A session that sends plain SELECTs to the replica engine found in info["replica"], when there is one,
+    and everything else to the primary.
+
+    The first statement that is not a plain SELECT (a flush, an UPDATE, a SELECT ... FOR UPDATE) drops the replica,
+    so the rest of the session reads its own writes from the primary.
+    A call without a statement, e.g. db.get_bind() to read the dialect, gets the primary and keeps the replica.
+    """
+
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        replica = self.info.get("replica")
+        if replica is not None and (self._flushing or clause is not None):
+            if not self._flushing and isinstance(clause, Select) and clause._for_update_arg is None:
+                return replica
+            self.info["replica"] = None
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+class ReplicaSet:
+    """
+    The read replicas of the database and their replication lag.
+
+    A watcher measures the lag of every replica every interval seconds: on PostgreSQL as 0 when the replica
+    has replayed all the WAL it received, else from pg_last_xact_replay_timestamp(); on other databases
+    (local stand-ins) as 0 when the replica answers.
+    A replica that is behind by more than max_lag seconds, or does not answer, gets no reads
+    until it catches up; with no usable replica the reads go to the primary.
+
+    Methods:
+    choose() -> Engine | None:
+    Return the sync engine of a usable replica, round robin, or None.
+    record_lag(index: int, lag: float) -> None:
+    Store the measured lag of a replica.
+    start() -> None:
+    Run the lag watcher.
+    stop() -> None:
+    Stop the watcher and close the replica connections.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], max_lag: float, interval: float):
+        self.engines = engines
+        self.max_lag = max_lag
+        self.interval = interval
+        self.lags: list[float] = [0.0] * len(engines)
+        self._turn = itertools.count()
+        self._watcher: asyncio.Task | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def choose(self) -> Engine | None:
+        """
+        The choose function picks the replica of the next read among those that are not lagging.
+
+        :return: The sync engine of the replica, or None to read from the primary
+        :doc-author: OSA
+        """
+        usable = [engine for engine, lag in zip(self.engines, self.lags) if lag <= self.max_lag]
+        if not usable:
+            return None
+        return usable[next(self._turn) % len(usable)].sync_engine
+
+    def record_lag(self, index: int, lag: float) -> None:
+        """
+        The record_lag function stores the lag of a replica and logs when it becomes usable or not.
+
+        :param index: int: The position of the replica in engines
+        :param lag: float: The lag in seconds, infinite when the replica does not answer
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if (lag > self.max_lag) != (self.lags[index] > self.max_lag):
+            state = "lagging" if lag > self.max_lag else "back in use"
+            logger.warning(f"Read replica {self.engines[index].url.host or index} is {state} (lag {lag:.1f}s)")
+        self.lags[index] = lag
+
+    async def _measure(self, engine: AsyncEngine) -> float:
+        try:
+            async with engine.connect() as conn:
+                if engine.dialect.name == "postgresql":
+                    return float((await conn.execute(PG_LAG_QUERY)).scalar())
+                await conn.execute(text("SELECT 1"))
+                return 0.0
+        except Exception:
+            return float("inf")
+
+    async def _watch(self) -> None:
+        while True:
+            for index, engine in enumerate(self.engines):
+                self.record_lag(index, await self._measure(engine))
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        """
+        The start function runs the lag watcher when there are replicas.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self.engines and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        """
+        The stop function stops the lag watcher and closes the connections to the replicas.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        for engine in self.engines:
+            await engine.dispose()
+
+
+class StickyWrites:
+    """
+    Remembers the users who have just written, so their next reads go to the primary
+    until the replicas have had time to apply the write (read-your-writes).
+
+    The marks are kept in the worker, in the order they expire, and dropped once expired;
+    once started, they are also kept in Redis with a TTL, so they hold on every worker.
+
+    Attributes:
+    KEY (str): The prefix of the Redis keys of the marks.
+
+    Methods:
+    mark(user_id: int) -> None:
+    Send the reads of a user to the primary for ttl seconds.
+    is_sticky(user_id: int) -> bool:
+    Check if the reads of a user must go to the primary.
+    start(redis: Redis) -> None:
+    Share the marks through Redis.
+    stop() -> None:
+    Stop using Redis.
+    """
+
+    KEY = "db_sticky:"
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._until: OrderedDict[int, float] = OrderedDict()
+        self._redis: Redis | None = None
+
+    async def mark(self, user_id: int) -> None:
+        """
+        The mark function is called after a user's write is committed.
+
+        :param user_id: int: The id of the user
+        :return: Nothing
+        :doc-author: OSA
+        """
+        now = time.monotonic()
+        self._until[user_id] = now + self.ttl
+        self._until.move_to_end(user_id)
+        while self._until and next(iter(self._until.values())) <= now:
+            self._until.popitem(last=False)
+        if self._redis is not None:
+            await self._redis.set(self.KEY + str(user_id), 1, px=int(self.ttl * 1000))
+
+    async def is_sticky(self, user_id: int) -> bool:
+        """
+        The is_sticky function checks if a user wrote less than ttl seconds ago, on this worker or another one.
+
+        :param user_id: int: The id of the user
+        :return: True if the reads of the user must go to the primary
+        :doc-author: OSA
+        """
+        until = self._until.get(user_id)
+        if until is not None:
+            if until > time.monotonic():
+                return True
+            del self._until[user_id]
+        if self._redis is not None:
+            return bool(await self._redis.exists(self.KEY + str(user_id)))
+        return False
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function shares the marks with the other workers through Redis.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+
+    async def stop(self) -> None:
+        """
+        The stop function stops using Redis.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = None
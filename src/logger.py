@@ -1,24 +1,157 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from src.config.config import settings
 
 _format = f"%(asctime)s [%(levelname)s] - %(name)s - %(funcName)s(%(lineno)d) - %(message)s - %(pathname)s - %(msecs)d"
 
-file = 'src/data/hw_logs.log'
+file = settings.log_file
+
+# The attributes every LogRecord has; anything else was passed with extra= and goes to the JSON output as is.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line: the time, the level, the logger, the message, where it was logged,
+    the exception if any and the fields passed with extra=.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "function": record.funcName,
+            "line": record.lineno,
+            "path": record.pathname,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keeps one DEBUG record of every `every` logged at the same place, and every record of a higher level,
+    so a debug line in a hot path cannot flood the log.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(every, 1)
+        self._seen: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        site = (record.pathname, record.lineno)
+        seen = self._seen.get(site, 0)
+        self._seen[site] = seen + 1
+        return seen % self.every == 0
 
 
-file_handler = logging.FileHandler(file)
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(logging.Formatter(_format))
+class _QueueHandler(QueueHandler):
+    """
+    A QueueHandler that merges the arguments into the message and renders the exception before the record is queued,
+    like the standard one, but leaves the formatting of the message to the handlers behind the listener.
+    """
 
-stream_handler = logging.StreamHandler()
-stream_handler.setLevel(logging.DEBUG)
-stream_handler.setFormatter(logging.Formatter(_format))
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_lock = threading.Lock()
+_queue_handler: QueueHandler | None = None
+_listener: QueueListener | None = None
+
+
+def setup_logging() -> QueueHandler:
+    """
+    The setup_logging function creates, once, the queue the loggers of the application write to and the listener
+    thread that writes the queued records to the rotating log file (from INFO) and to the console.
+    The event loop only puts records on the queue; the disk writes happen in the listener thread.
+
+    :return: The handler that puts the records on the queue
+    :doc-author: OSA
+    """
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is not None:
+            return _queue_handler
+        formatter = JsonFormatter() if settings.log_json else logging.Formatter(_format)
+        Path(file).parent.mkdir(parents=True, exist_ok=True)
+        file_handler = RotatingFileHandler(file, maxBytes=settings.log_max_bytes,
+                                           backupCount=settings.log_backup_count, encoding="utf-8", delay=True)
+        file_handler.setLevel(logging.INFO)
+        file_handler.setFormatter(formatter)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setLevel(logging.DEBUG)
+        stream_handler.setFormatter(formatter)
+        records = queue.SimpleQueue()
+        handler = _QueueHandler(records)
+        handler.addFilter(DebugSampler(settings.log_debug_sample_every))
+        _listener = QueueListener(records, file_handler, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        _queue_handler = handler
+        return handler
+
+
+def stop_logging() -> None:
+    """
+    The stop_logging function writes the records still in the queue and stops the listener thread.
+
+    :return: Nothing
+    :doc-author: OSA
+    """
+    global _queue_handler, _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _queue_handler = _listener = None
 
 
 def get_logger(name):
+    """
+    The get_logger function returns the logger of a module, writing through the shared queue.
+    Calling it again for the same name returns the same logger without adding another handler.
+
+    :param name: The name of the logger, usually __name__
+    :return: The logger
+    :doc-author: OSA
+    """
+    handler = setup_logging()
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+    logger.setLevel(settings.log_level)
+    if handler not in logger.handlers:
+        for old in [old for old in logger.handlers if isinstance(old, _QueueHandler)]:
+            logger.removeHandler(old)
+        logger.addHandler(handler)
     return logger
 
 
@@ -27,4 +160,4 @@ def get_logger(name):
 #
 # logger.debug('Start program!')
 # logger.info(f'Client name: {client_1.name}, \n')
-# logger.warning(f'Client {client_1.name} spent: {client_1.get_check()}')
\ No newline at end of file
+# logger.warning(f'Client {client_1.name} spent: {client_1.get_check()}')
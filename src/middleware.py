@@ -0,0 +1,88 @@
+import time
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from prometheus_client import Histogram
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.services.banned_ips import BannedIPSet, banned_ips
+from src.services.metrics import http_request_duration
+from src.services.user_agent_bans import UserAgentBans, user_agent_bans
+
+
+class AccessControlMiddleware:
+    """
+    A pure ASGI middleware that rejects banned clients before the request reaches the router.
+
+    Banned IP addresses get 403 &quot;Not allowed IP address&quot;, banned User-Agents get 403 &quot;You are banned&quot;.
+    Allowed requests are passed to the application untouched: unlike @app.middleware(&quot;http&quot;),
+    no Request object, extra task or response stream is created, so streaming responses are not buffered.
+    """
+
+    def __init__(self, app: ASGIApp, ips: BannedIPSet = banned_ips, user_agents: UserAgentBans = user_agent_bans):
+        self.app = app
+        self.ips = ips
+        self.user_agents = user_agents
+
+    def _reject(self, scope: Scope) -> JSONResponse | None:
+        """
+        The _reject function checks the client address and the User-Agent header of a request.
+
+        :param scope: Scope: The ASGI scope of the request
+        :return: The 403 response to send, or None when the request is allowed
+        :doc-author: OSA
+        """
+        client = scope.get("client")
+        if client and self.ips.is_banned(client[0]):
+            return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "Not allowed IP address"})
+        for name, value in scope["headers"]:
+            if name == b"user-agent":
+                if self.user_agents.is_banned(value.decode("latin-1")):
+                    return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"})
+                break
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            response = self._reject(scope)
+            if response is not None:
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """
+    A pure ASGI middleware that times every HTTP request, until its last body chunk is sent,
+    into a histogram labelled by method, route template and status.
+
+    The route template (e.g. /api/contacts/{contact_id}) is read from the scope once the router has matched it,
+    so the number of series does not grow with the ids in the paths. Requests that match no route,
+    the rejected and static ones among them, share the route label UNMATCHED.
+    """
+
+    UNMATCHED = "<unmatched>"
+
+    def __init__(self, app: ASGIApp, histogram: Histogram = http_request_duration):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            self.histogram.labels(scope["method"], getattr(route, "path", self.UNMATCHED),
+                                  str(status_code)).observe(time.perf_counter() - started)
@@ -1,115 +1,220 @@
-from typing import List, Type
-
-from fastapi import Depends
-from sqlalchemy.orm import Session
-from datetime import timedelta, datetime
-from sqlalchemy import and_
-from src.database.db import get_db
-from src.database.models import Contact, User
+from typing import AsyncIterator, List, Type
+
+from calendar import isleap
+from datetime import date, timedelta, datetime
+
+from sqlalchemy import and_, case, func, insert, or_, select, ColumnElement, Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import sticky_writes
+from src.database.models import Contact, User, birth_month_day
 from src.schemas import ContactBase, ContactUpdate
+from src.services.contact_cache import contact_cache
+from src.services.metrics import track_queries
+from src.services.search import TrigramIndex, contact_search_indexes
 
 
-async def get_contacts(skip: int, limit: int, user: User, db: Session) -> List[Contact]:
+@track_queries
+async def get_contacts(skip: int, limit: int, user: User, db: AsyncSession, after_id: int | None = None) -> List[Contact]:
     """
-    The get_contacts function returns a list of contacts for the user.
+    The get_contacts function returns a list of contacts for the user, ordered by id.
+    With after_id the page starts right after that contact (keyset pagination) and skip is ignored,
+    so deep pages cost the same as the first one and rows are never repeated or skipped.
 
     :param skip: int: Skip the first n contacts in the database
     :param limit: int: Limit the number of contacts returned
     :param user: User: Get the user_id from the database
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
+    :param after_id: int | None: The id of the last contact of the previous page
     :return: A list of contacts
     :doc-author: OSA
     """
-    return db.query(Contact).filter(Contact.user_id==user.id).offset(skip).limit(limit).all()
+    query = select(Contact).filter(Contact.user_id == user.id).order_by(Contact.id).limit(limit)
+    if after_id is not None:
+        query = query.filter(Contact.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    return result.scalars().all()
+
 
+EXPORT_COLUMNS = (Contact.firstname, Contact.lastname, Contact.phone_number, Contact.email,
+                  Contact.date_of_birth, Contact.description)
 
 
+@track_queries
+async def stream_contacts(user: User, db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[List[Row]]:
+    """
+    The stream_contacts function reads every contact of the user through a server-side cursor
+    and yields them batch_size rows at a time, ordered by id.
+    Plain rows are selected instead of Contact objects, so nothing accumulates in the session
+    and memory stays constant whatever the number of contacts.
+
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Access the database
+    :param batch_size: int: The number of rows fetched at once
+    :return: An async iterator of row batches with the columns of ContactBase
+    :doc-author: OSA
+    """
+    query = select(*EXPORT_COLUMNS).filter(Contact.user_id == user.id).order_by(Contact.id)
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    async for partition in result.partitions():
+        yield partition
+
+
+def birthday_window(today: date, days: int) -> ColumnElement[bool]:
+    """
+    The birthday_window function builds the SQL condition on Contact.birth_md for the birthdays
+    between today and today + days, both included.
+    A window that crosses New Year becomes two ranges, and people born on 29 February
+    celebrate on 28 February in years that are not leap years.
+
+    :param today: date: The first day of the window
+    :param days: int: The number of days to look ahead
+    :return: A condition for the where clause of a contacts query
+    :doc-author: OSA
+    """
+    if days >= 365:
+        return Contact.birth_md.isnot(None)
+    end_date = today + timedelta(days=days)
+    start_md, end_md = birth_month_day(today), birth_month_day(end_date)
+    if today.year == end_date.year:
+        condition = Contact.birth_md.between(start_md, end_md)
+    else:
+        condition = or_(Contact.birth_md >= start_md, Contact.birth_md <= end_md)
+    for year in {today.year, end_date.year}:
+        if not isleap(year) and today <= date(year, 2, 28) <= end_date:
+            condition = or_(condition, Contact.birth_md == birth_month_day(date(2000, 2, 29)))
+    return condition
+
 
-async def find_contacts_bday(days, user: User, db: Session) -> List[Contact]:
+@track_queries
+async def find_contacts_bday(days, user: User, db: AsyncSession, today: date | None = None) -> List[Contact]:
     """
     The find_contacts_bday function takes in a number of days and returns all contacts whose birthdays fall within that range.
+    The filtering happens in the database on the indexed (user_id, birth_md) pair, the closest birthdays come first.
     Args:
     days (int): The number of days to look ahead for upcoming birthdays.
     user (User): The User object associated with the current session. This is used to filter out contacts belonging to other users.
-    db (Session): A database Session object, which is used by SQLAlchemy's ORM methods for querying the database and retrieving results.
+    db (AsyncSession): A database Session object, which is used by SQLAlchemy's ORM methods for querying the database and retrieving results.
 
     :param days: Specify the number of days to look ahead for birthdays
     :param user: User: Get the user_id from the user object
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param today: date | None: The first day of the window, today by default
     :return: A list of contacts whose birthday is within a given number of days
     :doc-author: OSA
     """
-    date_now = datetime.now().date()
-    delta = days
-    end_date = date_now + timedelta(days=delta)
-    bdays_list = []
-    all_contacts = db.query(Contact).filter(Contact.user_id==user.id).all()
-    for contact in all_contacts:
-        contact_bday_this_year = contact.date_of_birth.replace(year=date_now.year)
-        # print(date_now, contact_bday_this_year, end_date, sep='\n')
-        if date_now <= contact_bday_this_year <= end_date:
-            bdays_list.append(contact)
-    return bdays_list
+    if days < 0:
+        return []
+    today = today or datetime.now().date()
+    start_md = birth_month_day(today)
+    query = (
+        select(Contact)
+        .filter(Contact.user_id == user.id, birthday_window(today, days))
+        .order_by(case((Contact.birth_md >= start_md, 0), else_=1), Contact.birth_md)
+    )
+    result = await db.execute(query)
+    return result.scalars().all()
 
 
+@track_queries
 async def find_contacts(
-        db: Session,
+        db: AsyncSession,
         user: User,
         firstname: str = None,
         lastname: str = None,
         email: str = None,
-
+        limit: int = 50,
 ) -> List[Contact]:
     """
     The find_contacts function is used to search for contacts in the database.
     It takes a user object, and optional firstname, lastname, and email parameters.
-    The function returns a list of Contact objects that match the search criteria.
-    :param db: Session: Pass the database session to the function
+    The function returns a list of Contact objects that match the search criteria,
+    ranked by trigram similarity and limited to the best matches.
+    On Postgres the ilike filters use the pg_trgm GIN indexes, other databases use the in-process trigram index.
+    :param db: AsyncSession: Pass the database session to the function
     :param user: User: Get the user id from the database
     :param firstname: str: Filter the results by firstname
     :param lastname: str: Filter the contacts by lastname
     :param email: str: Filter the contacts by email
-    :param : Filter the contacts by firstname, lastname and email
-    :return: A list of contacts, which is a list of dictionaries
+    :param limit: int: The maximum number of contacts returned
+    :return: A list of contacts, best matches first
     :doc-author: OSA
     """
-    query = db.query(Contact).filter(Contact.user_id==user.id)
+    terms = {"firstname": firstname, "lastname": lastname, "email": email}
+    terms = {field: term for field, term in terms.items() if term}
+    if db.get_bind().dialect.name != "postgresql":
+        return await _find_contacts_in_index(db, user, terms, limit)
 
-    if firstname:
-        query = query.filter(Contact.firstname.ilike(f"%{firstname}%"))
-    if lastname:
-        query = query.filter(Contact.lastname.ilike(f"%{lastname}%"))
-    if email:
-        query = query.filter(Contact.email.ilike(f"%{email}%"))
+    query = select(Contact).filter(Contact.user_id == user.id)
+    scores = []
+    for field, term in terms.items():
+        column = getattr(Contact, field)
+        query = query.filter(column.ilike(f"%{term}%"))
+        scores.append(func.similarity(column, term))
+    if scores:
+        query = query.order_by(sum(scores[1:], scores[0]).desc())
+    result = await db.execute(query.order_by(Contact.id).limit(limit))
+    return result.scalars().all()
 
-    contact = query.all()
-    return contact
+
+async def _find_contacts_in_index(db: AsyncSession, user: User, terms: dict, limit: int) -> List[Contact]:
+    """
+    The _find_contacts_in_index function searches the in-process trigram index of the user,
+    building it from the database first if it is not cached.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: The owner of the contacts
+    :param terms: dict: The search term of each field
+    :param limit: int: The maximum number of contacts returned
+    :return: A list of contacts, best matches first
+    :doc-author: OSA
+    """
+    index = contact_search_indexes.get(user.id)
+    if index is None:
+        index = TrigramIndex()
+        rows = await db.execute(
+            select(Contact.id, Contact.firstname, Contact.lastname, Contact.email).filter(Contact.user_id == user.id)
+        )
+        for row in rows:
+            index.add(row.id, row._asdict())
+        contact_search_indexes.put(user.id, index)
+    ids = index.search(terms, limit)
+    if not ids:
+        return []
+    result = await db.execute(select(Contact).filter(Contact.user_id == user.id, Contact.id.in_(ids)))
+    contacts = {contact.id: contact for contact in result.scalars().all()}
+    return [contacts[contact_id] for contact_id in ids if contact_id in contacts]
 
 
-async def get_contact(contact_id: int,user: User, db: Session) -> Type[Contact] | None:
+@track_queries
+async def get_contact(contact_id: int,user: User, db: AsyncSession) -> Type[Contact] | None:
     """
     The get_contact function returns a contact from the database.
     Args:
     contact_id (int): The id of the contact to be retrieved.
     user (User): The user who is requesting this information. This is used for authorization purposes, as only contacts belonging to that user can be accessed by them.
-    db (Session): A connection to the database which will allow us to query it and retrieve data from it using SQLAlchemy's ORM methods and classes such as Contact, User, etc...
+    db (AsyncSession): A connection to the database which will allow us to query it and retrieve data from it using SQLAlchemy's ORM methods and classes such as Contact, User, etc...
 
     :param contact_id: int: Specify the id of the contact to be retrieved
     :param user: User: Get the user from the database
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The contact with the given id and user
     :doc-author: OSA
     """
-    return db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    result = await db.execute(select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)))
+    return result.scalars().first()
 
 
-async def create_contact(body: ContactBase, user: User, db: Session) -> Contact:
+@track_queries
+async def create_contact(body: ContactBase, user: User, db: AsyncSession) -> Contact:
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactBase: Get the contact information from the request body
     :param user: User: Get the user_id from the logged in user
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The contact that was created
     :doc-author: OSA
     """
@@ -123,33 +228,65 @@ async def create_contact(body: ContactBase, user: User, db: Session) -> Contact:
         user_id=user.id
     )
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await db.refresh(contact)
+    contact_search_indexes.invalidate(user.id)
+    await contact_cache.bump(user.id)
+    await sticky_writes.mark(user.id)
     return contact
 
 
-async def remove_contact(contact_id: int, user: User, db: Session) -> Contact | None:
+@track_queries
+async def create_contacts(bodies: List[ContactBase], user: User, db: AsyncSession) -> int:
+    """
+    The create_contacts function inserts a batch of contacts with a single executemany INSERT and one commit.
+    The ORM validators do not run for bulk inserts, so birth_md is computed here.
+
+    :param bodies: List[ContactBase]: The validated contacts
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Access the database
+    :return: The number of inserted contacts
+    :doc-author: OSA
+    """
+    if not bodies:
+        return 0
+    await db.execute(insert(Contact), [
+        dict(body.dict(), user_id=user.id, birth_md=birth_month_day(body.date_of_birth)) for body in bodies
+    ])
+    await db.commit()
+    contact_search_indexes.invalidate(user.id)
+    await contact_cache.bump(user.id)
+    await sticky_writes.mark(user.id)
+    return len(bodies)
+
+
+@track_queries
+async def remove_contact(contact_id: int, user: User, db: AsyncSession) -> Contact | None:
     """
     The remove_contact function removes a contact from the database.
     Args:
     contact_id (int): The id of the contact to be removed.
     user (User): The user who is removing the contact. This is used to ensure that only contacts belonging to this user are removed, and not other users' contacts by mistake or maliciously.
-    db (Session): A session object for interacting with our database
+    db (AsyncSession): A session object for interacting with our database
 
     :param contact_id: int: Identify the contact to be removed
     :param user: User: Get the user_id from the user object
-    :param db: Session: Pass the database session into the function
+    :param db: AsyncSession: Pass the database session into the function
     :return: The contact that was removed
     :doc-author: OSA
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id==user.id)).first()
+    contact = await get_contact(contact_id, user, db)
     if contact:
-        db.delete(contact)
-        db.commit()
+        await db.delete(contact)
+        await db.commit()
+        contact_search_indexes.invalidate(user.id)
+        await contact_cache.bump(user.id)
+        await sticky_writes.mark(user.id)
     return contact
 
 
-async def update_contact(contact_id: int, user: User, body: ContactUpdate, db: Session) -> Contact | None:
+@track_queries
+async def update_contact(contact_id: int, user: User, body: ContactUpdate, db: AsyncSession) -> Contact | None:
     """
     The update_contact function updates a contact in the database.
     Args:
@@ -160,11 +297,11 @@ async def update_contact(contact_id: int, user: User, body: ContactUpdate, db: S
     :param contact_id: int: Identify the contact to be deleted
     :param user: User: Check if the user is authenticated and authorized to perform this action
     :param body: ContactUpdate: Pass the data from the request body to the function
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The updated contact
     :doc-author: OSA
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id==user.id)).first()
+    contact = await get_contact(contact_id, user, db)
     if contact:
         contact.firstname = body.firstname
         contact.lastname = body.lastname
@@ -173,5 +310,8 @@ async def update_contact(contact_id: int, user: User, body: ContactUpdate, db: S
         contact.date_of_birth = body.date_of_birth
         contact.description = body.description
 
-        db.commit()
+        await db.commit()
+        contact_search_indexes.invalidate(user.id)
+        await contact_cache.bump(user.id)
+        await sticky_writes.mark(user.id)
     return contact
@@ -1,143 +1,200 @@
 from typing import List, Type
 
-from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
-from src.database.db import get_db
+from src.services.banned_ips import banned_ips
+from src.services.metrics import track_queries
+from src.services.refresh_tokens import refresh_store
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
 
 
-
-async def get_user_by_email(email: str, db: Session) -> User:
+@track_queries
+async def get_user_by_email(email: str, db: AsyncSession) -> User:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user associated with that email. If no such user exists,
     it will return None.
 
     :param email: str: Specify the type of parameter that is expected to be passed into the function
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The first user in the database with a given email address
     :doc-author: OSA
     """
-    return db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).filter(User.email == email))
+    return result.scalars().first()
 
 
-async def bun_user_by_id(user_id: int, db: Session) -> Type[User]:
+@track_queries
+async def bun_user_by_id(user_id: int, db: AsyncSession) -> Type[User]:
     """
     The bun_user_by_id function takes in a user_id and db, and returns the banned user.
         It first checks if the user exists, then sets their banned status to True.
-        Finally it commits this change to the database.
+        Finally it commits this change to the database and closes the sessions and access tokens of the user.
 
     :param user_id: int: Specify the user_id of the user we want to bun
-    :param db: Session: Pass in the database session
+    :param db: AsyncSession: Pass in the database session
     :return: A user object if the user exists in the database
     :doc-author: OSA
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if user:
+        was_bunned = user.bunned
         user.bunned = True
-        db.commit()
+        await db.commit()
+        if not was_bunned:
+            await banned_ips.ban(user.ip)
+            await refresh_store.revoke_all(user.email)
+            await token_cache.revoke(user.email)
+        await user_cache.invalidate(user.email)
         return user
 
 
-async def unbun_user_by_id(user_id: int, db: Session) -> Type[User]:
+@track_queries
+async def unbun_user_by_id(user_id: int, db: AsyncSession) -> Type[User]:
     """
     The unban_user_by_id function takes a user_id and db as arguments.
     It then queries the database for a User with that id, and if it finds one, sets its banned attribute to False.
     Finally, it commits the change to the database.
 
     :param user_id: int: Identify the user to be unbanned
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The user object
     :doc-author: OSA
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if user:
+        was_bunned = user.bunned
         user.bunned = False
-        db.commit()
+        await db.commit()
+        if was_bunned:
+            await banned_ips.unban(user.ip)
+        await user_cache.invalidate(user.email)
         return user
 
-def get_user_by_bunned_field() -> List[User]:
+
+@track_queries
+async def get_user_by_bunned_field(db: AsyncSession) -> List[User]:
     """
     The get_user_by_banned_field function returns a list of all users who have been banned.
+    It is called once at startup to fill the in-memory banned ip set.
 
+    :param db: AsyncSession: Pass the database session to the function
     :return: A list of all users who have been banned
     :doc-author: OSA
     """
-    db = next(get_db())
-    return db.query(User).filter(User.bunned == True).all()
+    result = await db.execute(select(User).filter(User.bunned == True))
+    return result.scalars().all()
 
 
-async def create_user(body: UserModel, db: Session, client_ip) -> User:
+@track_queries
+async def create_user(body: UserModel, db: AsyncSession, client_ip) -> User:
     """
     The create_user function creates a new user in the database.
         Args:
             body (UserModel): The UserModel object containing the data to be inserted into the database.
-            db (Session): The SQLAlchemy Session object used to interact with our PostgreSQL database.
+            db (AsyncSession): The SQLAlchemy Session object used to interact with our PostgreSQL database.
 
     :param body: UserModel: Pass the user data to the function
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param client_ip: Store the ip address of the user
     :return: The newly created user
     :doc-author: OSA
     """
-    print(body)
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-
-    except Exception as e:
-        print(e)
-    new_user = User(**body.dict(), avatar=avatar, ip=client_ip)
+    new_user = User(**body.dict(), ip=client_ip)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+@track_queries
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
     The update_token function updates the refresh token for a user.
 
     :param user: User: Identify the user in the database
     :param token: str | None: Update the refresh token in the database
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: Nothing, so it should be annotated as -&gt; none
     :doc-author: OSA
     """
     user.refresh_token = token
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(user.email)
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+@track_queries
+async def update_password(user: User, password: str, db: AsyncSession) -> None:
+    """
+    The update_password function stores a new password hash for a user,
+    e.g. when the hash was made with an outdated bcrypt cost.
+
+    :param user: User: Identify the user in the database
+    :param password: str: The new password hash
+    :param db: AsyncSession: Access the database
+    :return: Nothing
+    :doc-author: OSA
+    """
+    user.password = password
+    await db.commit()
+    await user_cache.invalidate(user.email)
+
+
+@track_queries
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function takes in an email and a database session,
     and sets the confirmed field of the user with that email to True.
 
 
     :param email: str: Get the email of the user
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: Nothing
     :doc-author: OSA
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+@track_queries
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     """
     The update_avatar function updates the avatar of a user.
 
     :param email: Find the user in the database
     :param url: str: Specify the type of data that is being passed into the function
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The updated user object
     :doc-author: OSA
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
     return user
+
+
+@track_queries
+async def set_default_avatar(email: str, url: str, db: AsyncSession) -> bool:
+    """
+    The set_default_avatar function sets the avatar of a user who has none, e.g. to their Gravatar image.
+    An avatar uploaded in the meantime is never overwritten.
+
+    :param email: str: Find the user in the database
+    :param url: str: The url of the avatar
+    :param db: AsyncSession: Pass the database session to the function
+    :return: True if the avatar was set
+    :doc-author: OSA
+    """
+    result = await db.execute(update(User).where(User.email == email, User.avatar.is_(None)).values(avatar=url))
+    await db.commit()
+    if not result.rowcount:
+        return False
+    await user_cache.invalidate(email)
+    return True
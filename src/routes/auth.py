@@ -1,18 +1,20 @@
 from typing import List
 
-import cloudinary
-import cloudinary.uploader
 from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request, UploadFile, File
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.config.config import settings
 from src.database.db import get_db
 from src.database.models import User
-from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail, UserDb
+from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail, UserDb, AvatarJob, SessionModel
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.avatars import avatar_pipeline, check_image
 from src.services.email_service import send_email
+from src.services.gravatar import gravatar
+from src.services.refresh_tokens import refresh_store
+from src.services.token_cache import token_cache
 
 
 router = APIRouter(prefix='/auth', tags=["Authentication"])
@@ -20,14 +22,14 @@ security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
 
     :param body: UserModel: Get the user's email and password from the request body
     :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the client's ip address
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dictionary with the user and a detail message
     :doc-author: OSA
     """
@@ -40,22 +42,25 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
         client_ip = request.client.host
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db, client_ip)
     background_tasks.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+    background_tasks.add_task(gravatar.fill_avatar, new_user.email)
 
     return {"user": new_user, "detail": "User successfully created"}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(request: Request, body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
     It takes the username and password from the request body,
     verifies them against the database, and returns an access token if successful.
+    Every login opens a new session, so each device keeps its own refresh token.
 
+    :param request: Request: Get the User-Agent of the device
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A token, which is a string
     :doc-author: OSA
     """
@@ -64,43 +69,92 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash:
+        await repository_users.update_password(user, new_hash, db)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    sid, jti = await refresh_store.create(user.email, request.headers.get("user-agent"))
+    access_token = await auth_service.create_access_token(data={"sub": user.email, "sid": sid})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, "sid": sid, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
     The refresh_token function is used to refresh the access token.
     The function takes in a refresh token and returns an access_token, a new refresh_token, and the type of token.
-    If there is no valid user associated with the given email address or if there are any errors during decoding
-    or creating tokens then an HTTPException will be raised.
+    The refresh token is rotated by the refresh token store in one Redis call, without touching the database.
+    A refresh token that was already used closes its session, the client has to log in again.
 
     :param credentials: HTTPAuthorizationCredentials: Get the credentials from the http request
-    :param db: Session: Get the database session
     :return: A dict with the access_token, refresh_token and token type
     :doc-author: OSA
     """
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    claims = await auth_service.decode_refresh_token(credentials.credentials)
+    jti = await refresh_store.rotate(claims["sid"], claims["jti"], claims["sub"])
+    if jti is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
+    email, sid = claims["sub"], claims["sid"]
+    access_token = await auth_service.create_access_token(data={"sub": email, "sid": sid})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, "sid": sid, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: str = Depends(auth_service.oauth2_scheme),
+                 current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The logout function ends the session of the current device.
+    Its refresh token is closed and its access tokens are revoked on all workers, the other devices stay logged in.
+
+    :param token: str: Get the access token of the session
+    :param current_user: User: Get the user that is currently logged in
+    :return: Nothing
+    :doc-author: OSA
+    """
+    sid = auth_service.decode_access_token(token).get("sid")
+    if sid is None:
+        await refresh_store.revoke_all(current_user.email)
+        await token_cache.revoke(current_user.email)
+        return
+    await refresh_store.revoke(sid)
+    await token_cache.revoke(sid)
+
+
+@router.get('/sessions', response_model=List[SessionModel])
+async def read_sessions(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The read_sessions function lists the devices the current user is logged in on.
+
+    :param current_user: User: Get the user that is currently logged in
+    :return: A list of sessions
+    :doc-author: OSA
+    """
+    return await refresh_store.sessions(current_user.email)
+
+
+@router.delete('/sessions/{sid}', status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(sid: str, current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The delete_session function logs the current user out of one of their devices.
+
+    :param sid: str: The id of the session
+    :param current_user: User: Get the user that is currently logged in
+    :return: Nothing
+    :doc-author: OSA
+    """
+    if sid not in {session["sid"] for session in await refresh_store.sessions(current_user.email)}:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    await refresh_store.revoke(sid)
+    await token_cache.revoke(sid)
+
+
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
     It takes the token from the URL and uses it to get the user's email address.
@@ -110,7 +164,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     confirmed_email function which sets the 'confirmed' field of that particular record to
 
     :param token: str: Get the token from the url
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message if the email is already confirmed or when it's confirmed
     :doc-author: OSA
     """
@@ -126,7 +180,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that will allow them
     to confirm their account. The function takes in a RequestEmail object, which contains the email of
@@ -137,7 +191,7 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     :param body: RequestEmail: Get the email from the request body
     :param background_tasks: BackgroundTasks: Add a task to the background queue
     :param request: Request: Get the base_url of the request
-    :param db: Session: Get the database session from the dependency
+    :param db: AsyncSession: Get the database session from the dependency
     :return: A message to the user
     :doc-author: OSA
     """
@@ -152,13 +206,13 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
 
 
 @router.post("/ban/{user_id}")
-async def bun_user_ip_by_id(user_id: int, db: Session = Depends(get_db)):
+async def bun_user_ip_by_id(user_id: int, db: AsyncSession = Depends(get_db)):
     """
     The bun_user_ip_by_id function is used to ban a user by their ID.
     The function takes in the user_id as an argument and returns a message indicating that the user was successfully banned.
 
     :param user_id: int: Get the user_id from the url
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A message that the user was successfully banned
     :doc-author: OSA
     """
@@ -170,13 +224,13 @@ async def bun_user_ip_by_id(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/unban/{user_id}")
-async def unban_user_ip_by_id(user_id: int, db: Session = Depends(get_db)):
+async def unban_user_ip_by_id(user_id: int, db: AsyncSession = Depends(get_db)):
     """
     The unban_user_ip_by_id function is used to unban a user by their ID.
     The function takes in the user_id as an argument and returns a message indicating that the user was successfully unbanned.
 
     :param user_id: int: Get the user id from the url
-    :param db: Session: Pass the database connection to the repository layer
+    :param db: AsyncSession: Pass the database connection to the repository layer
     :return: A message that the user was successfully unbanned
     :doc-author: OSA
     """
@@ -189,42 +243,57 @@ async def unban_user_ip_by_id(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/me/", response_model=UserDb)
-async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
+async def read_users_me(background_tasks: BackgroundTasks, current_user: User = Depends(auth_service.get_current_user)):
     """
     The read_users_me function is a GET endpoint that returns the current user's information.
+    A user without avatar gets their Gravatar image in the background, if they have one.
 
+    :param background_tasks: BackgroundTasks: Look up the Gravatar image after the response
     :param current_user: User: Get the current user
     :return: A user object
     :doc-author: OSA
     """
+    if current_user.avatar is None:
+        background_tasks.add_task(gravatar.fill_avatar, current_user.email)
     return current_user
 
 
-@router.patch('/avatar', response_model=UserDb)
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+@router.patch('/avatar', response_model=AvatarJob, status_code=status.HTTP_202_ACCEPTED)
+async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user)):
     """
     The update_avatar_user function is used to update the avatar of a user.
-    The function takes in an UploadFile object, which contains the file that will be uploaded to Cloudinary.
-    It also takes in a User object, which is obtained from auth_service.get_current_user(). This ensures that only
-    authenticated users can access this endpoint and change their own avatars (and not anyone else's). Finally, it
-    takes in a Session object for database access.
+    The function takes in an UploadFile object, which contains the image of the new avatar.
+    It checks that the file is an image no larger than the avatar_max_bytes setting and queues a job
+    that resizes it to a 250x250 WebP and uploads it to the avatar storage, then answers right away.
+    The avatar of the user changes when the job is done, see GET /api/auth/avatar/jobs/{job_id}.
 
     :param file: UploadFile: Get the file from the request
     :param current_user: User: Get the user that is currently logged in
-    :param db: Session: Access the database
-    :return: The updated user object
+    :return: The id and the status of the avatar job
+    :doc-author: OSA
+    """
+    data = await file.read(settings.avatar_max_bytes + 1)
+    if len(data) > settings.avatar_max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="The image is too large")
+    try:
+        check_image(data, settings.avatar_max_pixels)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(error))
+    job_id = await avatar_pipeline.submit(current_user.email, f'Users/{current_user.username}', data)
+    return AvatarJob(job_id=job_id, status="pending")
+
+
+@router.get('/avatar/jobs/{job_id}', response_model=AvatarJob)
+async def read_avatar_job(job_id: str, current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The read_avatar_job function returns the status of an avatar job: pending, done with the new url, or failed.
+
+    :param job_id: str: The id returned by PATCH /api/auth/avatar
+    :param current_user: User: Get the user that is currently logged in
+    :return: The status of the job
     :doc-author: OSA
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'Users/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'Users/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
-    user = await repository_users.update_avatar(current_user.email, src_url, db)
-    return user
+    job = await avatar_pipeline.status(job_id)
+    if job is None or job["email"] != current_user.email:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return AvatarJob(job_id=job_id, **job)
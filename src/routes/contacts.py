@@ -1,35 +1,107 @@
-from typing import List
+import json
+from datetime import date
+from typing import Any, Awaitable, Callable, List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Query
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Request, Response, UploadFile, File
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import parse_obj_as
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, route_reads
 from src.database.models import Contact, User
-from src.schemas import ContactBase, ContactResponse, ContactUpdate
+from src.schemas import ContactBase, ContactResponse, ContactUpdate, ContactImportResponse
 from src.repository import contacts as repository_contacts
 from src.services.auth import auth_service
+from src.services.contact_cache import contact_cache, etag_matches
+from src.services.pagination import encode_cursor, decode_cursor
+from src.services.rate_limit import RateLimit
+from src.services.contacts_export import EXPORT_FORMATS, export_contacts as export_contacts_stream
+from src.services.contacts_import import detect_format, import_contacts as import_contacts_file
 
 router = APIRouter(prefix='/contacts', tags=["Contacts"])
 
 
+async def get_read_db(user: User = Depends(auth_service.get_current_user),
+                      db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """
+    The get_read_db function is the session of the read-only routes: its SELECTs may go to a read replica.
+    It is the same session as get_db within a request, the user is looked up on the primary.
+
+    :param user: User: The current user, whose recent writes keep the reads on the primary
+    :param db: AsyncSession: The session of the request
+    :return: The session
+    :doc-author: OSA
+    """
+    return await route_reads(db, user.id)
+
+
+async def cached_read(request: Request, user: User, request_key: str,
+                      load: Callable[[], Awaitable[tuple[Any, dict]]], model: Any) -> Response:
+    """
+    The cached_read function answers a contact read from the version of the user's contacts when it can.
+    A matching If-None-Match gets a 304 and a body cached in Redis is sent as is, both without touching the database.
+    Otherwise load runs the query and the serialized body is cached for the next requests.
+
+    :param request: Request: Get the If-None-Match header
+    :param user: User: The current user
+    :param request_key: str: What identifies the response besides the user
+    :param load: Callable: Runs the query, returns the data and the extra headers, or raises an HTTPException
+    :param model: Any: The response model of the data
+    :return: The response
+    :doc-author: OSA
+    """
+    version = await contact_cache.version(user.id)
+    etag = contact_cache.etag(user.id, version, request_key)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    cached = await contact_cache.get(user.id, version, request_key)
+    if cached is None:
+        data, extra = await load()
+        body = json.dumps(jsonable_encoder(parse_obj_as(model, data)), ensure_ascii=False,
+                          separators=(",", ":")).encode()
+        await contact_cache.put(user.id, version, request_key, body, extra)
+        cached = body, extra
+    body, extra = cached
+    return Response(content=body, media_type="application/json", headers={**headers, **extra})
+
+
 @router.get(
     "/", response_model=List[ContactResponse],
     description='No more than 5 requests per minute',
-    dependencies=[Depends(RateLimiter(times=20, seconds=60))])
-async def read_contacts(skip: int = 0, limit: int = 100, user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+    dependencies=[Depends(RateLimit(times=20, seconds=60))])
+async def read_contacts(request: Request, skip: int = 0, limit: int = 100, cursor: str = Query(None),
+                        user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_read_db)):
     """
     The read_contacts function returns a list of contacts.
+    When the page is full, the X-Next-Cursor header carries the cursor of the next page.
+    Passing it back as cursor switches to keyset pagination, skip is then ignored.
+    The page carries an ETag, see cached_read.
 
+    :param request: Request: Get the If-None-Match header
     :param skip: int: Skip the first n contacts
     :param limit: int: Limit the number of contacts returned
+    :param cursor: str: The X-Next-Cursor value of the previous page
     :param user: User: Get the current user
-    :param db: Session: Pass in the database session
+    :param db: AsyncSession: Pass in the database session
     :return: A list of contacts
     :doc-author: OSA
     """
-    contacts = await repository_contacts.get_contacts(skip, limit, user, db)
-    return contacts
+    after_id = None
+    if cursor:
+        try:
+            after_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    async def load():
+        contacts = await repository_contacts.get_contacts(skip, limit, user, db, after_id=after_id)
+        if contacts and len(contacts) == limit:
+            return contacts, {"X-Next-Cursor": encode_cursor(contacts[-1].id)}
+        return contacts, {}
+
+    return await cached_read(request, user, f"list:{skip}:{limit}:{after_id}", load, List[ContactResponse])
 
 
 @router.get("/find", response_model=List[ContactResponse])
@@ -37,8 +109,9 @@ async def find_contacts(
     firstname: str = Query(None),
     lastname: str = Query(None),
     email: str = Query(None),
+    limit: int = Query(50, ge=1, le=500),
     user: User = Depends(auth_service.get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ) -> List[Contact]:
     """
     The find_contacts function is used to find contacts in the database.
@@ -48,70 +121,126 @@ async def find_contacts(
     :param firstname: str: Filter the contacts by firstname
     :param lastname: str: Filter the contacts by lastname
     :param email: str: Search for a contact by email
+    :param limit: int: The maximum number of contacts returned, best matches first
     :param user: User: Get the user from the token
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :param : Get the current user from the database
     :return: A list of contacts, so we need to define a contact schema
     :doc-author: OSA
     """
-    contacts = await repository_contacts.find_contacts(db, user, firstname, lastname, email)
+    contacts = await repository_contacts.find_contacts(db, user, firstname, lastname, email, limit)
     if contacts is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
     return contacts
 
 
 @router.get("/bday_soon", response_model=List[ContactResponse])
-async def find_bday_contacts(days: int, user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+async def find_bday_contacts(request: Request, days: int, user: User = Depends(auth_service.get_current_user),
+                             db: AsyncSession = Depends(get_read_db)):
 
     """
     The find_bday_contacts function returns a list of contacts whose birthday is within the next X days.
     The function takes in an integer value for the number of days and returns a list of contact objects.
+    The list carries an ETag, see cached_read; it also changes with the date.
+    :param request: Request: Get the If-None-Match header
     :param days: int: Specify the number of days in which a contact's birthday falls
     :param user: User: Get the current user
-    :param db: Session: Get the database session from the dependency
+    :param db: AsyncSession: Get the database session from the dependency
     :return: A list of contacts that have their birthday in the next 'days' days
     :doc-author: OSA
     """
-    contacts = await repository_contacts.find_contacts_bday(days,user, db)
-    if contacts is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contacts
+
+    async def load():
+        contacts = await repository_contacts.find_contacts_bday(days, user, db)
+        if contacts is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+        return contacts, {}
+
+    return await cached_read(request, user, f"bday:{days}:{date.today()}", load, List[ContactResponse])
+
+
+@router.get("/export", response_class=StreamingResponse, description='No more than 2 requests per minute',
+            dependencies=[Depends(RateLimit(times=2, seconds=60))])
+async def export_contacts(format: str = Query("csv", regex="^(csv|ndjson|vcard)$"),
+                          user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    The export_contacts function downloads the whole address book of the user as CSV, NDJSON or vCard.
+    The contacts are read through a server-side cursor and streamed batch by batch,
+    so the memory used does not depend on the number of contacts.
+    :param format: str: csv, ndjson or vcard
+    :param user: User: Get the current user
+    :param db: AsyncSession: Access the database
+    :return: A streaming response with the contacts
+    :doc-author: OSA
+    """
+    _, media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(export_contacts_stream(format, user, db), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{extension}"'})
+
+
+@router.post("/import", response_model=ContactImportResponse, description='No more than 2 requests per minute',
+             dependencies=[Depends(RateLimit(times=2, seconds=60))])
+async def import_contacts(file: UploadFile = File(), format: str = Query(None, regex="^(csv|ndjson)$"),
+                          user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    The import_contacts function creates contacts from a CSV file with a header row or from an NDJSON file.
+    The rows are streamed from the upload, validated like the body of create_contact and inserted in batches.
+    Invalid rows are skipped and reported with their row number.
+    :param file: UploadFile: The CSV or NDJSON file
+    :param format: str: csv or ndjson, guessed from the file name or the content type when omitted
+    :param user: User: Get the current user
+    :param db: AsyncSession: Access the database
+    :return: The number of imported and rejected rows with the first errors
+    :doc-author: OSA
+    """
+    fmt = format or detect_format(file.filename, file.content_type)
+    if fmt is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Upload a .csv or .ndjson file or pass the format parameter")
+    return await import_contacts_file(file.file, fmt, user, db)
 
 
 @router.get("/{contact_id}", response_model=ContactResponse)
-async def read_contact(contact_id: int, user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+async def read_contact(request: Request, contact_id: int, user: User = Depends(auth_service.get_current_user),
+                       db: AsyncSession = Depends(get_read_db)):
     """
     The read_contact function is used to retrieve a single contact from the database.
     It takes in an integer representing the ID of the contact, and returns a Contact object.
+    The contact carries an ETag, see cached_read.
+    :param request: Request: Get the If-None-Match header
     :param contact_id: int: Specify the contact id to retrieve
     :param user: User: Get the current user from the auth_service
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contact object
     :doc-author: OSA
     """
-    contact = await repository_contacts.get_contact(contact_id, user, db)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+
+    async def load():
+        contact = await repository_contacts.get_contact(contact_id, user, db)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+        return contact, {}
+
+    return await cached_read(request, user, f"contact:{contact_id}", load, ContactResponse)
 
 
-@router.post("/", response_model=ContactResponse, description='No more than 2 requests per minute', dependencies=[Depends(RateLimiter(times=2, seconds=60))])
-async def create_contact(body: ContactBase, user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+@router.post("/", response_model=ContactResponse, description='No more than 2 requests per minute', dependencies=[Depends(RateLimit(times=2, seconds=60))])
+async def create_contact(body: ContactBase, user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     The create_contact function creates a new contact in the database.
     The function takes a ContactBase object as input, which is validated by pydantic.
     The user who created the contact is also passed to the function and stored in the database.
     :param body: ContactBase: Get the body of the request
     :param user: User: Get the user from the auth_service
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A contactbase object, which is the same as the input body
     :doc-author: OSA
     """
     return await repository_contacts.create_contact(body, user, db)
 
 
-@router.put("/{contact_id}", response_model=ContactResponse, description='No more than 2 requests per minute', dependencies=[Depends(RateLimiter(times=2, seconds=60))])
-async def update_contact(body: ContactUpdate, contact_id: int, user: User = Depends(auth_service.get_current_user),db: Session = Depends(get_db)):
+@router.put("/{contact_id}", response_model=ContactResponse, description='No more than 2 requests per minute', dependencies=[Depends(RateLimit(times=2, seconds=60))])
+async def update_contact(body: ContactUpdate, contact_id: int, user: User = Depends(auth_service.get_current_user),db: AsyncSession = Depends(get_db)):
     """
     The update_contact function updates a contact in the database.
     The function takes an id, and a body containing the updated information for that contact.
@@ -119,7 +248,7 @@ async def update_contact(body: ContactUpdate, contact_id: int, user: User = Depe
     :param body: ContactUpdate: Pass the contact details to be updated
     :param contact_id: int: Identify the contact that will be deleted
     :param user: User: Get the current user from the auth_service
-    :param db: Session: Pass the database session to the repository
+    :param db: AsyncSession: Pass the database session to the repository
     :return: A contact update object
     :doc-author: OSA
     """
@@ -130,12 +259,12 @@ async def update_contact(body: ContactUpdate, contact_id: int, user: User = Depe
 
 
 @router.delete("/{contact_id}", response_model=ContactResponse)
-async def remove_contact(contact_id: int, user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+async def remove_contact(contact_id: int, user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
     """
     The remove_contact function removes a contact from the database.
     :param contact_id: int: Specify the id of the contact to be removed
     :param user: User: Get the user object from the auth_service
-    :param db: Session: Pass the database session to the repository layer
+    :param db: AsyncSession: Pass the database session to the repository layer
     :return: A contact object, which is the contact that was removed
     :doc-author: OSA
     """
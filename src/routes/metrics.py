@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Gauge, generate_latest
+
+from src.database.db import pool_monitor
+from src.services.metrics import CounterCollector, HistogramCollector
+from src.services.password_pool import password_pool
+from src.services.user_cache import user_cache
+
+
+router = APIRouter(tags=["Metrics"])
+
+REGISTRY.register(HistogramCollector("db_pool_checkout_wait_seconds", "Time waited for a database connection.",
+                                     pool_monitor.wait_histogram))
+db_pool_connections = Gauge("db_pool_connections", "Connections of the database pool, by state.", ("state",))
+for state in ("checked_out", "idle", "overflow"):
+    db_pool_connections.labels(state).set_function(lambda state=state: pool_monitor.stats().get(state, 0))
+REGISTRY.register(CounterCollector("db_pool_leaked", "Connections held longer than the leak threshold.",
+                                   lambda: pool_monitor.leaked))
+
+bcrypt_pool_jobs = Gauge("bcrypt_pool_jobs", "Jobs of the bcrypt pool, by state.", ("state",))
+bcrypt_pool_jobs.labels("active").set_function(lambda: password_pool.active)
+bcrypt_pool_jobs.labels("queued").set_function(lambda: password_pool.queued)
+Gauge("bcrypt_pool_workers", "Threads of the bcrypt pool.").set_function(lambda: password_pool.workers)
+Gauge("bcrypt_pool_saturation", "Share of the bcrypt threads and queue in use.").set_function(
+    lambda: (password_pool.active + password_pool.queued) / (password_pool.workers + password_pool.max_queue))
+REGISTRY.register(CounterCollector("bcrypt_pool_rejected", "Jobs rejected because the bcrypt queue was full.",
+                                   lambda: password_pool.rejected))
+
+REGISTRY.register(CounterCollector("user_cache_requests", "Lookups of the user cache, by the tier that answered "
+                                   "(local or redis) or miss when the user was loaded from the database.",
+                                   lambda: {("local",): user_cache.hits, ("redis",): user_cache.redis_hits,
+                                            ("miss",): user_cache.misses}, ("result",)))
+Gauge("user_cache_size", "Users in the local tier of the user cache.").set_function(
+    lambda: user_cache.stats()["size"])
+
+
+@router.get('/metrics', include_in_schema=False)
+async def metrics():
+    """
+    The metrics function exposes the metrics of this worker in the Prometheus text format:
+    request latency by route template, queries by repository function, Redis command and rate limiter timings,
+    database pool waits, bcrypt pool saturation and user cache hits.
+
+    :return: The exposition text
+    :doc-author: OSA
+    """
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
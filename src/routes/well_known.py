@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Request, Response, status
+
+from src.config.config import settings
+from src.services.signing_keys import key_ring
+
+
+router = APIRouter(prefix='/.well-known', tags=["Keys"])
+
+
+@router.get('/jwks.json')
+async def jwks(request: Request):
+    """
+    The jwks function publishes the public keys that sign the tokens, so other services can verify them locally.
+    The body is serialized once per key reload and may be cached by clients and proxies for jwks_max_age seconds;
+    a client sending the current ETag gets a 304.
+
+    :param request: Request: Get the If-None-Match header
+    :return: The JSON Web Key Set
+    :doc-author: OSA
+    """
+    headers = {"Cache-Control": f"public, max-age={settings.jwks_max_age}", "ETag": key_ring.etag}
+    if request.headers.get("if-none-match") == key_ring.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=key_ring.jwks(), media_type="application/json", headers=headers)
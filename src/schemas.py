@@ -1,4 +1,5 @@
 from datetime import date, datetime
+from typing import List, Optional
 # from typing import List, Optional
 #
 # import pydantic
@@ -46,6 +47,32 @@ class ContactUpdate(ContactBase):
     description: str = Field(max_length=150)
 
 
+class ContactImportError(BaseModel):
+    """
+    Represents a row of an import that was rejected.
+
+    Attributes:
+        row (int): The number of the row in the uploaded file, starting at 1.
+        errors (List[str]): The validation errors of the row.
+    """
+    row: int
+    errors: List[str]
+
+
+class ContactImportResponse(BaseModel):
+    """
+    Represents the result of a bulk import.
+
+    Attributes:
+        imported (int): The number of created contacts.
+        failed (int): The number of rejected rows.
+        errors (List[ContactImportError]): The first rejected rows, capped by the import_max_errors setting.
+    """
+    imported: int = 0
+    failed: int = 0
+    errors: List[ContactImportError] = []
+
+
 class ContactResponse(ContactBase):
     """
     Represents the model for a contact response.
@@ -99,7 +126,7 @@ class UserDb(BaseModel):
        username (str): The username of the user.
        email (str): The email address of the user.
        created_at (datetime): The timestamp when the user was created.
-       avatar (str): The URL or path to the user's avatar.
+       avatar (Optional[str]): The URL or path to the user's avatar, None until one is uploaded or found on Gravatar.
 
    Config:
        orm_mode (bool): Indicates that the model is used in ORM mode for database operations.
@@ -108,12 +135,44 @@ class UserDb(BaseModel):
     username: str
     email: str
     created_at: datetime
-    avatar: str
+    avatar: Optional[str]
 
     class Config:
         orm_mode = True
 
 
+class AvatarJob(BaseModel):
+    """
+    Represents the status of an avatar upload processed in the background.
+
+    Attributes:
+        job_id (str): The id of the job, used to poll its status.
+        status (str): pending, done or failed.
+        url (str): The url of the new avatar once the job is done.
+        detail (str): The reason of the failure of a failed job.
+    """
+    job_id: str
+    status: str
+    url: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class SessionModel(BaseModel):
+    """
+    Represents a session, i.e. a device the user is logged in on.
+
+    Attributes:
+        sid (str): The id of the session.
+        device (str): The User-Agent of the device at login.
+        created_at (datetime): When the user logged in.
+        used_at (datetime): When the refresh token of the session was last used.
+    """
+    sid: str
+    device: str
+    created_at: datetime
+    used_at: datetime
+
+
 class UserResponse(BaseModel):
     """
     Represents the response model for a user.
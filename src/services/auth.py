@@ -1,15 +1,22 @@
 from typing import Optional
 
-from jose import JWTError, jwt
+from jose import JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.repository import users as repository_users
 from src.config.config import settings
+from src.logger import get_logger
+from src.services.password_pool import password_pool
+from src.services.signing_keys import key_ring
+from src.services.token_cache import token_cache
+from src.services.user_cache import user_cache
+
+logger = get_logger(__name__)
 
 
 class Auth:
@@ -17,23 +24,28 @@ class Auth:
     Handles authentication-related operations and configurations.
 
     Attributes:
-    pwd_context (CryptContext): The password hashing context using the bcrypt algorithm.
-    SECRET_KEY (str): The secret key used for authentication and token signing.
+    pwd_context (CryptContext): The password hashing context using the bcrypt algorithm with the configured cost.
+    SECRET_KEY (str): The secret key used for token signing with a symmetric (HS*) algorithm.
     ALGORITHM (str): The algorithm used for token encoding and decoding.
+    The tokens are signed and verified by the key ring, with the active private key for RS*/ES* algorithms.
     oauth2_scheme (OAuth2PasswordBearer): The OAuth2 password bearer scheme for token authentication.
 
     Methods:
     verify_password(plain_password: str, hashed_password: str) -> bool:
     Verify if a plain password matches a hashed password.
+    verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    Verify a password and rehash it when its cost is outdated.
     get_password_hash(password: str) -> str:
     Generate a password hash from a plain password.
     create_access_token(data: dict, expires_delta: Optional[float] = None) -> str:
     Generate a new access token.
     create_refresh_token(data: dict, expires_delta: Optional[float] = None) -> str:
     Generate a new refresh token.
-    decode_refresh_token(refresh_token: str) -> str:
-    Decode and validate a refresh token, returning the email associated with it.
-    get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    decode_refresh_token(refresh_token: str) -> dict:
+    Decode and validate a refresh token, returning its claims.
+    decode_access_token(token: str) -> dict:
+    Verify an access token, or take its claims from the token cache.
+    get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
     Get the current authenticated user based on the provided access token.
     create_email_token(data: dict) -> str:
     Generate an email token for email verification.
@@ -41,16 +53,16 @@ class Auth:
     Get the email from an email token.
     """
 
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
         password as arguments. It then uses the pwd_context object to verify that the
-        plain-text password matches the hashed one.
+        plain-text password matches the hashed one. The check runs in the bcrypt pool.
 
         :param self: Make the function a method of the user class
         :param plain_password: Pass in the password that is entered by the user
@@ -58,19 +70,36 @@ class Auth:
         :return: A boolean value
         :doc-author: OSA
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await password_pool.run(self.pwd_context.verify, plain_password, hashed_password)
+
+    async def verify_and_update_password(self, plain_password: str, hashed_password: str):
+        """
+        The verify_and_update_password function verifies a password and, when pwd_context.needs_update
+        says the stored hash uses an outdated cost, hashes the password again with the current one.
 
-    def get_password_hash(self, password: str):
+        :param self: Represent the instance of the class
+        :param plain_password: str: Pass in the password that is entered by the user
+        :param hashed_password: str: The hashed password stored in our database
+        :return: A tuple of the verification result and the new hash or None
+        :doc-author: OSA
+        """
+        if not await self.verify_password(plain_password, hashed_password):
+            return False, None
+        if self.pwd_context.needs_update(hashed_password):
+            return True, await self.get_password_hash(plain_password)
+        return True, None
+
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
-        The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
+        The hash is generated using the pwd_context object in the bcrypt pool.
 
         :param self: Refer to the object itself
         :param password: str: Pass the password to be hashed
         :return: A hash of the password
         :doc-author: OSA
         """
-        return self.pwd_context.hash(password)
+        return await password_pool.run(self.pwd_context.hash, password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -79,7 +108,7 @@ class Auth:
         Args:
         data (dict): A dictionary containing the claims to be encoded in the JWT.
         expires_delta (Optional[float]): An optional parameter specifying how long, in seconds,
-        the access token should last before expiring. If not specified, it defaults to 15 minutes.
+        the access token should last before expiring. If not specified, it defaults to the access_token_expire_minutes setting.
 
         :param self: Refer to the class itself
         :param data: dict: Pass the data that will be encoded into the jwt
@@ -91,9 +120,9 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
+            expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_access_token = key_ring.encode(to_encode)
         return encoded_access_token
 
     # define a function to generate a new refresh token
@@ -101,7 +130,7 @@ class Auth:
         """
         The create_refresh_token function creates a refresh token for the user.
         Args:
-        data (dict): A dictionary containing the user's id and username.
+        data (dict): A dictionary containing the user's email (sub), the session id (sid) and the token id (jti).
         expires_delta (Optional[float]): The number of seconds until the token expires, defaults to None.
 
         :param self: Represent the instance of the class
@@ -114,42 +143,65 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_refresh_token = key_ring.encode(to_encode)
         return encoded_refresh_token
 
     async def decode_refresh_token(self, refresh_token: str):
         """
         The decode_refresh_token function is used to decode the refresh token.
-        It takes a refresh_token as an argument and returns the email of the user if it's valid.
+        It takes a refresh_token as an argument and returns its claims if it's valid.
         If not, it raises an HTTPException with status code 401 (UNAUTHORIZED) and detail 'Could not validate credentials'.
+        Whether the token is still the current one of its session is checked by the refresh token store.
 
 
         :param self: Represent the instance of a class
         :param refresh_token: str: Pass in the refresh token that is sent from the client
-        :return: The email of the user who is trying to access a protected endpoint
+        :return: The claims of the token, with the email (sub), the session id (sid) and the token id (jti)
         :doc-author: OSA
         """
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+            payload = key_ring.decode(refresh_token)
+            if payload.get('scope') == 'refresh_token' and all(payload.get(claim) for claim in ("sub", "sid", "jti")):
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    def decode_access_token(self, token: str) -> dict:
+        """
+        The decode_access_token function returns the claims of a valid access token.
+        The signature of a token is verified the first time it is seen, then its claims come from the token cache
+        until it expires. Tokens revoked by a ban or a logout are rejected either way.
+
+        :param self: Represent the instance of a class
+        :param token: str: The encoded access token
+        :return: The claims of the token
+        :doc-author: OSA
+        """
+        claims = token_cache.get(token)
+        if claims is None:
+            claims = key_ring.decode(token)
+            if claims.get("scope") != "access_token" or claims.get("sub") is None:
+                raise JWTError("Invalid scope for token")
+            token_cache.put(token, claims)
+        if token_cache.is_revoked(claims):
+            raise JWTError("Token revoked")
+        return claims
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
         protected endpoints. It takes a token as an argument and returns the user
         if it's valid, otherwise raises an HTTPException with status code 401.
+        The token is verified once and then served from the token cache,
+        and the user from the user cache when possible, so most requests do not touch the database.
 
         :param self: Represent the instance of a class
         :param token: str: Pass the token to the function
-        :param db: Session: Get the database session
-        :return: The user object from the database
+        :param db: AsyncSession: Get the database session
+        :return: The user object from the cache or the database
         :doc-author: OSA
         """
         credentials_exception = HTTPException(
@@ -159,26 +211,22 @@ class Auth:
         )
 
         try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
+            email = self.decode_access_token(token)["sub"]
+        except JWTError:
             raise credentials_exception
 
-        user = await repository_users.get_user_by_email(email, db)
+        user = await user_cache.get(email)
         if user is None:
-            raise credentials_exception
+            user = await repository_users.get_user_by_email(email, db)
+            if user is None:
+                raise credentials_exception
+            await user_cache.set(user)
         return user
 
     def create_email_token(self, data: dict):
         """
         The create_email_token function takes a dictionary of data and returns a token.
-        The token is created by encoding the data with the SECRET_KEY and ALGORITHM,
+        The token is created by encoding the data with the key ring and ALGORITHM,
         and adding an iat (issued at) timestamp and exp (expiration) timestamp to it.
 
         :param self: Represent the instance of the class
@@ -189,7 +237,7 @@ class Auth:
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=7)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        token = key_ring.encode(to_encode)
         return token
 
     async def get_email_from_token(self, token: str):
@@ -203,11 +251,11 @@ class Auth:
         :doc-author: OSA
         """
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = key_ring.decode(token)
             email = payload["sub"]
             return email
         except JWTError as e:
-            print(e)
+            logger.info(f"Invalid email verification token: {e}")
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
 
@@ -0,0 +1,267 @@
+import asyncio
+import io
+import json
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Protocol
+
+import cloudinary
+import cloudinary.uploader
+from fastapi import HTTPException, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config.config import settings
+from src.database.db import SessionLocal
+from src.repository import users as repository_users
+
+
+def resize_to_webp(data: bytes, size: int) -> bytes:
+    """
+    The resize_to_webp function crops an image to a centered square, resizes it to size x size and encodes it as WebP.
+    It runs in a worker process, so it must stay a module level function.
+
+    :param data: bytes: The uploaded image
+    :param size: int: The width and height of the avatar
+    :return: The WebP image
+    :doc-author: OSA
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        avatar = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        avatar.save(output, format="WEBP", quality=85, method=4)
+    return output.getvalue()
+
+
+def check_image(data: bytes, max_pixels: int) -> None:
+    """
+    The check_image function reads the header of an upload to reject what is not an image, or an image too big to decode,
+    before a job is queued. The pixels are not decoded.
+
+    :param data: bytes: The uploaded file
+    :param max_pixels: int: The maximum width * height
+    :return: Nothing
+    :doc-author: OSA
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as error:
+        raise ValueError("The file is not a supported image") from error
+    if width * height > max_pixels:
+        raise ValueError("The image is too large")
+
+
+class AvatarStorage(Protocol):
+    """
+    A place to store the avatars. save is blocking and is always called in a thread.
+    """
+
+    def save(self, key: str, data: bytes) -> str:
+        """
+        The save function stores a WebP avatar and returns its public url.
+
+        :param key: str: A stable name of the avatar, e.g. Users/andrii
+        :param data: bytes: The WebP image
+        :return: The url of the avatar
+        :doc-author: OSA
+        """
+
+
+class CloudinaryStorage:
+    """
+    Stores the avatars on Cloudinary, where they are served by its CDN.
+    """
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+
+    def save(self, key: str, data: bytes) -> str:
+        result = cloudinary.uploader.upload(io.BytesIO(data), public_id=key, overwrite=True, format="webp")
+        return result["secure_url"]
+
+
+class LocalStorage:
+    """
+    Stores the avatars in a local directory served under base_url, for development and tests.
+    """
+
+    def __init__(self, root: Path, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url
+
+    def save(self, key: str, data: bytes) -> str:
+        path = (self.root / f"{key}.webp").resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Invalid avatar key {key!r}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".tmp")
+        temporary.write_bytes(data)
+        temporary.replace(path)
+        return f"{self.base_url}{key}.webp?v={time.time_ns()}"
+
+
+class AvatarPipeline:
+    """
+    Resizes and stores the uploaded avatars in the background.
+
+    The handler only checks the upload and queues a job: the image is resized in a process pool,
+    stored through the storage backend in a thread and the new url is saved on the user,
+    so the event loop never waits for the CPU work or the network.
+    At most max_pending jobs are in flight, each holding its upload in memory; further uploads are rejected
+    with 503 until some finish.
+
+    Attributes:
+    KEY (str): The prefix of the Redis keys holding the status of the jobs, shared by every worker.
+    pending (int): The number of jobs in flight.
+    rejected (int): The number of uploads rejected because max_pending jobs were in flight.
+
+    Methods:
+    submit(email: str, key: str, data: bytes) -> str:
+    Queue a job and return its id.
+    status(job_id: str) -> dict | None:
+    Return the status of a job.
+    start(redis: Redis) -> None:
+    Share the job statuses through Redis.
+    stop() -> None:
+    Wait for the running jobs and shut the process pool down.
+    """
+
+    KEY = "avatar_job:"
+    STATUS_TTL = 3600
+
+    def __init__(self, storage: AvatarStorage, size: int, workers: int,
+                 session_maker: async_sessionmaker[AsyncSession] = SessionLocal, max_jobs: int = 1024,
+                 max_pending: int = 16):
+        self.storage = storage
+        self.size = size
+        self.workers = workers
+        self.session_maker = session_maker
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._redis: Redis | None = None
+
+    async def _set_status(self, job_id: str, **status) -> None:
+        self._jobs[job_id] = status
+        self._jobs.move_to_end(job_id)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        if self._redis is not None:
+            await self._redis.set(self.KEY + job_id, json.dumps(status), ex=self.STATUS_TTL)
+
+    async def status(self, job_id: str) -> dict | None:
+        """
+        The status function returns the status of a job: pending, done with the url of the avatar, or failed,
+        along with the email of its owner.
+
+        :param job_id: str: The id returned by submit
+        :return: The status, or None for an unknown job
+        :doc-author: OSA
+        """
+        status = self._jobs.get(job_id)
+        if status is None and self._redis is not None:
+            cached = await self._redis.get(self.KEY + job_id)
+            status = json.loads(cached) if cached else None
+        return status
+
+    async def _run(self, job_id: str, email: str, key: str, data: bytes) -> None:
+        """
+        The _run function resizes, stores and saves one avatar and records the outcome of the job.
+
+        :param job_id: str: The id of the job
+        :param email: str: The email of the user
+        :param key: str: The storage key of the avatar
+        :param data: bytes: The uploaded image
+        :return: Nothing
+        :doc-author: OSA
+        """
+        try:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers)
+            loop = asyncio.get_running_loop()
+            avatar = await loop.run_in_executor(self._executor, resize_to_webp, data, self.size)
+            url = await asyncio.to_thread(self.storage.save, key, avatar)
+            async with self.session_maker() as db:
+                await repository_users.update_avatar(email, url, db)
+        except Exception as error:
+            await self._set_status(job_id, email=email, status="failed", detail=str(error) or type(error).__name__)
+            return
+        await self._set_status(job_id, email=email, status="done", url=url)
+
+    async def submit(self, email: str, key: str, data: bytes) -> str:
+        """
+        The submit function queues the processing of an uploaded avatar and returns at once.
+
+        :param email: str: The email of the user
+        :param key: str: The storage key of the avatar
+        :param data: bytes: The uploaded image, already checked with check_image
+        :return: The id of the job
+        :raises HTTPException: 503 when max_pending jobs are already in flight
+        :doc-author: OSA
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many avatar uploads in progress, try again later",
+                                headers={"Retry-After": "5"})
+        self.pending += 1
+        job_id = uuid.uuid4().hex
+        try:
+            await self._set_status(job_id, email=email, status="pending")
+            task = asyncio.create_task(self._run(job_id, email, key, data))
+        except BaseException:
+            self.pending -= 1
+            raise
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        return job_id
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self.pending -= 1
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function stores the job statuses in Redis too, so any worker can report them.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+
+    async def stop(self) -> None:
+        """
+        The stop function waits for the running jobs and shuts the process pool down.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._redis = None
+
+
+def create_storage() -> AvatarStorage:
+    if settings.avatar_storage == "local":
+        return LocalStorage(Path(settings.avatar_local_dir), settings.avatar_local_url)
+    return CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret)
+
+
+avatar_pipeline = AvatarPipeline(create_storage(), settings.avatar_size, settings.avatar_workers,
+                                 max_pending=settings.avatar_max_pending)
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import uuid
+from collections import Counter, defaultdict
+from ipaddress import ip_address, ip_network, IPv4Address, IPv6Address, IPv4Network, IPv6Network
+from typing import Iterable
+
+from redis.asyncio import Redis
+
+
+class BannedIPSet:
+    """
+    Keeps the banned IP addresses and CIDR ranges of the application in memory.
+
+    Attributes:
+    CHANNEL (str): The Redis pub/sub channel used to keep the workers in sync.
+    node_id (str): A unique id of this worker, used to skip its own pub/sub messages.
+
+    Every entry is reference counted, because several banned users can share one address
+    and unbanning one of them must not unban the others.
+
+    Methods:
+    load(values: Iterable[str]) -> None:
+    Replace the whole set, used at startup.
+    is_banned(host: str | None) -> bool:
+    Check an address against the banned addresses and ranges without touching the database.
+    ban(value: str | None) -> None:
+    Add an address or range locally and notify the other workers.
+    unban(value: str | None) -> None:
+    Remove an address or range locally and notify the other workers.
+    start(redis: Redis) -> None:
+    Subscribe to the change notifications of the other workers.
+    stop() -> None:
+    Cancel the subscription.
+    """
+
+    CHANNEL = "banned_ips"
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self._addresses: Counter = Counter()
+        self._networks: dict[tuple[int, int], Counter] = defaultdict(Counter)
+        self._redis: Redis | None = None
+        self._listener: asyncio.Task | None = None
+
+    @staticmethod
+    def _parse(value: str | None) -> IPv4Address | IPv6Address | IPv4Network | IPv6Network | None:
+        """
+        The _parse function turns a stored ip value into an address or a network.
+        Values that are neither (e.g. the default &quot;localhost&quot;) are ignored.
+
+        :param value: str | None: The value of the User.ip column
+        :return: An ip address, an ip network or None
+        :doc-author: OSA
+        """
+        if not value:
+            return None
+        try:
+            return ip_address(value)
+        except ValueError:
+            pass
+        try:
+            network = ip_network(value, strict=False)
+        except ValueError:
+            return None
+        if network.num_addresses == 1:
+            return network.network_address
+        return network
+
+    def _apply(self, op: str, value: str | None) -> None:
+        """
+        The _apply function adds or removes one entry of the set in place.
+
+        :param op: str: Either &quot;ban&quot; or &quot;unban&quot;
+        :param value: str | None: The address or range to change
+        :return: Nothing
+        :doc-author: OSA
+        """
+        entry = self._parse(value)
+        if entry is None:
+            return
+        if isinstance(entry, (IPv4Network, IPv6Network)):
+            counter = self._networks[(entry.version, entry.prefixlen)]
+        else:
+            counter = self._addresses
+        if op == "ban":
+            counter[entry] += 1
+        elif counter[entry] > 1:
+            counter[entry] -= 1
+        else:
+            counter.pop(entry, None)
+            if not counter and counter is not self._addresses:
+                del self._networks[(entry.version, entry.prefixlen)]
+
+    def load(self, values: Iterable[str | None]) -> None:
+        """
+        The load function replaces the content of the set with the given values.
+
+        :param values: Iterable[str | None]: The ip values of all banned users
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._addresses.clear()
+        self._networks.clear()
+        for value in values:
+            self._apply("ban", value)
+
+    def is_banned(self, host: str | None) -> bool:
+        """
+        The is_banned function checks if a client address is banned.
+        Exact addresses are a single dict lookup, ranges cost one lookup per distinct prefix length,
+        so the price of the check does not depend on the number of banned users.
+
+        :param host: str | None: The client address
+        :return: True if the address or one of its ranges is banned
+        :doc-author: OSA
+        """
+        if not host:
+            return False
+        try:
+            ip = ip_address(host)
+        except ValueError:
+            return False
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if ip in self._addresses:
+            return True
+        for version, prefixlen in self._networks:
+            if version == ip.version and ip_network((ip, prefixlen), strict=False) in self._networks[(version, prefixlen)]:
+                return True
+        return False
+
+    async def _publish(self, op: str, value: str | None) -> None:
+        """
+        The _publish function notifies the other workers about a change of the set.
+
+        :param op: str: Either &quot;ban&quot; or &quot;unban&quot;
+        :param value: str | None: The changed address or range
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._redis is None:
+            return
+        await self._redis.publish(self.CHANNEL, json.dumps({"op": op, "ip": value, "node": self.node_id}))
+
+    async def ban(self, value: str | None) -> None:
+        """
+        The ban function adds an address or range to the set and tells the other workers about it.
+
+        :param value: str | None: The address or range to ban
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._apply("ban", value)
+        await self._publish("ban", value)
+
+    async def unban(self, value: str | None) -> None:
+        """
+        The unban function removes an address or range from the set and tells the other workers about it.
+
+        :param value: str | None: The address or range to unban
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._apply("unban", value)
+        await self._publish("unban", value)
+
+    async def _listen(self) -> None:
+        """
+        The _listen function applies the changes published by the other workers.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = json.loads(message["data"])
+                if data.get("node") != self.node_id:
+                    self._apply(data.get("op"), data.get("ip"))
+        finally:
+            await pubsub.unsubscribe(self.CHANNEL)
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function subscribes the set to the Redis channel of the ban changes.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the Redis subscription.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        self._redis = None
+
+
+banned_ips = BannedIPSet()
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import time
+
+from redis.asyncio import Redis
+
+from src.config.config import settings
+
+
+class ContactCache:
+    """
+    Versions the contacts of every user so unchanged contact reads can be answered without the database.
+
+    Every change of a user's contacts bumps the user's version. The ETag of a contact read is derived from
+    the user, the version and the request, so a client repeating a request with If-None-Match gets a 304
+    as long as nothing has changed. With response_cache on, the serialized bodies are also kept in Redis
+    under versioned keys: a bump makes the old entries unreachable and they simply expire.
+
+    The versions are counters in Redis, shared by every worker, seeded with the current time
+    so a lost key never reuses an old version. Until start is called they live in the worker.
+
+    Attributes:
+    KEY (str): The prefix of the Redis keys holding the versions.
+    BODY_KEY (str): The prefix of the Redis keys holding the cached bodies.
+
+    Methods:
+    version(user_id: int) -> int:
+    Return the current version of the contacts of a user.
+    bump(user_id: int) -> None:
+    Invalidate every cached read of the contacts of a user.
+    etag(user_id: int, version: int, request_key: str) -> str:
+    Return the weak ETag of a read.
+    get(user_id: int, version: int, request_key: str) -> tuple[bytes, dict] | None:
+    Return a cached body and its headers.
+    put(user_id: int, version: int, request_key: str, body: bytes, headers: dict) -> None:
+    Cache a body and its headers.
+    start(redis: Redis) -> None:
+    Keep the versions, and the bodies when enabled, in Redis.
+    stop() -> None:
+    Stop using Redis.
+    """
+
+    KEY = "contacts_version:"
+    BODY_KEY = "contacts_body:"
+
+    def __init__(self, response_cache: bool, ttl: int):
+        self.response_cache = response_cache
+        self.ttl = ttl
+        self._versions: dict[int, int] = {}
+        self._redis: Redis | None = None
+
+    async def version(self, user_id: int) -> int:
+        """
+        The version function returns the version of the contacts of a user, one Redis round-trip at most.
+
+        :param user_id: int: The id of the user
+        :return: The version
+        :doc-author: OSA
+        """
+        if self._redis is None:
+            return self._versions.setdefault(user_id, time.time_ns())
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.KEY + str(user_id), time.time_ns(), nx=True)
+            pipe.get(self.KEY + str(user_id))
+            _, version = await pipe.execute()
+        return int(version)
+
+    async def bump(self, user_id: int) -> None:
+        """
+        The bump function changes the version of the contacts of a user after they were created, updated or removed.
+
+        :param user_id: int: The id of the user
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._redis is None:
+            self._versions[user_id] = self._versions.get(user_id, time.time_ns()) + 1
+            return
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(self.KEY + str(user_id), time.time_ns(), nx=True)
+            pipe.incr(self.KEY + str(user_id))
+            await pipe.execute()
+
+    @staticmethod
+    def _digest(user_id: int, version: int, request_key: str) -> str:
+        return hashlib.sha256(f"{user_id}:{version}:{request_key}".encode()).hexdigest()[:32]
+
+    def etag(self, user_id: int, version: int, request_key: str) -> str:
+        """
+        The etag function returns the weak ETag of a contact read.
+
+        :param user_id: int: The id of the user
+        :param version: int: The version of the contacts of the user
+        :param request_key: str: What identifies the response besides the user, e.g. the path and the query
+        :return: The ETag
+        :doc-author: OSA
+        """
+        return f'W/"{self._digest(user_id, version, request_key)}"'
+
+    async def get(self, user_id: int, version: int, request_key: str) -> tuple[bytes, dict] | None:
+        """
+        The get function returns a response body cached for the current version.
+
+        :param user_id: int: The id of the user
+        :param version: int: The version of the contacts of the user
+        :param request_key: str: What identifies the response besides the user
+        :return: The body and the extra headers, or None
+        :doc-author: OSA
+        """
+        if self._redis is None or not self.response_cache:
+            return None
+        cached = await self._redis.get(self.BODY_KEY + self._digest(user_id, version, request_key))
+        if cached is None:
+            return None
+        entry = json.loads(cached)
+        return entry["body"].encode(), entry["headers"]
+
+    async def put(self, user_id: int, version: int, request_key: str, body: bytes, headers: dict) -> None:
+        """
+        The put function caches a response body for ttl seconds.
+
+        :param user_id: int: The id of the user
+        :param version: int: The version the body was read at
+        :param request_key: str: What identifies the response besides the user
+        :param body: bytes: The JSON body
+        :param headers: dict: The extra headers of the response, e.g. X-Next-Cursor
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._redis is None or not self.response_cache:
+            return
+        entry = json.dumps({"body": body.decode(), "headers": headers})
+        await self._redis.set(self.BODY_KEY + self._digest(user_id, version, request_key), entry, ex=self.ttl)
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function keeps the versions, and the bodies when enabled, in Redis.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+
+    async def stop(self) -> None:
+        """
+        The stop function stops using Redis.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = None
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    The etag_matches function compares an If-None-Match header with an ETag, weakly as RFC 9110 requires for GET.
+
+    :param if_none_match: str | None: The header of the request
+    :param etag: str: The current ETag
+    :return: True if the client already has the current response
+    :doc-author: OSA
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+contact_cache = ContactCache(settings.contacts_response_cache, settings.contacts_response_cache_ttl)
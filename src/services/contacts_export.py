@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Callable, List
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+
+FIELDS = ("firstname", "lastname", "phone_number", "email", "date_of_birth", "description")
+
+
+def to_csv(rows: List[Row]) -> str:
+    """
+    The to_csv function formats a batch of contacts as CSV lines in the column order of FIELDS.
+
+    :param rows: List[Row]: The contacts
+    :return: The CSV lines
+    :doc-author: OSA
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def to_ndjson(rows: List[Row]) -> str:
+    """
+    The to_ndjson function formats a batch of contacts as one JSON object per line.
+
+    :param rows: List[Row]: The contacts
+    :return: The NDJSON lines
+    :doc-author: OSA
+    """
+    return "".join(
+        json.dumps(dict(row._mapping, date_of_birth=row.date_of_birth.isoformat()), ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def _vcard_text(value: str | None) -> str:
+    return (value or "").replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;").replace("\n", "\\n")
+
+
+def to_vcard(rows: List[Row]) -> str:
+    """
+    The to_vcard function formats a batch of contacts as vCard 3.0 entries.
+
+    :param rows: List[Row]: The contacts
+    :return: The vCard entries
+    :doc-author: OSA
+    """
+    cards = []
+    for row in rows:
+        first, last = _vcard_text(row.firstname), _vcard_text(row.lastname)
+        cards.append("\r\n".join((
+            "BEGIN:VCARD",
+            "VERSION:3.0",
+            f"N:{last};{first};;;",
+            f"FN:{first} {last}",
+            f"TEL:{_vcard_text(row.phone_number)}",
+            f"EMAIL:{_vcard_text(row.email)}",
+            f"BDAY:{row.date_of_birth.isoformat()}",
+            f"NOTE:{_vcard_text(row.description)}",
+            "END:VCARD",
+            "",
+        )))
+    return "".join(cards)
+
+
+EXPORT_FORMATS: dict[str, tuple[Callable[[List[Row]], str], str, str]] = {
+    "csv": (to_csv, "text/csv; charset=utf-8", "csv"),
+    "ndjson": (to_ndjson, "application/x-ndjson", "ndjson"),
+    "vcard": (to_vcard, "text/vcard; charset=utf-8", "vcf"),
+}
+
+
+async def export_contacts(fmt: str, user: User, db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[str]:
+    """
+    The export_contacts function streams every contact of the user in the given format, one chunk per batch.
+    The CSV export starts with a header row, so it can be imported back with POST /api/contacts/import.
+
+    :param fmt: str: &quot;csv&quot;, &quot;ndjson&quot; or &quot;vcard&quot;
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Access the database
+    :param batch_size: int: The number of contacts per chunk
+    :return: An async iterator of text chunks
+    :doc-author: OSA
+    """
+    formatter = EXPORT_FORMATS[fmt][0]
+    if fmt == "csv":
+        yield to_csv([FIELDS])
+    async for rows in repository_contacts.stream_contacts(user, db, batch_size):
+        yield formatter(rows)
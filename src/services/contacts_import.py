@@ -0,0 +1,142 @@
+import asyncio
+import csv
+import io
+import json
+from typing import BinaryIO, Iterator
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config.config import settings
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactBase, ContactImportError, ContactImportResponse
+
+FORMATS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str | None:
+    """
+    The detect_format function guesses the format of an upload from its file extension, then from its content type.
+
+    :param filename: str | None: The name of the uploaded file
+    :param content_type: str | None: The content type of the uploaded file
+    :return: &quot;csv&quot;, &quot;ndjson&quot; or None when the format is unknown
+    :doc-author: OSA
+    """
+    if filename and "." in filename:
+        found = FORMATS.get(filename[filename.rindex("."):].lower())
+        if found:
+            return found
+    if content_type:
+        return FORMATS.get(content_type.split(";")[0].strip().lower())
+    return None
+
+
+def iter_rows(file: BinaryIO, fmt: str) -> Iterator[tuple[int, dict | str]]:
+    """
+    The iter_rows function decodes the upload one line at a time, so only the current row is held in memory.
+    A row that cannot be parsed is yielded as an error message instead of a dict.
+
+    :param file: BinaryIO: The uploaded file
+    :param fmt: str: &quot;csv&quot; or &quot;ndjson&quot;
+    :return: An iterator of (row number, row or error message)
+    :doc-author: OSA
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(text), start=1):
+                yield number, {key: value for key, value in row.items() if key is not None}
+            return
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield number, f"invalid JSON: {error}"
+                continue
+            yield number, row if isinstance(row, dict) else "a row must be a JSON object"
+    finally:
+        text.detach()
+
+
+def _errors(error: ValidationError) -> list[str]:
+    return [f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()]
+
+
+def _read_batch(rows: Iterator[tuple[int, dict | str]], number: int, batch_size: int,
+                report: ContactImportResponse, max_errors: int) -> tuple[list[ContactBase], int, bool]:
+    """
+    The _read_batch function reads and validates rows until it has batch_size valid ones or the file ends.
+    It decodes and validates synchronously, so import_contacts runs it in a thread, away from the event loop.
+    The rejected rows are counted in the report, the first max_errors with their errors.
+
+    :param rows: Iterator: The rows of iter_rows
+    :param number: int: The number of the last row read
+    :param batch_size: int: The number of valid rows to return at most
+    :param report: ContactImportResponse: The report of the import
+    :param max_errors: int: The maximum number of rejected rows reported
+    :return: The valid contacts, the number of the last row read and whether the file is finished
+    :doc-author: OSA
+    """
+    batch = []
+
+    def reject(number: int, errors: list[str]) -> None:
+        report.failed += 1
+        if len(report.errors) < max_errors:
+            report.errors.append(ContactImportError(row=number, errors=errors))
+
+    while len(batch) < batch_size:
+        try:
+            number, row = next(rows)
+        except StopIteration:
+            return batch, number, True
+        except (UnicodeDecodeError, csv.Error) as error:
+            reject(number + 1, [f"unreadable file: {error}"])
+            return batch, number, True
+        if isinstance(row, str):
+            reject(number, [row])
+            continue
+        try:
+            batch.append(ContactBase(**row))
+        except ValidationError as error:
+            reject(number, _errors(error))
+    return batch, number, False
+
+
+async def import_contacts(file: BinaryIO, fmt: str, user: User, db: AsyncSession,
+                          batch_size: int = settings.import_batch_size,
+                          max_errors: int = settings.import_max_errors) -> ContactImportResponse:
+    """
+    The import_contacts function validates the rows of an upload with ContactBase and inserts the valid ones
+    in batches of batch_size rows, each batch with one executemany INSERT and one commit.
+    Reading and validating a batch happen in a worker thread, so a large file does not block the other requests;
+    only the inserts run on the event loop.
+    Memory stays bounded by one batch and max_errors error reports, whatever the size of the file.
+    An undecodable file stops the import; the rows of the batches already committed stay imported.
+
+    :param file: BinaryIO: The uploaded file
+    :param fmt: str: &quot;csv&quot; or &quot;ndjson&quot;
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Access the database
+    :param batch_size: int: The number of rows inserted at once
+    :param max_errors: int: The maximum number of rejected rows reported
+    :return: The number of imported and rejected rows with the first errors
+    :doc-author: OSA
+    """
+    report = ContactImportResponse()
+    rows = iter_rows(file, fmt)
+    number, finished = 0, False
+    while not finished:
+        batch, number, finished = await asyncio.to_thread(_read_batch, rows, number, batch_size, report, max_errors)
+        report.imported += await repository_contacts.create_contacts(batch, user, db)
+    return report
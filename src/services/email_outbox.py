@@ -0,0 +1,182 @@
+import json
+import random
+import time
+import uuid
+
+from redis.asyncio import Redis
+
+from src.config.config import settings
+
+
+class EmailOutbox:
+    """
+    A persistent queue of emails kept in Redis, filled by the web workers and drained by the email worker.
+
+    Attributes:
+    QUEUE (str): The list of jobs waiting to be sent, oldest on the right.
+    RETRY (str): The sorted set of failed jobs, scored by the time of their next attempt.
+    DEAD (str): The list of jobs that failed max_attempts times.
+
+    A job taken by a worker is moved atomically to the processing list of that worker and only removed
+    once it is sent or rescheduled, so a crashed worker loses nothing: it takes its jobs back on restart.
+
+    Methods:
+    enqueue(job: dict) -> None:
+    Add a job to the queue.
+    take(worker: str, batch: int, timeout: float) -> list[str]:
+    Move up to batch jobs to the processing list of a worker.
+    ack(worker: str, raw: str) -> None:
+    Forget a sent job.
+    retry(worker: str, raw: str) -> bool:
+    Reschedule a failed job with an exponential backoff, or bury it.
+    promote(now: float | None) -> int:
+    Move the jobs whose backoff has elapsed back to the queue.
+    recover(worker: str) -> int:
+    Put back the jobs left in the processing list of a stopped worker.
+    """
+
+    QUEUE = "email:outbox"
+    RETRY = "email:retry"
+    DEAD = "email:dead"
+
+    def __init__(self, max_attempts: int, backoff: float, backoff_max: float):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._redis: Redis | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._redis is not None
+
+    @staticmethod
+    def processing(worker: str) -> str:
+        return f"email:processing:{worker}"
+
+    async def enqueue(self, job: dict) -> None:
+        """
+        The enqueue function adds a job to the outbox. It costs one Redis command, whatever the state of the mail server.
+
+        :param job: dict: The job, e.g. {&quot;kind&quot;: &quot;confirm_email&quot;, &quot;email&quot;: ...}
+        :return: Nothing
+        :doc-author: OSA
+        """
+        job = dict(job, id=uuid.uuid4().hex, attempts=0)
+        await self._redis.lpush(self.QUEUE, json.dumps(job))
+
+    async def take(self, worker: str, batch: int, timeout: float) -> list[str]:
+        """
+        The take function waits up to timeout seconds for a job, then takes up to batch jobs without waiting.
+
+        :param worker: str: The name of the worker
+        :param batch: int: The maximum number of jobs
+        :param timeout: float: The number of seconds to wait for the first job
+        :return: The raw jobs, oldest first
+        :doc-author: OSA
+        """
+        first = await self._redis.blmove(self.QUEUE, self.processing(worker), timeout, "RIGHT", "LEFT")
+        if first is None:
+            return []
+        jobs = [first]
+        while len(jobs) < batch:
+            raw = await self._redis.lmove(self.QUEUE, self.processing(worker), "RIGHT", "LEFT")
+            if raw is None:
+                break
+            jobs.append(raw)
+        return jobs
+
+    async def ack(self, worker: str, raw: str) -> None:
+        """
+        The ack function removes a sent job from the processing list of the worker.
+
+        :param worker: str: The name of the worker
+        :param raw: str: The job as returned by take
+        :return: Nothing
+        :doc-author: OSA
+        """
+        await self._redis.lrem(self.processing(worker), 1, raw)
+
+    def delay(self, attempts: int) -> float:
+        """
+        The delay function returns the backoff before the next attempt: it doubles with every attempt,
+        is capped by backoff_max and gets up to 10% of jitter so that failed batches do not retry in lockstep.
+
+        :param attempts: int: The number of failed attempts so far
+        :return: The delay in seconds
+        :doc-author: OSA
+        """
+        delay = min(self.backoff * 2 ** (attempts - 1), self.backoff_max)
+        return delay * random.uniform(1, 1.1)
+
+    async def retry(self, worker: str, raw: str) -> bool:
+        """
+        The retry function reschedules a failed job, or moves it to the dead list after max_attempts failures.
+
+        :param worker: str: The name of the worker
+        :param raw: str: The job as returned by take
+        :return: True if the job will be retried
+        :doc-author: OSA
+        """
+        job = json.loads(raw)
+        job["attempts"] = job.get("attempts", 0) + 1
+        retried = job["attempts"] < self.max_attempts
+        async with self._redis.pipeline(transaction=True) as pipe:
+            if retried:
+                pipe.zadd(self.RETRY, {json.dumps(job): time.time() + self.delay(job["attempts"])})
+            else:
+                pipe.lpush(self.DEAD, json.dumps(job))
+            pipe.lrem(self.processing(worker), 1, raw)
+            await pipe.execute()
+        return retried
+
+    async def promote(self, now: float | None = None) -> int:
+        """
+        The promote function moves the failed jobs whose backoff has elapsed back to the queue.
+        Only the worker whose ZREM succeeds pushes a job, so concurrent workers never duplicate it.
+
+        :param now: float | None: The current time, time.time() by default
+        :return: The number of promoted jobs
+        :doc-author: OSA
+        """
+        due = await self._redis.zrangebyscore(self.RETRY, 0, now or time.time(), start=0, num=100)
+        promoted = 0
+        for raw in due:
+            if await self._redis.zrem(self.RETRY, raw):
+                await self._redis.rpush(self.QUEUE, raw)
+                promoted += 1
+        return promoted
+
+    async def recover(self, worker: str) -> int:
+        """
+        The recover function puts the jobs left in the processing list of a worker back at the head of the queue.
+
+        :param worker: str: The name of the worker
+        :return: The number of recovered jobs
+        :doc-author: OSA
+        """
+        recovered = 0
+        while await self._redis.lmove(self.processing(worker), self.QUEUE, "LEFT", "RIGHT") is not None:
+            recovered += 1
+        return recovered
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function connects the outbox to Redis.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+
+    async def stop(self) -> None:
+        """
+        The stop function disconnects the outbox from Redis.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = None
+
+
+email_outbox = EmailOutbox(settings.email_max_attempts, settings.email_retry_backoff, settings.email_retry_backoff_max)
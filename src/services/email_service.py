@@ -1,13 +1,20 @@
+import asyncio
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from fastapi_mail import ConnectionConfig
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
+from src.services.email_outbox import email_outbox
+from src.services.email_templates import email_templates
 from src.config.config import settings
+from src.logger import get_logger
 
-print(settings.mail_username, type(settings.mail_username))
+logger = get_logger(__name__)
+logger.debug(f"Mail account: {settings.mail_username}")
 conf = ConnectionConfig(
     MAIL_USERNAME=str(settings.mail_username),
     MAIL_PASSWORD=settings.mail_password,
@@ -39,30 +46,141 @@ TEMPLATE_FOLDER (Path): The path to the folder containing email templates.
 """
 
 
+CONFIRMATION_TEMPLATE = "email_template.html"
+CONFIRMATION_VARIABLES = ("host", "username", "token")
+
+
+class SMTPPool:
+    """
+    Keeps up to size authenticated SMTP connections open and reuses them for every message,
+    instead of paying a TCP, TLS and AUTH handshake per email.
+
+    Methods:
+    send(message: EmailMessage) -> None:
+    Send a message over an idle connection, opening one if needed.
+    close() -> None:
+    Quit every idle connection.
+    """
+
+    def __init__(self, size: int, **options):
+        self.size = size
+        self.options = options
+        self._idle: list[aiosmtplib.SMTP] = []
+        self._slots = asyncio.Semaphore(size)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(**self.options)
+        await client.connect()
+        return client
+
+    async def send(self, message: EmailMessage) -> None:
+        """
+        The send function sends a message over a pooled connection.
+        A connection closed by the server while idle is replaced once; other failures are raised to the caller.
+
+        :param message: EmailMessage: The message to send
+        :return: Nothing
+        :doc-author: OSA
+        """
+        async with self._slots:
+            client = self._idle.pop() if self._idle else None
+            try:
+                if client is None or not client.is_connected:
+                    client = await self._connect()
+                try:
+                    await client.send_message(message)
+                except aiosmtplib.SMTPServerDisconnected:
+                    client = await self._connect()
+                    await client.send_message(message)
+            except aiosmtplib.SMTPResponseException:
+                self._idle.append(client)
+                raise
+            except BaseException:
+                if client is not None:
+                    client.close()
+                raise
+            self._idle.append(client)
+
+    async def close(self) -> None:
+        """
+        The close function quits every idle connection of the pool.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        while self._idle:
+            client = self._idle.pop()
+            try:
+                await client.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                client.close()
+
+
+smtp_pool = SMTPPool(
+    settings.email_smtp_pool_size,
+    hostname=conf.MAIL_SERVER,
+    port=conf.MAIL_PORT,
+    username=conf.MAIL_USERNAME if conf.USE_CREDENTIALS else None,
+    password=conf.MAIL_PASSWORD if conf.USE_CREDENTIALS else None,
+    use_tls=conf.MAIL_SSL_TLS,
+    start_tls=conf.MAIL_STARTTLS,
+    validate_certs=conf.VALIDATE_CERTS,
+)
+
+
+def render_confirmation(email: str, username: str, host: str) -> EmailMessage:
+    """
+    The render_confirmation function builds the email asking a user to confirm their address.
+    The verification token is created here, when the email is sent, so it is never stored in the outbox.
+
+    :param email: str: The email address of the recipient
+    :param username: str: The username shown in the greeting
+    :param host: str: The base url of the application, used in the verification link
+    :return: The message, ready to be sent
+    :doc-author: OSA
+    """
+    token_verification = auth_service.create_email_token({"sub": email})
+    html = email_templates.render(CONFIRMATION_TEMPLATE, host=host, username=username, token=token_verification)
+    message = EmailMessage()
+    message["Subject"] = "Confirm your email "
+    message["From"] = formataddr((conf.MAIL_FROM_NAME, conf.MAIL_FROM))
+    message["To"] = email
+    message.set_content(html, subtype="html")
+    return message
+
+
+async def deliver(job: dict, pool: SMTPPool = smtp_pool) -> None:
+    """
+    The deliver function renders and sends the email described by an outbox job.
+
+    :param job: dict: The job, as enqueued by send_email
+    :param pool: SMTPPool: The connections used to send it
+    :return: Nothing
+    :doc-author: OSA
+    """
+    if job.get("kind") != "confirm_email":
+        raise ValueError(f"Unknown email job {job.get('kind')!r}")
+    await pool.send(render_confirmation(job["email"], job["username"], job["host"]))
+
+
 async def send_email(email: EmailStr, username: str, host: str):
     """
-    The send_email function sends an email to the user with a link to confirm their email address.
-    The function takes in three parameters:
-    -email: EmailStr, the user's email address.
-    -username: str, the username of the user who is registering for an account.  This will be used in a greeting message within the body of the email sent to them.
-    -host: str, this is where we are hosting our application (i.e., localhost).  This will be used as part of a URL that they can click on within their browser.
+    The send_email function queues an email asking the user to confirm their email address.
+    The email itself is rendered and sent by the email worker (python -m src.services.email_worker),
+    which reuses its SMTP connections and retries with a backoff, so the request never waits for the mail server.
+    When the outbox is not connected to Redis, e.g. in a local run without Redis, the email is sent right away.
 
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the email template
     :param host: str: Pass the host url to the email template
-    :return: A coroutine, which is an object that can be used to control the execution of a
+    :return: Nothing
     :doc-author: OSA
     """
+    job = {"kind": "confirm_email", "email": email, "username": username, "host": host}
+    if email_outbox.started:
+        await email_outbox.enqueue(job)
+        return
     try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+        await deliver(job)
+    except (aiosmtplib.SMTPException, OSError) as err:
+        logger.error(f"Confirmation email to {email} failed: {err}")
@@ -0,0 +1,73 @@
+import re
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markupsafe import escape
+
+
+class EmailTemplates:
+    """
+    Renders the email templates without going through Jinja for every message.
+
+    Each template is rendered once with a sentinel in place of every per-message variable,
+    and the output is split into its static segments. Rendering a message then only escapes the values
+    and joins them with the segments. The compiled templates also go to a bytecode cache on disk,
+    so a restarted worker does not parse them again.
+    A template that transforms a variable (e.g. with a filter) cannot be split and is rendered by Jinja.
+
+    Methods:
+    load(name: str, variables: tuple[str, ...]) -> None:
+    Compile and split a template.
+    render(name: str, **values: str) -> str:
+    Render a message.
+    """
+
+    SENTINEL = "\x00{}\x00"
+
+    def __init__(self, folder: Path):
+        self.environment = Environment(loader=FileSystemLoader(folder), autoescape=True,
+                                       bytecode_cache=FileSystemBytecodeCache())
+        self._segments: dict[str, tuple[list[str], list[str]] | None] = {}
+
+    def load(self, name: str, variables: tuple[str, ...]) -> None:
+        """
+        The load function compiles a template and splits its output around the given variables.
+
+        :param name: str: The file name of the template
+        :param variables: tuple[str, ...]: The variables that change with every message
+        :return: Nothing
+        :doc-author: OSA
+        """
+        template = self.environment.get_template(name)
+        rendered = template.render({variable: self.SENTINEL.format(variable) for variable in variables})
+        parts = re.split("\x00([^\x00]*)\x00", rendered)
+        static, slots = parts[::2], parts[1::2]
+        if set(slots) == set(variables) and "\x00" not in "".join(static):
+            self._segments[name] = (static, slots)
+        else:
+            self._segments[name] = None
+
+    def render(self, name: str, **values: str) -> str:
+        """
+        The render function renders a template with the values of one message.
+        Values are HTML-escaped exactly like the autoescaping Jinja environment would do.
+
+        :param name: str: The file name of the template
+        :param values: str: The value of every variable given to load
+        :return: The rendered template
+        :doc-author: OSA
+        """
+        if name not in self._segments:
+            self.load(name, tuple(values))
+        segments = self._segments[name]
+        if segments is None:
+            return self.environment.get_template(name).render(values)
+        static, slots = segments
+        parts = [static[0]]
+        for slot, text in zip(slots, static[1:]):
+            parts.append(escape(values[slot]))
+            parts.append(text)
+        return "".join(parts)
+
+
+email_templates = EmailTemplates(Path(__file__).parent / "templates")
@@ -0,0 +1,87 @@
+"""
+The email worker drains the email outbox: it takes queued emails in batches, sends them over pooled
+SMTP connections and reschedules the failed ones with an exponential backoff.
+
+Usage:
+    python -m src.services.email_worker
+"""
+import asyncio
+import json
+import signal
+
+import redis.asyncio as async_redis
+
+from src.config.config import settings
+from src.logger import get_logger
+from src.services.email_outbox import EmailOutbox, email_outbox
+from src.services.email_service import CONFIRMATION_TEMPLATE, CONFIRMATION_VARIABLES, SMTPPool, deliver, smtp_pool
+from src.services.email_templates import email_templates
+
+logger = get_logger(__name__)
+
+
+async def process(jobs: list[str], worker: str, outbox: EmailOutbox, pool: SMTPPool) -> int:
+    """
+    The process function sends a batch of jobs concurrently, at most pool.size at a time,
+    then acknowledges the sent ones and reschedules the others.
+
+    :param jobs: list[str]: The raw jobs returned by EmailOutbox.take
+    :param worker: str: The name of the worker
+    :param outbox: EmailOutbox: The outbox the jobs come from
+    :param pool: SMTPPool: The SMTP connections
+    :return: The number of sent emails
+    :doc-author: OSA
+    """
+    results = await asyncio.gather(*(deliver(json.loads(raw), pool) for raw in jobs), return_exceptions=True)
+    sent = 0
+    for raw, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Email job failed: {result!r}")
+            await outbox.retry(worker, raw)
+        else:
+            await outbox.ack(worker, raw)
+            sent += 1
+    return sent
+
+
+async def run(outbox: EmailOutbox, pool: SMTPPool, worker: str, batch_size: int, stopping: asyncio.Event) -> None:
+    """
+    The run function recovers the jobs of a previous run of the worker, then sends batches until stopping is set.
+
+    :param outbox: EmailOutbox: The outbox to drain
+    :param pool: SMTPPool: The SMTP connections
+    :param worker: str: The name of the worker, which names its processing list
+    :param batch_size: int: The maximum number of jobs taken at once
+    :param stopping: asyncio.Event: Set to stop after the current batch
+    :return: Nothing
+    :doc-author: OSA
+    """
+    await outbox.recover(worker)
+    try:
+        while not stopping.is_set():
+            await outbox.promote()
+            jobs = await outbox.take(worker, batch_size, timeout=1)
+            if jobs:
+                await process(jobs, worker, outbox, pool)
+    finally:
+        await pool.close()
+
+
+async def serve() -> None:
+    redis = async_redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
+                              decode_responses=True)
+    email_templates.load(CONFIRMATION_TEMPLATE, CONFIRMATION_VARIABLES)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    await email_outbox.start(redis)
+    try:
+        await run(email_outbox, smtp_pool, settings.email_worker_name, settings.email_batch_size, stopping)
+    finally:
+        await email_outbox.stop()
+        await redis.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,123 @@
+import hashlib
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config.config import settings
+from src.database.db import SessionLocal
+from src.repository import users as repository_users
+
+GRAVATAR_URL = "https://www.gravatar.com/avatar/"
+
+
+@lru_cache(maxsize=settings.gravatar_cache_size)
+def gravatar_hash(email: str) -> str:
+    """
+    The gravatar_hash function returns the MD5 hash Gravatar uses to identify an email address.
+
+    :param email: str: The email address
+    :return: The hexadecimal hash of the trimmed, lowercased address
+    :doc-author: OSA
+    """
+    return hashlib.md5(email.strip().lower().encode("utf-8")).hexdigest()
+
+
+def gravatar_url(email: str) -> str:
+    """
+    The gravatar_url function returns the url of the Gravatar image of an email address.
+    It is computed locally, without any request to Gravatar.
+
+    :param email: str: The email address
+    :return: The url of the image
+    :doc-author: OSA
+    """
+    return f"{GRAVATAR_URL}{gravatar_hash(email)}"
+
+
+class GravatarResolver:
+    """
+    Finds out in the background whether an email address has a Gravatar image and, if so, makes it the user's avatar.
+
+    Addresses without an image are kept in a negative cache for negative_ttl seconds,
+    so asking again, e.g. on every GET /api/auth/me/ of a user without avatar, costs no request to Gravatar.
+    Network errors are not cached.
+
+    Methods:
+    resolve(email: str) -> str | None:
+    Return the Gravatar url of an address, or None when it has no image.
+    fill_avatar(email: str) -> None:
+    Set the resolved url as the avatar of a user who has none.
+    """
+
+    def __init__(self, negative_size: int, negative_ttl: float, timeout: float,
+                 session_maker: async_sessionmaker[AsyncSession] = SessionLocal):
+        self.negative_size = negative_size
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.session_maker = session_maker
+        self._missing: OrderedDict[str, float] = OrderedDict()
+        self._pending: set[str] = set()
+
+    def _is_missing(self, digest: str) -> bool:
+        expires = self._missing.get(digest)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._missing[digest]
+            return False
+        return True
+
+    def _remember_missing(self, digest: str) -> None:
+        self._missing[digest] = time.monotonic() + self.negative_ttl
+        self._missing.move_to_end(digest)
+        while len(self._missing) > self.negative_size:
+            self._missing.popitem(last=False)
+
+    async def resolve(self, email: str) -> str | None:
+        """
+        The resolve function asks Gravatar whether an address has an image, with d=404 so a missing image is a 404.
+
+        :param email: str: The email address
+        :return: The url of the image, or None when there is no image, Gravatar cannot be reached
+            or the same address is being looked up already
+        :doc-author: OSA
+        """
+        digest = gravatar_hash(email)
+        if self._is_missing(digest) or digest in self._pending:
+            return None
+        url = gravatar_url(email)
+        self._pending.add(digest)
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.head(url, params={"d": "404"})
+        except httpx.HTTPError:
+            return None
+        finally:
+            self._pending.discard(digest)
+        if response.status_code == 404:
+            self._remember_missing(digest)
+            return None
+        if response.status_code != 200:
+            return None
+        return url
+
+    async def fill_avatar(self, email: str) -> None:
+        """
+        The fill_avatar function sets the Gravatar image of a user who has no avatar yet.
+        It runs as a background task, after the response is sent.
+
+        :param email: str: The email of the user
+        :return: Nothing
+        :doc-author: OSA
+        """
+        url = await self.resolve(email)
+        if url is None:
+            return
+        async with self.session_maker() as db:
+            await repository_users.set_default_avatar(email, url, db)
+
+
+gravatar = GravatarResolver(settings.gravatar_negative_size, settings.gravatar_negative_ttl, settings.gravatar_timeout)
@@ -0,0 +1,174 @@
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Callable
+
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, HistogramMetricFamily
+from prometheus_client.utils import floatToGoString
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.database import pool
+
+BUCKETS = pool.WAIT_BUCKETS
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template.",
+    ("method", "route", "status"), buckets=BUCKETS)
+db_queries = Counter("db_queries", "Queries sent to the database, by repository function.", ("function",))
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Time to run a query, by repository function.", ("function",), buckets=BUCKETS)
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds", "Time of the Redis commands and pipelines, failed ones included.",
+    ("command",), buckets=BUCKETS)
+rate_limiter_redis_duration = Histogram(
+    "rate_limiter_redis_seconds", "Time of the token-bucket calls of the rate limiter, timeouts included.",
+    buckets=BUCKETS)
+rate_limiter_decisions = Counter(
+    "rate_limiter_requests", "Requests seen by the rate limiter, by decision: allowed or limited by Redis, "
+    "allowed locally, allowed because Redis failed (failed_open) or is not started (disabled).", ("decision",))
+
+# The repository function running in the current task, set by track_queries and read by the query hooks.
+current_function: ContextVar[str] = ContextVar("current_function", default="other")
+
+
+def track_queries(fn: Callable) -> Callable:
+    """
+    The track_queries decorator attributes the queries run by a repository function, or async generator,
+    to that function, e.g. contacts.get_contacts, in db_queries and db_query_duration.
+
+    :param fn: Callable: The repository function
+    :return: The wrapped function
+    :doc-author: OSA
+    """
+    name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def generator(*args, **kwargs):
+            items = fn(*args, **kwargs)
+            try:
+                while True:
+                    token = current_function.set(name)
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        current_function.reset(token)
+                    yield item
+            finally:
+                await items.aclose()
+        return generator
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = current_function.set(name)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            current_function.reset(token)
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    function = current_function.get()
+    db_queries.labels(function).inc()
+    db_query_duration.labels(function).observe(elapsed)
+
+
+def _handle_error(exception_context) -> None:
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    The instrument_engine function counts and times the queries of an engine by repository function.
+
+    :param engine: AsyncEngine: The engine of the primary or of a replica
+    :return: Nothing
+    :doc-author: OSA
+    """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+class TimedPipeline(Pipeline):
+    """
+    A Redis pipeline timing each round-trip in redis_command_duration, as command PIPELINE.
+    """
+
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_command_duration.labels("PIPELINE").observe(time.perf_counter() - started)
+
+
+class TimedRedis(Redis):
+    """
+    The Redis client of the application, timing every command in redis_command_duration by command name
+    (EVALSHA for the scripts) and every pipeline as PIPELINE. Pub/sub connections are not timed.
+    """
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_duration.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class CounterCollector:
+    """
+    Exposes a count kept by a component of the application, e.g. the connections the pool monitor found leaked.
+    With labels, value returns the count of each tuple of label values.
+    """
+
+    def __init__(self, name: str, documentation: str, value: Callable[[], float | dict[tuple, float]],
+                 labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.value = value
+        self.labels = labels
+
+    def collect(self):
+        if not self.labels:
+            yield CounterMetricFamily(self.name, self.documentation, value=self.value())
+            return
+        family = CounterMetricFamily(self.name, self.documentation, labels=self.labels)
+        for values, count in self.value().items():
+            family.add_metric(list(values), count)
+        yield family
+
+
+class HistogramCollector:
+    """
+    Exposes a histogram kept by a component of the application, e.g. the checkout waits of the pool monitor.
+    """
+
+    def __init__(self, name: str, documentation: str, histogram: pool.Histogram):
+        self.name = name
+        self.documentation = documentation
+        self.histogram = histogram
+
+    def collect(self):
+        snapshot = self.histogram.snapshot()
+        yield HistogramMetricFamily(self.name, self.documentation, sum_value=snapshot["sum"],
+                                    buckets=[(floatToGoString(bound), count) for bound, count in snapshot["buckets"]])
@@ -0,0 +1,36 @@
+import base64
+import binascii
+
+
+CURSOR_VERSION = "v1"
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    The encode_cursor function turns the id of the last row of a page into an opaque cursor.
+
+    :param last_id: int: The id of the last row on the page
+    :return: A url-safe cursor string
+    :doc-author: OSA
+    """
+    raw = f"{CURSOR_VERSION}:{last_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    The decode_cursor function returns the id stored in a cursor made by encode_cursor.
+    It raises ValueError for anything else.
+
+    :param cursor: str: The cursor sent by the client
+    :return: The id of the last row of the previous page
+    :doc-author: OSA
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError) as err:
+        raise ValueError("Invalid cursor") from err
+    version, _, last_id = raw.partition(":")
+    if version != CURSOR_VERSION or not last_id.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(last_id)
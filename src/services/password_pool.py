@@ -0,0 +1,117 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+from src.config.config import settings
+
+
+class PasswordPool:
+    """
+    Runs the bcrypt work of the application in a dedicated, size-limited thread pool.
+
+    bcrypt releases the GIL while hashing, so the threads hash in parallel while the event loop keeps
+    serving other requests. When more than workers + max_queue jobs are waiting, new jobs are rejected
+    with 503 instead of piling up behind a login storm.
+
+    Attributes:
+    workers (int): The number of threads of the pool.
+    max_queue (int): How many jobs may wait for a free thread.
+    active (int): The number of jobs being hashed right now.
+    queued (int): The number of jobs waiting for a free thread.
+    max_queued (int): The highest queue depth seen so far.
+    completed (int): The number of finished jobs.
+    rejected (int): The number of jobs rejected because the queue was full.
+
+    Methods:
+    run(fn: Callable, *args) -> Any:
+    Run a hashing function in the pool and await its result.
+    stats() -> dict:
+    Return the queue-depth metrics of the pool.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def _call(self, fn: Callable, *args) -> Any:
+        """
+        The _call function runs inside a pool thread and moves the job from the queue to the active jobs.
+
+        :param fn: Callable: The hashing function
+        :param args: The arguments of the hashing function
+        :return: The result of the hashing function
+        :doc-author: OSA
+        """
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    def _forget(self, future: Future) -> None:
+        """
+        The _forget function takes a job cancelled before a thread picked it up, e.g. because the client
+        disconnected, off the queue. Such a job never reaches _call, which would otherwise do it.
+
+        :param future: Future: The finished or cancelled job
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+        The run function schedules a hashing function on the pool without blocking the event loop.
+
+        :param fn: Callable: The hashing function, e.g. pwd_context.verify
+        :param args: The arguments of the hashing function
+        :return: The result of the hashing function
+        :doc-author: OSA
+        """
+        with self._lock:
+            if self.active + self.queued >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Too many authentication requests, try again later",
+                                    headers={"Retry-After": "1"})
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        future = self._executor.submit(self._call, fn, *args)
+        future.add_done_callback(self._forget)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the queue-depth metrics of the pool.
+
+        :return: A dictionary with the pool size, the active, queued and finished jobs
+        :doc-author: OSA
+        """
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_pool = PasswordPool(settings.bcrypt_pool_size, settings.bcrypt_queue_size)
@@ -0,0 +1,224 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.config.config import settings
+from src.logger import get_logger
+from src.services.auth import auth_service
+from src.services.metrics import rate_limiter_decisions, rate_limiter_redis_duration
+
+logger = get_logger(__name__)
+
+# KEYS: the buckets; ARGV[1]: requests already served locally, then the refill rate (tokens per ms)
+# and the capacity of every bucket. Returns allowed (0/1), the tokens left in the fullest-drained bucket
+# and the milliseconds until a request would be allowed.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local pending = tonumber(ARGV[1])
+local levels = {}
+local allowed = 1
+local retry = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate) - pending
+    tokens = math.max(tokens, -capacity)
+    if tokens < 1 then
+        allowed = 0
+        retry = math.max(retry, math.ceil((1 - tokens) / rate))
+    end
+    levels[i] = tokens
+end
+local remaining = -1
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local tokens = levels[i] - allowed
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil((capacity - tokens) / rate) + 1000)
+    if remaining < 0 or tokens < remaining then
+        remaining = tokens
+    end
+end
+return {allowed, math.floor(math.max(remaining, 0)), retry}
+"""
+
+
+class RateLimiterEngine:
+    """
+    Token-bucket rate limiting in Redis, one round-trip per request at most.
+
+    Every request of a client takes one token from the bucket of the route for its IP address and,
+    when it carries a valid access token, from the bucket of the route for its user;
+    the buckets refill continuously and hold up to the burst of the route. Both buckets are checked and
+    updated atomically by one Lua script. The IP buckets are ip_factor times larger, as an address may be shared.
+
+    A client that Redis just reported as far from its limit (at least local_fraction of the burst left,
+    less than local_ttl seconds ago) is served from the worker without asking Redis; those requests are
+    charged to its buckets on its next Redis call. When Redis does not answer within budget seconds,
+    or is not started, requests are let through (fail open).
+
+    Attributes:
+    local_hits (int): Requests allowed by the local pre-check.
+    failures (int): Requests let through because Redis was slow or down.
+
+    Every decision is counted in rate_limiter_requests_total and every Redis call timed in rate_limiter_redis_seconds.
+
+    Methods:
+    hit(keys: list[str], rate: float, burst: int, ip_factor: float) -> tuple[bool, int]:
+    Take a token for a request and return whether it is allowed and the seconds to wait otherwise.
+    start(redis: Redis) -> None:
+    Start limiting through Redis.
+    stop() -> None:
+    Stop using Redis.
+    """
+
+    KEY = "rate_limit:"
+
+    def __init__(self, budget: float, local_fraction: float, local_ttl: float, cache_size: int):
+        self.budget = budget
+        self.local_fraction = local_fraction
+        self.local_ttl = local_ttl
+        self.cache_size = cache_size
+        self.local_hits = 0
+        self.failures = 0
+        self._local: OrderedDict[tuple, list] = OrderedDict()
+        self._redis: Redis | None = None
+        self._script = None
+
+    def _local_allows(self, key: tuple, burst: int) -> bool:
+        """
+        The _local_allows function decides from the last answer of Redis whether a client is clearly under its limit.
+
+        :param key: tuple: The buckets of the request
+        :param burst: int: The burst of the route
+        :return: True if the request can be allowed without Redis
+        :doc-author: OSA
+        """
+        entry = self._local.get(key)
+        if entry is None:
+            return False
+        remaining, seen_at, pending = entry
+        if time.monotonic() - seen_at > self.local_ttl or remaining - pending - 1 < burst * self.local_fraction:
+            return False
+        entry[2] += 1
+        self.local_hits += 1
+        return True
+
+    def _remember(self, key: tuple, remaining: int) -> None:
+        self._local[key] = [remaining, time.monotonic(), 0]
+        self._local.move_to_end(key)
+        while len(self._local) > self.cache_size:
+            self._local.popitem(last=False)
+
+    async def hit(self, keys: list[str], rate: float, burst: int, ip_factor: float) -> tuple[bool, int]:
+        """
+        The hit function takes a token from the buckets of a request.
+
+        :param keys: list[str]: The bucket names, the IP bucket first, then the user bucket if any
+        :param rate: float: The refill rate of the user bucket, in tokens per second
+        :param burst: int: The capacity of the user bucket
+        :param ip_factor: float: How much larger the IP bucket is
+        :return: Whether the request is allowed, and the seconds to wait before retrying when it is not
+        :doc-author: OSA
+        """
+        if self._redis is None:
+            rate_limiter_decisions.labels("disabled").inc()
+            return True, 0
+        key = tuple(keys)
+        if self._local_allows(key, burst):
+            rate_limiter_decisions.labels("local").inc()
+            return True, 0
+        entry = self._local.get(key)
+        pending = entry[2] if entry else 0
+        args = [pending]
+        for name in keys:
+            factor = ip_factor if name.startswith(self.KEY + "ip:") else 1
+            args += [rate * factor / 1000, math.ceil(burst * factor)]
+        started = time.perf_counter()
+        try:
+            allowed, remaining, retry_ms = await asyncio.wait_for(
+                self._script(keys=keys, args=args), timeout=self.budget)
+        except (asyncio.TimeoutError, RedisError, OSError) as error:
+            rate_limiter_redis_duration.observe(time.perf_counter() - started)
+            rate_limiter_decisions.labels("failed_open").inc()
+            self.failures += 1
+            if self.failures % 100 == 1:
+                logger.warning(f"Rate limiter fails open: {type(error).__name__} {error}")
+            return True, 0
+        rate_limiter_redis_duration.observe(time.perf_counter() - started)
+        rate_limiter_decisions.labels("allowed" if allowed else "limited").inc()
+        self._remember(key, int(remaining))
+        return bool(allowed), math.ceil(int(retry_ms) / 1000)
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function starts limiting through Redis.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+        self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def stop(self) -> None:
+        """
+        The stop function stops using Redis, the requests are let through from then on.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = None
+        self._script = None
+
+
+rate_limiter = RateLimiterEngine(settings.rate_limit_budget_ms / 1000, settings.rate_limit_local_fraction,
+                                 settings.rate_limit_local_ttl, settings.rate_limit_cache_size)
+
+
+class RateLimit:
+    """
+    A route dependency allowing times requests per seconds to every user and IP address,
+    with bursts of up to burst requests (times by default).
+
+    Usage:
+    @router.get("/", dependencies=[Depends(RateLimit(times=20, seconds=60))])
+    """
+
+    def __init__(self, times: int, seconds: float, burst: int | None = None, engine: RateLimiterEngine = rate_limiter):
+        self.rate = times / seconds
+        self.burst = burst or times
+        self.engine = engine
+
+    @staticmethod
+    def _user(request: Request) -> str | None:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        try:
+            return auth_service.decode_access_token(token)["sub"]
+        except JWTError:
+            return None
+
+    async def __call__(self, request: Request) -> None:
+        route = request.scope.get("route")
+        name = f"{request.method}:{route.path if route else request.url.path}"
+        keys = [f"{RateLimiterEngine.KEY}ip:{request.client.host if request.client else 'unknown'}:{name}"]
+        user = self._user(request)
+        if user is not None:
+            keys.append(f"{RateLimiterEngine.KEY}user:{user}:{name}")
+        allowed, retry_after = await self.engine.hit(keys, self.rate, self.burst, settings.rate_limit_ip_factor)
+        if not allowed:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": str(retry_after)})
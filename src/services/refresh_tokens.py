@@ -0,0 +1,232 @@
+import time
+import uuid
+
+from redis.asyncio import Redis
+
+from src.config.config import settings
+from src.services.token_cache import token_cache
+
+# KEYS[1]: the session, KEYS[2]: the set of sessions of its user; ARGV: presented jti, new jti, now, ttl, sid.
+# 1 - rotated, 0 - unknown or expired session, -1 - reused jti, the session is deleted.
+# The user set gets the TTL of its newest session, so it lives as long as any session it lists.
+ROTATE_SCRIPT = """
+local jti = redis.call('HGET', KEYS[1], 'jti')
+if not jti then
+    return 0
+end
+if jti ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return -1
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2], 'used_at', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+
+class RefreshTokenStore:
+    """
+    Keeps the refresh-token sessions of the users, one per login (device), in Redis.
+
+    A session is a rotation family: it holds the jti of the only refresh token that may be used next.
+    Every refresh swaps it for a new one in a single Lua call, so refreshing costs one Redis round-trip
+    and no database write. Presenting an older jti of the family means the token was stolen or replayed:
+    the whole session is deleted and the access tokens issued for it are revoked.
+    Sessions expire on their own when they are not refreshed for ttl seconds. The set listing the sessions
+    of a user is given the same TTL whenever one of them is created or refreshed, so it outlives all of them
+    and a ban can always find them.
+
+    Until start is called, the sessions are kept in a dictionary of the worker, for development and tests.
+
+    Attributes:
+    KEY (str): The prefix of the Redis hashes holding the sessions.
+    USER_KEY (str): The prefix of the Redis sets holding the session ids of a user.
+
+    Methods:
+    create(email: str, device: str | None) -> tuple[str, str]:
+    Open a session and return its id and first jti.
+    rotate(sid: str, jti: str, email: str) -> str | None:
+    Swap the jti of a session for a new one.
+    sessions(email: str) -> list[dict]:
+    Return the open sessions of a user.
+    revoke(sid: str) -> None:
+    Close one session.
+    revoke_all(email: str) -> None:
+    Close every session of a user.
+    start(redis: Redis) -> None:
+    Keep the sessions in Redis.
+    stop() -> None:
+    Stop using Redis.
+    """
+
+    KEY = "refresh_session:"
+    USER_KEY = "refresh_sessions:"
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._redis: Redis | None = None
+        self._rotate = None
+        self._local: dict[str, dict] = {}
+        self._local_users: dict[str, dict] = {}
+
+    def _local_session(self, sid: str) -> dict | None:
+        session = self._local.get(sid)
+        if session is not None and session["expires"] <= time.time():
+            del self._local[sid]
+            return None
+        return session
+
+    def _local_index(self, email: str, add: str | None = None, now: float | None = None) -> set[str]:
+        """
+        The _local_index function is the local counterpart of the Redis set of the sessions of a user,
+        with the same expiry: adding a session gives the index ttl more seconds.
+
+        :param email: str: The email of the user
+        :param add: str | None: A session id to add
+        :param now: float | None: The current time, when adding
+        :return: The session ids of the user
+        :doc-author: OSA
+        """
+        index = self._local_users.get(email)
+        if index is not None and index["expires"] <= time.time():
+            del self._local_users[email]
+            index = None
+        if add is not None:
+            index = self._local_users.setdefault(email, {"sids": set(), "expires": 0})
+            index["sids"].add(add)
+            index["expires"] = now + self.ttl
+        return index["sids"] if index is not None else set()
+
+    async def create(self, email: str, device: str | None) -> tuple[str, str]:
+        """
+        The create function opens a new session for a login.
+
+        :param email: str: The email of the user
+        :param device: str | None: The User-Agent of the client, shown in the list of sessions
+        :return: The session id and the jti of its first refresh token
+        :doc-author: OSA
+        """
+        sid, jti = uuid.uuid4().hex, uuid.uuid4().hex
+        now = int(time.time())
+        session = {"sub": email, "jti": jti, "device": (device or "")[:255], "created_at": now, "used_at": now}
+        if self._redis is None:
+            self._local[sid] = dict(session, expires=now + self.ttl)
+            self._local_index(email, add=sid, now=now)
+            return sid, jti
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.KEY + sid, mapping=session)
+            pipe.expire(self.KEY + sid, self.ttl)
+            pipe.sadd(self.USER_KEY + email, sid)
+            pipe.expire(self.USER_KEY + email, self.ttl)
+            await pipe.execute()
+        return sid, jti
+
+    async def rotate(self, sid: str, jti: str, email: str) -> str | None:
+        """
+        The rotate function accepts the refresh token of a session once and gives the jti of the next one.
+        A jti that was already rotated closes the session and revokes its access tokens.
+
+        :param sid: str: The session id of the refresh token
+        :param jti: str: The jti of the refresh token
+        :param email: str: The subject of the refresh token, whose set of sessions is refreshed too
+        :return: The new jti, or None when the token is not valid anymore
+        :doc-author: OSA
+        """
+        new_jti = uuid.uuid4().hex
+        now = int(time.time())
+        if self._redis is None:
+            session = self._local_session(sid)
+            if session is None:
+                result = 0
+            elif session["jti"] != jti:
+                del self._local[sid]
+                result = -1
+            else:
+                session.update(jti=new_jti, used_at=now, expires=now + self.ttl)
+                self._local_index(email, add=sid, now=now)
+                result = 1
+        else:
+            result = await self._rotate(keys=[self.KEY + sid, self.USER_KEY + email],
+                                        args=[jti, new_jti, now, self.ttl, sid])
+        if result == -1:
+            await token_cache.revoke(sid)
+        return new_jti if result == 1 else None
+
+    async def sessions(self, email: str) -> list[dict]:
+        """
+        The sessions function lists the open sessions of a user.
+
+        :param email: str: The email of the user
+        :return: A list of dictionaries with the sid, device, created_at and used_at of each session
+        :doc-author: OSA
+        """
+        if self._redis is None:
+            found = {sid: session for sid in sorted(self._local_index(email))
+                     if (session := self._local_session(sid)) is not None}
+        else:
+            sids = list(await self._redis.smembers(self.USER_KEY + email))
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for sid in sids:
+                    pipe.hgetall(self.KEY + sid)
+                found = dict(zip(sids, await pipe.execute()))
+            expired = [sid for sid, session in found.items() if not session]
+            if expired:
+                await self._redis.srem(self.USER_KEY + email, *expired)
+        return [{"sid": sid, "device": session["device"], "created_at": int(session["created_at"]),
+                 "used_at": int(session["used_at"])}
+                for sid, session in found.items() if session]
+
+    async def revoke(self, sid: str) -> None:
+        """
+        The revoke function closes a session, its refresh token cannot be used anymore.
+
+        :param sid: str: The session id
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._redis is None:
+            self._local.pop(sid, None)
+            return
+        await self._redis.delete(self.KEY + sid)
+
+    async def revoke_all(self, email: str) -> None:
+        """
+        The revoke_all function closes every session of a user, e.g. when the user is banned.
+
+        :param email: str: The email of the user
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._redis is None:
+            for sid in self._local_index(email):
+                self._local.pop(sid, None)
+            self._local_users.pop(email, None)
+            return
+        sids = await self._redis.smembers(self.USER_KEY + email)
+        await self._redis.delete(self.USER_KEY + email, *(self.KEY + sid for sid in sids))
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function keeps the sessions in Redis, shared by every worker.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+        self._rotate = redis.register_script(ROTATE_SCRIPT)
+
+    async def stop(self) -> None:
+        """
+        The stop function stops using Redis.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = None
+        self._rotate = None
+
+
+refresh_store = RefreshTokenStore(settings.refresh_token_expire_days * 86400)
@@ -0,0 +1,189 @@
+import time
+from collections import OrderedDict, defaultdict
+from typing import Iterable
+
+from src.config.config import settings
+
+SEARCH_FIELDS = ("firstname", "lastname", "email")
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    The trigrams function returns the trigrams used for ranking, padded the way pg_trgm pads every word,
+    so the in-process ranking matches the similarity() ranking of Postgres closely.
+
+    :param text: str: The text to split
+    :return: A set of trigrams
+    :doc-author: OSA
+    """
+    result = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def inner_trigrams(text: str) -> set[str]:
+    """
+    The inner_trigrams function returns the unpadded trigrams of a text.
+    Every trigram of a substring is also a trigram of the text, which is what makes them usable
+    to find the candidates of an ilike '%term%' search.
+
+    :param text: str: The text to split
+    :return: A set of trigrams
+    :doc-author: OSA
+    """
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(left: str, right: str) -> float:
+    """
+    The similarity function is the in-process equivalent of the pg_trgm similarity() function.
+
+    :param left: str: The first text
+    :param right: str: The second text
+    :return: The share of common trigrams, between 0 and 1
+    :doc-author: OSA
+    """
+    a, b = trigrams(left), trigrams(right)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class TrigramIndex:
+    """
+    An inverted trigram index over the searchable fields of one user's contacts.
+
+    Methods:
+    add(contact_id: int, fields: dict) -> None:
+    Index the fields of a contact.
+    search(terms: dict, limit: int) -> list[int]:
+    Return the ids of the contacts containing every term, best matches first.
+    """
+
+    def __init__(self):
+        self.documents: dict[int, dict[str, str]] = {}
+        self.postings: dict[str, dict[str, set[int]]] = {field: defaultdict(set) for field in SEARCH_FIELDS}
+
+    def add(self, contact_id: int, fields: dict[str, str]) -> None:
+        """
+        The add function indexes the searchable fields of a contact.
+
+        :param contact_id: int: The id of the contact
+        :param fields: dict[str, str]: The firstname, lastname and email of the contact
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self.documents[contact_id] = {field: (fields.get(field) or "") for field in SEARCH_FIELDS}
+        for field in SEARCH_FIELDS:
+            for trigram in inner_trigrams(self.documents[contact_id][field]):
+                self.postings[field][trigram].add(contact_id)
+
+    def _candidates(self, field: str, term: str) -> Iterable[int]:
+        """
+        The _candidates function returns the contacts whose field has every trigram of the term.
+        Terms shorter than three characters have no trigram and match every contact.
+
+        :param field: str: The searched field
+        :param term: str: The search term
+        :return: The ids of the candidate contacts
+        :doc-author: OSA
+        """
+        grams = inner_trigrams(term)
+        if not grams:
+            return self.documents.keys()
+        postings = sorted((self.postings[field].get(gram, set()) for gram in grams), key=len)
+        return set.intersection(*postings)
+
+    def search(self, terms: dict[str, str], limit: int) -> list[int]:
+        """
+        The search function finds the contacts whose fields contain the given terms, case-insensitively,
+        and ranks them by the sum of their trigram similarities to the terms.
+
+        :param terms: dict[str, str]: The search term of each field, e.g. {&quot;firstname&quot;: &quot;andr&quot;}
+        :param limit: int: The maximum number of ids to return
+        :return: A list of contact ids, best matches first
+        :doc-author: OSA
+        """
+        terms = {field: term for field, term in terms.items() if term}
+        candidates = None
+        for field, term in terms.items():
+            found = set(self._candidates(field, term))
+            candidates = found if candidates is None else candidates & found
+        if candidates is None:
+            candidates = set(self.documents)
+        ranked = []
+        for contact_id in candidates:
+            document = self.documents[contact_id]
+            if all(term.lower() in document[field].lower() for field, term in terms.items()):
+                score = sum(similarity(document[field], term) for field, term in terms.items())
+                ranked.append((-score, contact_id))
+        ranked.sort()
+        return [contact_id for _, contact_id in ranked[:limit]]
+
+
+class ContactSearchIndexes:
+    """
+    Keeps the trigram indexes of the most recently searched users in memory.
+    It is the fallback search engine for databases without pg_trgm, e.g. SQLite in the test runs.
+
+    Methods:
+    get(user_id: int) -> TrigramIndex | None:
+    Return the index of a user if it is cached and fresh.
+    put(user_id: int, index: TrigramIndex) -> None:
+    Cache the index of a user.
+    invalidate(user_id: int) -> None:
+    Drop the index of a user whose contacts have changed.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._indexes: OrderedDict[int, tuple[float, TrigramIndex]] = OrderedDict()
+
+    def get(self, user_id: int) -> TrigramIndex | None:
+        """
+        The get function returns the cached index of a user, or None when it is missing or too old.
+
+        :param user_id: int: The owner of the contacts
+        :return: The trigram index or None
+        :doc-author: OSA
+        """
+        entry = self._indexes.get(user_id)
+        if entry is None:
+            return None
+        expires, index = entry
+        if expires <= time.monotonic():
+            del self._indexes[user_id]
+            return None
+        self._indexes.move_to_end(user_id)
+        return index
+
+    def put(self, user_id: int, index: TrigramIndex) -> None:
+        """
+        The put function caches the freshly built index of a user and evicts the least recently used ones.
+
+        :param user_id: int: The owner of the contacts
+        :param index: TrigramIndex: The index built from the database
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._indexes[user_id] = (time.monotonic() + self.ttl, index)
+        self._indexes.move_to_end(user_id)
+        while len(self._indexes) > self.maxsize:
+            self._indexes.popitem(last=False)
+
+    def invalidate(self, user_id: int | None) -> None:
+        """
+        The invalidate function drops the index of a user whose contacts have changed.
+
+        :param user_id: int | None: The owner of the contacts
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._indexes.pop(user_id, None)
+
+
+contact_search_indexes = ContactSearchIndexes(settings.search_index_users, settings.search_index_ttl)
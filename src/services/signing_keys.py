@@ -0,0 +1,315 @@
+"""
+Signing keys of the JWTs.
+
+A rotation takes two steps. First publish a new key, which goes into the JWKS but does not sign yet:
+    python -m src.services.signing_keys <key dir> [--algorithm RS256|ES256] --notify
+Then, once the verifiers have fetched the new JWKS (jwks_max_age after the first step at the latest), make it sign:
+    python -m src.services.signing_keys <key dir> --activate <kid> --notify
+--notify makes every running worker read the keys again, through Redis.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+from redis.asyncio import Redis
+
+from src.config.config import settings
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+ASYMMETRIC_PREFIXES = ("RS", "ES")
+# The file of key_dir holding the active kid, written by activate_key.
+ACTIVE_FILE = "active"
+
+
+class KeyRing:
+    """
+    Signs and verifies the JWTs of the application.
+
+    With an RS*/ES* algorithm the tokens are signed with the private key of the active kid, written in the token header,
+    and the public keys of every kid in key_dir are published as a JWKS, so other services can verify the tokens
+    without calling this application or sharing a secret. Each key is a PEM file named <kid>.pem.
+    The active kid is active_kid when it is pinned, else the kid in the ACTIVE_FILE of key_dir,
+    else the greatest kid.
+
+    Rotation: publish the new key (generate_key leaves the active kid as it is), wait until the verifiers have
+    fetched the JWKS, make it active (activate_key), and delete the old key once the tokens it signed have expired.
+    After each step, a message on the Redis channel CHANNEL (python -m src.services.signing_keys --notify,
+    or notify_reload) makes every worker reload the key files without a restart.
+
+    With any other algorithm the tokens are signed with the shared secret, as before, and the JWKS is empty.
+    The keys are read on first use, so importing the module does not touch the key files.
+
+    Methods:
+    encode(claims: dict) -> str:
+    Sign the claims with the active key.
+    decode(token: str) -> dict:
+    Verify a token with the key of its kid and return its claims.
+    jwks() -> bytes:
+    Return the serialized JWKS of the public keys.
+    reload() -> None:
+    Read the keys again.
+    start(redis: Redis) -> None:
+    Reload the keys when a message is published on CHANNEL.
+    stop() -> None:
+    Cancel the subscription.
+    """
+
+    CHANNEL = "signing_keys"
+
+    def __init__(self, algorithm: str, secret: str, key_dir: str | None = None, active_kid: str | None = None):
+        self.algorithm = algorithm
+        self.secret = secret
+        self.key_dir = key_dir
+        self.active_kid = active_kid
+        self.asymmetric = algorithm.startswith(ASYMMETRIC_PREFIXES)
+        self._private: Key | None = None
+        self._kid: str | None = None
+        self._public: dict[str, Key] = {}
+        self._jwks = b'{"keys":[]}'
+        self._etag = '"empty"'
+        self._loaded = False
+        self._listener: asyncio.Task | None = None
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.reload()
+
+    @property
+    def kid(self) -> str | None:
+        self._ensure_loaded()
+        return self._kid
+
+    @property
+    def etag(self) -> str:
+        self._ensure_loaded()
+        return self._etag
+
+    def reload(self) -> None:
+        """
+        The reload function reads the PEM files of key_dir, prepares the jose keys once
+        and serializes the JWKS, so neither signing nor the JWKS endpoint parse anything per request.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if not self.asymmetric:
+            self._loaded = True
+            return
+        if not self.key_dir:
+            raise ValueError(f"The {self.algorithm} algorithm needs a jwt_key_dir")
+        files = {path.stem: path for path in sorted(Path(self.key_dir).glob("*.pem"))}
+        kid = self.active_kid or read_active_kid(self.key_dir) or max(files, default=None)
+        if kid not in files:
+            raise ValueError(f"No signing key {kid!r} in {self.key_dir}")
+        public, keys = {}, []
+        for name, path in files.items():
+            private_key = serialization.load_pem_private_key(path.read_bytes(), password=None)
+            public_pem = private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                               serialization.PublicFormat.SubjectPublicKeyInfo)
+            public[name] = jwk.construct(public_pem, self.algorithm)
+            keys.append(dict(public[name].to_dict(), kid=name, use="sig"))
+            if name == kid:
+                self._private = jwk.construct(path.read_bytes(), self.algorithm)
+        self._public, self._kid = public, kid
+        self._jwks = json.dumps({"keys": keys}, separators=(",", ":")).encode()
+        self._etag = '"' + hashlib.sha256(self._jwks).hexdigest()[:16] + '"'
+        self._loaded = True
+
+    def encode(self, claims: dict) -> str:
+        """
+        The encode function signs the claims of a token.
+
+        :param claims: dict: The claims
+        :return: The encoded token, with the kid of the key in its header
+        :doc-author: OSA
+        """
+        if not self.asymmetric:
+            return jwt.encode(claims, self.secret, algorithm=self.algorithm)
+        self._ensure_loaded()
+        return jwt.encode(claims, self._private, algorithm=self.algorithm, headers={"kid": self._kid})
+
+    def decode(self, token: str) -> dict:
+        """
+        The decode function verifies the signature and the expiry of a token with the key named by its kid.
+
+        :param token: str: The encoded token
+        :return: The claims of the token
+        :doc-author: OSA
+        """
+        if not self.asymmetric:
+            return jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        self._ensure_loaded()
+        key = self._public.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+    def jwks(self) -> bytes:
+        """
+        The jwks function returns the JSON Web Key Set of the public keys, serialized once per reload.
+
+        :return: The JWKS as JSON bytes
+        :doc-author: OSA
+        """
+        self._ensure_loaded()
+        return self._jwks
+
+    async def _listen(self, redis: Redis) -> None:
+        """
+        The _listen function reloads the keys whenever a reload is published.
+        A failed reload is logged and the current keys stay in use.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(self.CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    self.reload()
+                    logger.info(f"Signing keys reloaded, active kid {self._kid}")
+                except Exception as error:
+                    logger.error(f"Signing keys not reloaded, the current ones stay in use: {error}")
+        finally:
+            await pubsub.unsubscribe(self.CHANNEL)
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function subscribes to the reload messages of the key rotation.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self.asymmetric and self._listener is None:
+            self._listener = asyncio.create_task(self._listen(redis))
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the subscription.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+
+async def notify_reload(redis: Redis) -> int:
+    """
+    The notify_reload function asks every running worker to read the signing keys again.
+
+    :param redis: Redis: A Redis client
+    :return: The number of workers that received the message
+    :doc-author: OSA
+    """
+    return await redis.publish(KeyRing.CHANNEL, "reload")
+
+
+def read_active_kid(key_dir: str) -> str | None:
+    """
+    The read_active_kid function returns the kid activated in key_dir.
+
+    :param key_dir: str: The directory of the keys
+    :return: The active kid, or None when no key was activated
+    :doc-author: OSA
+    """
+    path = Path(key_dir, ACTIVE_FILE)
+    if not path.exists():
+        return None
+    return path.read_text().strip() or None
+
+
+def _write_active_kid(key_dir: str, kid: str) -> None:
+    path = Path(key_dir, ACTIVE_FILE)
+    temporary = path.with_name(ACTIVE_FILE + ".tmp")
+    temporary.write_text(kid + "\n")
+    os.replace(temporary, path)
+
+
+def activate_key(key_dir: str, kid: str, min_age: float = 0) -> None:
+    """
+    The activate_key function makes a published key sign the new tokens, once the workers reload the keys.
+
+    :param key_dir: str: The directory of the keys
+    :param kid: str: The kid of the key
+    :param min_age: float: How long, in seconds, the key must have been in key_dir, usually jwks_max_age,
+        so that every verifier has fetched it before it signs
+    :return: Nothing
+    :raises ValueError: When the key does not exist or was published less than min_age ago
+    :doc-author: OSA
+    """
+    path = Path(key_dir, f"{kid}.pem")
+    if not path.exists():
+        raise ValueError(f"No signing key {kid!r} in {key_dir}")
+    wait = path.stat().st_mtime + min_age - time.time()
+    if wait > 0:
+        raise ValueError(f"Key {kid!r} was published too recently, the verifiers may not know it for {wait:.0f}s")
+    _write_active_kid(key_dir, kid)
+
+
+def generate_key(key_dir: str, algorithm: str = "RS256") -> str:
+    """
+    The generate_key function writes a new private key to key_dir, named after the current time,
+    so it is the greatest kid. The key is only published: the active kid is written down first if it was implied,
+    so it keeps signing until activate_key. The first key of key_dir is active at once.
+
+    :param key_dir: str: The directory of the keys
+    :param algorithm: str: RS256 for a 2048-bit RSA key, ES256 for a P-256 key
+    :return: The kid of the new key
+    :doc-author: OSA
+    """
+    if algorithm.startswith("RS"):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    kid = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    path = Path(key_dir, f"{kid}.pem")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if read_active_kid(key_dir) is None:
+        _write_active_kid(key_dir, max((key.stem for key in path.parent.glob("*.pem")), default=kid))
+    path.write_bytes(private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                               serialization.NoEncryption()))
+    path.chmod(0o600)
+    return kid
+
+
+key_ring = KeyRing(settings.algorithm, settings.secret_key, settings.jwt_key_dir, settings.jwt_active_kid)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish a new JWT signing key, or activate a published one")
+    parser.add_argument("key_dir")
+    parser.add_argument("--algorithm", default="RS256", choices=["RS256", "ES256"])
+    parser.add_argument("--activate", metavar="KID", help="make a published key sign instead of generating one")
+    parser.add_argument("--force", action="store_true",
+                        help="activate a key published less than jwks_max_age seconds ago")
+    parser.add_argument("--notify", action="store_true", help="make the running workers reload the keys")
+    args = parser.parse_args()
+    if args.activate:
+        try:
+            activate_key(args.key_dir, args.activate, 0 if args.force else settings.jwks_max_age)
+        except ValueError as error:
+            parser.exit(1, f"{error}\n")
+        print(f"{args.activate} is active")
+    else:
+        print(generate_key(args.key_dir, args.algorithm))
+    if args.notify:
+        client = Redis(host=settings.redis_host, port=settings.redis_port)
+        print(f"reloaded by {asyncio.run(notify_reload(client))} workers")
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+
+from redis.asyncio import Redis
+
+from src.config.config import settings
+
+
+class AccessTokenCache:
+    """
+    Keeps the claims of recently verified access tokens, so a token reused across many requests
+    has its signature checked once instead of on every request.
+
+    Attributes:
+    CHANNEL (str): The Redis pub/sub channel announcing revocations to the other workers.
+    KEY (str): The prefix of the Redis keys holding the revocations, read by workers that start later.
+    node_id (str): A unique id of this worker, used to skip its own pub/sub messages.
+
+    Entries are keyed by the SHA-256 digest of the token, never by the token itself, and expire with the token.
+    Revoking a subject (a user on ban, or one session on logout) rejects every token of that subject
+    issued before the revocation, cached or not, for as long as an access token can live.
+
+    Methods:
+    get(token: str) -> dict | None:
+    Return the cached claims of a token that has not expired.
+    put(token: str, claims: dict) -> None:
+    Cache the claims of a verified token.
+    is_revoked(claims: dict) -> bool:
+    Check if the token was issued before a revocation of its user or session.
+    revoke(subject: str) -> None:
+    Revoke the tokens of a subject on every worker.
+    start(redis: Redis) -> None:
+    Load the current revocations and subscribe to the new ones.
+    stop() -> None:
+    Cancel the subscription.
+    """
+
+    CHANNEL = "token_revocations"
+    KEY = "token_revoked:"
+
+    def __init__(self, maxsize: int, revocation_ttl: int):
+        self.node_id = uuid.uuid4().hex
+        self.maxsize = maxsize
+        self.revocation_ttl = revocation_ttl
+        self._claims: OrderedDict[bytes, dict] = OrderedDict()
+        # Ordered by revocation time, so the expired revocations are dropped from the front on every insert.
+        self._revoked: OrderedDict[str, int] = OrderedDict()
+        self._redis: Redis | None = None
+        self._listener: asyncio.Task | None = None
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        """
+        The get function returns the claims of a token verified before, while the token has not expired.
+
+        :param token: str: The encoded access token
+        :return: The claims, or None when the token has to be verified
+        :doc-author: OSA
+        """
+        digest = self._digest(token)
+        claims = self._claims.get(digest)
+        if claims is None:
+            return None
+        if claims["exp"] <= time.time():
+            del self._claims[digest]
+            return None
+        self._claims.move_to_end(digest)
+        return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        """
+        The put function caches the claims of a verified token and evicts the least recently used ones.
+
+        :param token: str: The encoded access token
+        :param claims: dict: Its verified claims, with an exp
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self.maxsize <= 0:
+            return
+        digest = self._digest(token)
+        self._claims[digest] = claims
+        self._claims.move_to_end(digest)
+        while len(self._claims) > self.maxsize:
+            self._claims.popitem(last=False)
+
+    def is_revoked(self, claims: dict) -> bool:
+        """
+        The is_revoked function checks if a token was issued before the last revocation of its user (sub)
+        or of its session (sid).
+        iat has a one second resolution, so a token issued in the same second as the revocation is rejected too.
+
+        :param claims: dict: The claims of the token
+        :return: True if the token must be rejected
+        :doc-author: OSA
+        """
+        for subject in (claims.get("sub"), claims.get("sid")):
+            revoked_at = self._revoked.get(subject)
+            if revoked_at is None:
+                continue
+            if revoked_at + self.revocation_ttl < time.time():
+                self._revoked.pop(subject, None)
+                continue
+            if claims.get("iat", 0) <= revoked_at:
+                return True
+        return False
+
+    def _remember(self, subject: str, revoked_at: int) -> None:
+        """
+        The _remember function records a revocation and drops the ones older than an access token can live,
+        so revocations of sessions that are never seen again do not pile up.
+
+        :param subject: str: The sub or sid claim
+        :param revoked_at: int: The revocation time, in seconds since the epoch
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._revoked[subject] = max(self._revoked.get(subject, 0), revoked_at)
+        self._revoked.move_to_end(subject)
+        expired = time.time() - self.revocation_ttl
+        while self._revoked and next(iter(self._revoked.values())) < expired:
+            self._revoked.popitem(last=False)
+
+    async def revoke(self, subject: str) -> None:
+        """
+        The revoke function rejects every token of a subject issued until now, on every worker.
+
+        :param subject: str: The sub claim, i.e. the email of the user, or the sid claim of a session
+        :return: Nothing
+        :doc-author: OSA
+        """
+        revoked_at = int(time.time())
+        self._remember(subject, revoked_at)
+        if self._redis is None:
+            return
+        await self._redis.set(self.KEY + subject, revoked_at, ex=self.revocation_ttl)
+        await self._redis.publish(self.CHANNEL, json.dumps({"sub": subject, "at": revoked_at, "node": self.node_id}))
+
+    async def _listen(self) -> None:
+        """
+        The _listen function applies the revocations published by the other workers.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = json.loads(message["data"])
+                if data.get("node") != self.node_id:
+                    self._remember(data["sub"], data["at"])
+        finally:
+            await pubsub.unsubscribe(self.CHANNEL)
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function loads the revocations still in force and subscribes to the new ones.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+        revocations = {}
+        async for key in redis.scan_iter(match=self.KEY + "*"):
+            value = await redis.get(key)
+            if value is not None:
+                revocations[key[len(self.KEY):]] = int(value)
+        for subject, revoked_at in sorted(revocations.items(), key=lambda item: item[1]):
+            self._remember(subject, revoked_at)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the Redis subscription.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        self._redis = None
+
+
+token_cache = AccessTokenCache(settings.token_cache_size, settings.access_token_expire_minutes * 60)
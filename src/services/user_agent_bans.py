@@ -0,0 +1,338 @@
+import asyncio
+import json
+import re
+import uuid
+from collections import OrderedDict, deque
+from typing import Iterable
+
+from redis.asyncio import Redis
+
+from src.config.config import settings
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+GLOBAL_FLAGS = re.compile(r"^\(\?([imsx]+)\)")
+
+
+class AhoCorasick:
+    """
+    An Aho-Corasick automaton that finds whether a text contains any of a set of literal words.
+    A search walks the text once, so its cost depends on the length of the text, not on the number of words.
+
+    Methods:
+    search(text: str) -> bool:
+    Check if the text contains one of the words.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._match: list[bool] = [False]
+        for word in words:
+            state = 0
+            for char in word:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._match.append(False)
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._match[state] = True
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._match[child] = self._match[child] or self._match[self._fail[child]]
+
+    def search(self, text: str) -> bool:
+        """
+        The search function checks if the text contains one of the words of the automaton.
+
+        :param text: str: The text to scan
+        :return: True on the first word found
+        :doc-author: OSA
+        """
+        goto, fail, match = self._goto, self._fail, self._match
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if match[state]:
+                return True
+        return False
+
+
+class InvalidRules(re.error):
+    """
+    Raised when ban rules are not valid regular expressions or contain capturing groups.
+
+    Attributes:
+    errors (dict[str, str]): The error of every invalid rule.
+    """
+
+    def __init__(self, errors: dict[str, str]):
+        super().__init__("; ".join(f"{rule}: {error}" for rule, error in errors.items()))
+        self.errors = errors
+
+
+def scoped_pattern(rule: str) -> str:
+    """
+    The scoped_pattern function compiles a regular expression rule on its own and returns it as a group
+    that can be merged with the other rules. A leading global flag such as (?i) becomes a scoped flag,
+    so it only applies to its own rule. Capturing groups are refused: in the merged alternation they would be
+    renumbered, breaking backreferences, and two rules using the same group name could not be compiled together.
+
+    :param rule: str: The rule
+    :return: The rule as a non-capturing group
+    :doc-author: OSA
+    """
+    flags = GLOBAL_FLAGS.match(rule)
+    pattern = f"(?{flags.group(1)}:{rule[flags.end():]})" if flags else f"(?:{rule})"
+    if re.compile(pattern).groups:
+        raise re.error("capturing groups are not allowed, use (?:...)")
+    return pattern
+
+
+def invalid_rules(rules: Iterable[str]) -> dict[str, str]:
+    """
+    The invalid_rules function checks every rule on its own.
+
+    :param rules: Iterable[str]: The rules
+    :return: The error of every invalid rule, empty when they are all valid
+    :doc-author: OSA
+    """
+    errors = {}
+    for rule in rules:
+        if rule and not REGEX_CHARS.isdisjoint(rule):
+            try:
+                scoped_pattern(rule)
+            except re.error as error:
+                errors[rule] = str(error)
+    return errors
+
+
+def compile_rules(rules: Iterable[str]) -> tuple[AhoCorasick | None, re.Pattern | None]:
+    """
+    The compile_rules function splits the ban rules into literal substrings, matched by one Aho-Corasick automaton,
+    and regular expressions, checked one by one and merged into one alternation compiled once.
+
+    :param rules: Iterable[str]: The rules, each one a regular expression searched in the User-Agent
+    :return: The automaton and the combined pattern, None when there is no rule of that kind
+    :raises InvalidRules: When a rule is invalid
+    :doc-author: OSA
+    """
+    literals, patterns, errors = set(), [], {}
+    for rule in rules:
+        if not rule:
+            continue
+        if REGEX_CHARS.isdisjoint(rule):
+            literals.add(rule)
+            continue
+        try:
+            patterns.append(scoped_pattern(rule))
+        except re.error as error:
+            errors[rule] = str(error)
+    if errors:
+        raise InvalidRules(errors)
+    return (AhoCorasick(sorted(literals)) if literals else None,
+            re.compile("|".join(patterns)) if patterns else None)
+
+
+class UserAgentBans:
+    """
+    Decides if a User-Agent is banned.
+
+    Attributes:
+    CHANNEL (str): The Redis pub/sub channel announcing a change of the rules.
+    KEY (str): The Redis set holding the rules added at runtime.
+    node_id (str): A unique id of this worker, used to skip its own pub/sub messages.
+
+    The rules of the configuration and of the Redis set are compiled together, and the verdicts are kept
+    in an LRU keyed by the User-Agent string, so a request from a known client costs one dict lookup
+    whatever the number of rules.
+
+    Methods:
+    load(rules: Iterable[str]) -> None:
+    Compile and swap in a new list of rules.
+    is_banned(user_agent: str | None) -> bool:
+    Check a User-Agent against the rules.
+    add_rules(rules: Iterable[str]) -> None:
+    Store rules in Redis and reload every worker.
+    remove_rules(rules: Iterable[str]) -> None:
+    Remove rules from Redis and reload every worker.
+    reload() -> None:
+    Recompile the configured rules together with the rules stored in Redis.
+    start(redis: Redis) -> None:
+    Load the Redis rules and subscribe to their changes.
+    stop() -> None:
+    Cancel the subscription.
+    """
+
+    CHANNEL = "user_agent_bans"
+    KEY = "user_agent_bans"
+
+    def __init__(self, rules: Iterable[str], cache_size: int):
+        self.node_id = uuid.uuid4().hex
+        self.base_rules = list(rules)
+        self.cache_size = cache_size
+        self.rules: list[str] = []
+        self._literals: AhoCorasick | None = None
+        self._pattern: re.Pattern | None = None
+        self._verdicts: OrderedDict[str, bool] = OrderedDict()
+        self._redis: Redis | None = None
+        self._listener: asyncio.Task | None = None
+        self.load(self.base_rules)
+
+    def load(self, rules: Iterable[str]) -> None:
+        """
+        The load function compiles a new list of rules and replaces the current one.
+        Nothing changes when a rule is invalid.
+
+        :param rules: Iterable[str]: The new rules
+        :return: Nothing
+        :raises InvalidRules: When a rule is invalid
+        :doc-author: OSA
+        """
+        rules = sorted(set(rules))
+        self._literals, self._pattern = compile_rules(rules)
+        self.rules = rules
+        self._verdicts = OrderedDict()
+
+    def _match(self, user_agent: str) -> bool:
+        if self._literals is not None and self._literals.search(user_agent):
+            return True
+        return self._pattern is not None and self._pattern.search(user_agent) is not None
+
+    def is_banned(self, user_agent: str | None) -> bool:
+        """
+        The is_banned function checks if a User-Agent matches one of the ban rules.
+        A request without a User-Agent header is not banned.
+
+        :param user_agent: str | None: The value of the User-Agent header
+        :return: True if the client is banned
+        :doc-author: OSA
+        """
+        if not user_agent:
+            return False
+        verdict = self._verdicts.get(user_agent)
+        if verdict is not None:
+            self._verdicts.move_to_end(user_agent)
+            return verdict
+        verdict = self._match(user_agent)
+        self._verdicts[user_agent] = verdict
+        if len(self._verdicts) > self.cache_size:
+            self._verdicts.popitem(last=False)
+        return verdict
+
+    async def reload(self) -> None:
+        """
+        The reload function recompiles the configured rules together with the rules stored in Redis.
+        A stored rule that is invalid (e.g. stored by an older version) is skipped and logged.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        stored = await self._redis.smembers(self.KEY) if self._redis is not None else set()
+        errors = invalid_rules(stored)
+        for rule, error in errors.items():
+            logger.warning(f"Skipping the invalid User-Agent ban rule {rule!r}: {error}")
+        self.load([*self.base_rules, *(rule for rule in stored if rule not in errors)])
+
+    async def _change(self, command: str, rules: Iterable[str]) -> None:
+        """
+        The _change function updates the Redis set of rules, reloads this worker and notifies the others.
+
+        :param command: str: Either &quot;sadd&quot; or &quot;srem&quot;
+        :param rules: Iterable[str]: The changed rules
+        :return: Nothing
+        :raises InvalidRules: When a new rule is invalid, nothing is changed then
+        :doc-author: OSA
+        """
+        rules = list(rules)
+        if command == "sadd":
+            errors = invalid_rules(rules)
+            if errors:
+                raise InvalidRules(errors)
+        if self._redis is None:
+            self.load(set(self.rules).union(rules) if command == "sadd" else set(self.rules).difference(rules))
+            return
+        if rules:
+            await getattr(self._redis, command)(self.KEY, *rules)
+        await self.reload()
+        await self._redis.publish(self.CHANNEL, json.dumps({"node": self.node_id}))
+
+    async def add_rules(self, rules: Iterable[str]) -> None:
+        """
+        The add_rules function bans the User-Agents matching new rules on every worker.
+        Every rule is checked before any is stored.
+
+        :param rules: Iterable[str]: The new rules
+        :return: Nothing
+        :raises InvalidRules: When a rule is not a valid regular expression or has capturing groups
+        :doc-author: OSA
+        """
+        await self._change("sadd", rules)
+
+    async def remove_rules(self, rules: Iterable[str]) -> None:
+        """
+        The remove_rules function drops rules added at runtime on every worker.
+        The rules of the configuration can only be removed from the configuration.
+
+        :param rules: Iterable[str]: The rules to remove
+        :return: Nothing
+        :doc-author: OSA
+        """
+        await self._change("srem", rules)
+
+    async def _listen(self) -> None:
+        """
+        The _listen function reloads the rules when another worker changes them.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                if json.loads(message["data"]).get("node") != self.node_id:
+                    await self.reload()
+        finally:
+            await pubsub.unsubscribe(self.CHANNEL)
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function loads the rules stored in Redis and subscribes to their changes.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+        await self.reload()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """
+        The stop function cancels the Redis subscription.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        self._redis = None
+
+
+user_agent_bans = UserAgentBans(settings.user_agent_ban_rules, settings.user_agent_cache_size)
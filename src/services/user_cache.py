@@ -0,0 +1,211 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from redis.asyncio import Redis
+
+from src.config.config import settings
+from src.database.models import User
+
+
+class UserCache:
+    """
+    Caches the users resolved by get_current_user, keyed by the sub claim (the email) of the token.
+
+    The local tier is a TTL + LRU dictionary of the worker, the optional Redis tier is shared by all workers.
+    Invalidations are published on a Redis channel so the other workers drop their local copies too.
+    Password hashes and refresh tokens are never cached.
+
+    Attributes:
+    CHANNEL (str): The Redis pub/sub channel of the invalidations.
+    hits (int): Requests answered by the local tier.
+    redis_hits (int): Requests answered by the Redis tier.
+    misses (int): Requests that had to go to the database.
+
+    Methods:
+    get(email: str) -> User | None:
+    Return a detached copy of the cached user or None.
+    set(user: User) -> None:
+    Put a user into both tiers.
+    invalidate(email: str) -> None:
+    Drop a user from both tiers on every worker.
+    stats() -> dict:
+    Return the hit/miss counters.
+    """
+
+    CHANNEL = "user_cache"
+    EXCLUDED = ("password", "refresh_token")
+
+    def __init__(self, maxsize: int, ttl: float, redis_ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.node_id = uuid.uuid4().hex
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self._local: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._redis: Redis | None = None
+        self._listener: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(email: str) -> str:
+        return f"user:{email}"
+
+    @classmethod
+    def _to_dict(cls, user: User) -> dict:
+        """
+        The _to_dict function turns a user into a JSON friendly dictionary of its columns.
+
+        :param user: User: The user to cache
+        :return: A dictionary of the cached columns
+        :doc-author: OSA
+        """
+        data = {}
+        for column in User.__table__.columns:
+            if column.key in cls.EXCLUDED:
+                continue
+            value = getattr(user, column.key)
+            data[column.key] = value.isoformat() if isinstance(value, datetime) else value
+        return data
+
+    @staticmethod
+    def _to_user(data: dict) -> User:
+        """
+        The _to_user function builds a new, detached User from a cached dictionary,
+        so that requests never share one mutable object.
+
+        :param data: dict: The cached columns
+        :return: A transient User object
+        :doc-author: OSA
+        """
+        data = dict(data)
+        if data.get("created_at"):
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return User(**data)
+
+    def _remember(self, email: str, data: dict) -> None:
+        self._local[email] = (time.monotonic() + self.ttl, data)
+        self._local.move_to_end(email)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    async def get(self, email: str) -> User | None:
+        """
+        The get function looks a user up in the local tier, then in the Redis tier.
+
+        :param email: str: The sub claim of the token
+        :return: A detached copy of the user or None
+        :doc-author: OSA
+        """
+        entry = self._local.get(email)
+        if entry is not None:
+            expires, data = entry
+            if expires > time.monotonic():
+                self._local.move_to_end(email)
+                self.hits += 1
+                return self._to_user(data)
+            del self._local[email]
+        if self._redis is not None:
+            cached = await self._redis.get(self._key(email))
+            if cached is not None:
+                data = json.loads(cached)
+                self._remember(email, data)
+                self.redis_hits += 1
+                return self._to_user(data)
+        self.misses += 1
+        return None
+
+    async def set(self, user: User) -> None:
+        """
+        The set function puts a user loaded from the database into both tiers.
+
+        :param user: User: The user to cache
+        :return: Nothing
+        :doc-author: OSA
+        """
+        data = self._to_dict(user)
+        self._remember(user.email, data)
+        if self._redis is not None:
+            await self._redis.set(self._key(user.email), json.dumps(data), ex=self.redis_ttl)
+
+    async def invalidate(self, email: str | None) -> None:
+        """
+        The invalidate function drops a user whose row has changed from every tier and worker.
+
+        :param email: str | None: The email of the changed user
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if not email:
+            return
+        self._local.pop(email, None)
+        if self._redis is not None:
+            await self._redis.delete(self._key(email))
+            await self._redis.publish(self.CHANNEL, json.dumps({"email": email, "node": self.node_id}))
+
+    def clear(self) -> None:
+        """
+        The clear function empties the local tier.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._local.clear()
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the hit/miss counters of the cache.
+
+        :return: A dictionary with the counters and the size of the local tier
+        :doc-author: OSA
+        """
+        return {"hits": self.hits, "redis_hits": self.redis_hits, "misses": self.misses, "size": len(self._local)}
+
+    async def _listen(self) -> None:
+        """
+        The _listen function drops the local copies invalidated by the other workers.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = json.loads(message["data"])
+                if data.get("node") != self.node_id:
+                    self._local.pop(data.get("email"), None)
+        finally:
+            await pubsub.unsubscribe(self.CHANNEL)
+
+    async def start(self, redis: Redis) -> None:
+        """
+        The start function enables the Redis tier and the invalidation channel.
+
+        :param redis: Redis: The Redis client of the application
+        :return: Nothing
+        :doc-author: OSA
+        """
+        self._redis = redis
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """
+        The stop function disables the Redis tier.
+
+        :return: Nothing
+        :doc-author: OSA
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        self._redis = None
+
+
+user_cache = UserCache(settings.user_cache_size, settings.user_cache_ttl, settings.user_cache_redis_ttl)
@@ -1,13 +1,17 @@
+import unittest
 from datetime import datetime
 
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
 
 from main import app
-from src.database.models import Base
+from src.database.models import Base, User
 from src.database.db import get_db
+from src.services.user_cache import user_cache
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -17,6 +21,35 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The application itself talks to the same file through the async driver
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False,
+                                              expire_on_commit=False)
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    The database of the unit tests of the services: an in-memory SQLite database with the tables created
+    and the user andrii (id 1) in it, a fresh one for every test.
+
+    The async tests are unittest test cases, which pytest fixtures cannot be injected into, so they get it by
+    subclassing. Attributes: engine, session_maker, session (an open session) and user.
+    """
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.session = self.session_maker()
+        self.user = User(id=1, username="andrii", email="andrii@gmail.com", password="andrii123")
+        self.session.add(self.user)
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -36,13 +69,12 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    user_cache.clear()
 
     yield TestClient(app)
 
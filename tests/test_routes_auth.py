@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from unittest.mock import patch, MagicMock, AsyncMock
 
 import pytest
@@ -92,48 +93,40 @@ def test_login_wrong_password(client, user):
 
 
 
-def test_invalid_refresh_token(client, session, user, token, monkeypatch):
-    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
-    mock_user_by_email = AsyncMock(return_value=current_user)
-    monkeypatch.setattr("src.repository.users.get_user_by_email", mock_user_by_email)
-    mock_update_token = AsyncMock(return_value=token)
-    monkeypatch.setattr("src.repository.users.update_token", mock_update_token)
-    mock_create_access_token = AsyncMock(return_value="new-token")
-    monkeypatch.setattr("src.services.auth.Auth.create_access_token", mock_create_access_token)
-    mock_create_refresh_token = AsyncMock(return_value="new-refresh-token")
-    monkeypatch.setattr("src.services.auth.Auth.create_refresh_token", mock_create_refresh_token)
-    mock_decode_refresh_token = AsyncMock(return_value='decoded-refresh-token')
-    monkeypatch.setattr("src.services.auth.Auth.decode_refresh_token", mock_decode_refresh_token)
-    response = client.get("/api/auth/refresh_token", headers={'Authorization': f"Bearer {token}"})
-
-
-    old_tkn = current_user.refresh_token
+def login(client, user) -> dict:
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    return response.json()
+
+
+def test_invalid_refresh_token(client, user, token):
+    tokens = login(client, user)
+    headers = {'Authorization': f"Bearer {tokens['refresh_token']}"}
+    rotated = client.get("/api/auth/refresh_token", headers=headers).json()
+
+    response = client.get("/api/auth/refresh_token", headers=headers)
     logger.info(response.text)
-    assert response.json().get('refresh_token') != old_tkn
+
     assert response.status_code == 401
     assert response.json().get('detail') == "Invalid refresh token"
+    # the reuse closes the whole session, the rotated token is rejected too
+    response = client.get("/api/auth/refresh_token", headers={'Authorization': f"Bearer {rotated['refresh_token']}"})
+    assert response.status_code == 401
+    assert client.get("/api/auth/me/", headers={'Authorization': f"Bearer {rotated['access_token']}"}).status_code == 401
 
 
-def test_refresh_token(client, session, user, token, monkeypatch):
-    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
-    mock_user_by_email = AsyncMock(return_value=current_user)
-    monkeypatch.setattr("src.repository.users.get_user_by_email", mock_user_by_email)
-    mock_update_token = AsyncMock(return_value=token)
-    monkeypatch.setattr("src.repository.users.update_token", mock_update_token)
-    mock_create_access_token = AsyncMock(return_value="new-token")
-    monkeypatch.setattr("src.services.auth.Auth.create_access_token", mock_create_access_token)
-    mock_create_refresh_token = AsyncMock(return_value="new-refresh-token")
-    monkeypatch.setattr("src.services.auth.Auth.create_refresh_token", mock_create_refresh_token)
-    mock_decode_refresh_token = AsyncMock(return_value='decoded-refresh-token')
-    monkeypatch.setattr("src.services.auth.Auth.decode_refresh_token", mock_decode_refresh_token)
-    response = client.get("/api/auth/refresh_token", headers={'Authorization': f"Bearer {current_user.refresh_token}"})
+def test_refresh_token(client, user, token):
+    tokens = login(client, user)
+    response = client.get("/api/auth/refresh_token", headers={'Authorization': f"Bearer {tokens['refresh_token']}"})
     logger.info(response.text)
 
-    """return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}"""
-    assert response.json().get('access_token') == mock_create_access_token.return_value
-    assert response.json().get('refresh_token') == mock_create_refresh_token.return_value
+    assert response.status_code == 200
+    assert response.json().get('refresh_token') != tokens['refresh_token']
     assert response.json().get('token_type') == "bearer"
-
+    response = client.get("/api/auth/me/", headers={'Authorization': f"Bearer {response.json()['access_token']}"})
+    assert response.status_code == 200
 
 
 def test_confirmed_email(token, session, client, user, monkeypatch):
@@ -211,3 +204,29 @@ def test_login_email_confirmation(client, user, session):
     assert response.json().get('detail') == "Email not confirmed"
     current_user.confirmed = True
     session.commit()
+
+
+def test_logout_closes_only_its_session(client, token, user, monkeypatch):
+    monkeypatch.setattr("src.services.token_cache.token_cache._revoked", OrderedDict())
+    tokens, other = login(client, user), login(client, user)
+    headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+    assert client.get("/api/auth/me/", headers=headers).status_code == 200
+
+    response = client.post("/api/auth/logout", headers=headers)
+
+    assert response.status_code == 204
+    assert client.get("/api/auth/me/", headers=headers).status_code == 401
+    response = client.get("/api/auth/refresh_token", headers={'Authorization': f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401
+    response = client.get("/api/auth/refresh_token", headers={'Authorization': f"Bearer {other['refresh_token']}"})
+    assert response.status_code == 200
+
+
+def test_jwks_is_cacheable(client):
+    response = client.get("/.well-known/jwks.json")
+
+    assert response.status_code == 200
+    assert "keys" in response.json()
+    assert "max-age" in response.headers["cache-control"]
+    response = client.get("/.well-known/jwks.json", headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
@@ -1,9 +1,11 @@
+import asyncio
 import sqlite3
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 import pytest
 from contextlib import contextmanager
 from src.database.models import User
+from src.services.contact_cache import contact_cache
 from src.services.email_service import auth_service
 from src.logger import get_logger
 
@@ -77,5 +79,27 @@ async def test_read_contacts(client, token):
         assert "id" in data[0]
 
 
+
+def test_bday_contacts_conditional_request(client, token, monkeypatch):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/bday_soon", params={"days": 7}, headers=headers)
+    assert response.status_code == 200, response.text
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+
+    find_contacts_bday = AsyncMock(return_value=[])
+    monkeypatch.setattr("src.repository.contacts.find_contacts_bday", find_contacts_bday)
+    response = client.get("/api/contacts/bday_soon", params={"days": 7}, headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 304
+    find_contacts_bday.assert_not_awaited()
+
+    user_id = client.get("/api/auth/me/", headers=headers).json()["id"]
+    asyncio.run(contact_cache.bump(user_id))
+    response = client.get("/api/contacts/bday_soon", params={"days": 7}, headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    find_contacts_bday.assert_awaited_once()
+
+
 if __name__ == '__main__':
     pytest.main()
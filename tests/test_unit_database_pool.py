@@ -0,0 +1,76 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.config.config import Settings
+from src.database.pool import Histogram, PoolMonitor, TimedQueuePool, engine_options
+
+
+class TestEngineOptions(unittest.TestCase):
+
+    def test_postgres_pool(self):
+        options = engine_options(Settings(sqlalchemy_database_url="postgresql+asyncpg://u:p@db/app",
+                                          db_pool_size=7, db_statement_timeout_ms=5000))
+        self.assertIs(options["poolclass"], TimedQueuePool)
+        self.assertEqual(options["pool_size"], 7)
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertEqual(options["connect_args"], {"server_settings": {"statement_timeout": "5000"}})
+
+    def test_pgbouncer_disables_prepared_statement_cache(self):
+        options = engine_options(Settings(sqlalchemy_database_url="postgresql+asyncpg://u:p@db/app",
+                                          db_pgbouncer=True))
+        self.assertEqual(options["connect_args"]["statement_cache_size"], 0)
+        self.assertEqual(options["connect_args"]["prepared_statement_cache_size"], 0)
+        self.assertNotIn("server_settings", options["connect_args"])
+        name = options["connect_args"]["prepared_statement_name_func"]
+        self.assertNotEqual(name(), name())
+
+    def test_sqlite_keeps_defaults(self):
+        self.assertEqual(engine_options(Settings(sqlalchemy_database_url="sqlite+aiosqlite:///./test.db")), {})
+
+
+class TestPoolMonitor(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.folder.name, 'pool.db')}",
+                                          poolclass=TimedQueuePool, pool_size=1, max_overflow=0)
+        self.monitor = PoolMonitor(leak_threshold=0.05)
+        self.monitor.attach(self.engine)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.folder.cleanup()
+
+    async def test_waits_are_timed(self):
+        async with self.engine.connect() as conn:
+            await conn.execute(text("select 1"))
+        stats = self.monitor.stats()
+        self.assertEqual(stats["wait"]["count"], 1)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["size"], 1)
+
+    async def test_connection_held_too_long_is_reported_once(self):
+        conn = await self.engine.connect()
+        await conn.execute(text("select 1"))
+        await asyncio.sleep(0.1)
+        self.monitor.check()
+        self.monitor.check()
+        self.assertEqual(self.monitor.leaked, 1)
+        await conn.close()
+        self.assertEqual(self.monitor.leaks(), [])
+
+    def test_histogram_is_cumulative(self):
+        histogram = Histogram((0.01, 0.1, float("inf")))
+        for value in (0.005, 0.05, 0.05, 3):
+            histogram.observe(value)
+        self.assertEqual(histogram.snapshot()["buckets"], [(0.01, 1), (0.1, 3), (float("inf"), 4)])
+        self.assertEqual(histogram.snapshot()["count"], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database.models import Base, Contact, User
+from src.database.replicas import ReplicaSet, RoutingSession, StickyWrites
+from src.repository.contacts import find_contacts
+from src.services.search import contact_search_indexes
+
+
+class TestReadReplicas(unittest.IsolatedAsyncioTestCase):
+    """The primary and the replica are two SQLite files holding different rows, to see where each query goes."""
+
+    async def asyncSetUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.primary = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.folder.name, 'primary.db')}")
+        self.replica = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.folder.name, 'replica.db')}")
+        for engine, name in ((self.primary, "primary"), (self.replica, "replica")):
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with AsyncSession(engine) as db:
+                db.add(User(id=1, username=name, email="andrii@gmail.com", password="x"))
+                await db.commit()
+        self.replicas = ReplicaSet([self.replica], max_lag=5, interval=1)
+        self.session_maker = async_sessionmaker(self.primary, sync_session_class=RoutingSession,
+                                                expire_on_commit=False)
+
+    async def asyncTearDown(self):
+        await self.replicas.stop()
+        await self.primary.dispose()
+        self.folder.cleanup()
+
+    async def username(self, db: AsyncSession) -> str:
+        return (await db.execute(select(User.username))).scalar_one()
+
+    async def test_reads_go_to_the_replica_until_the_first_write(self):
+        async with self.session_maker(info={"replica": self.replicas.choose()}) as db:
+            self.assertEqual(await self.username(db), "replica")
+            db.add(User(id=2, username="kate", email="kate@gmail.com", password="x"))
+            await db.commit()
+            self.assertEqual((await db.execute(select(User.username).where(User.id == 2))).scalar_one(), "kate")
+            self.assertEqual((await db.execute(select(User.username).where(User.id == 1))).scalar_one(), "primary")
+
+    async def test_contact_search_reads_from_the_replica(self):
+        async with AsyncSession(self.replica) as db:
+            db.add(Contact(firstname="Olena", lastname="Replica", email="olena@gmail.com", phone_number="1",
+                           date_of_birth=date(1990, 1, 1), description="", user_id=1))
+            await db.commit()
+        contact_search_indexes.invalidate(1)
+        async with self.session_maker(info={"replica": self.replicas.choose()}) as db:
+            contacts = await find_contacts(db, User(id=1), firstname="Olena")
+            self.assertEqual([contact.lastname for contact in contacts], ["Replica"])
+            self.assertIs(db.info["replica"], self.replica.sync_engine)
+            self.assertEqual(await self.username(db), "replica")
+        contact_search_indexes.invalidate(1)
+
+    async def test_lagging_replica_is_skipped(self):
+        self.replicas.record_lag(0, 30)
+        self.assertIsNone(self.replicas.choose())
+        self.replicas.record_lag(0, float((await self.replicas._measure(self.replica))))
+        self.assertIs(self.replicas.choose(), self.replica.sync_engine)
+
+    async def test_replica_down_is_measured_as_infinite_lag(self):
+        down = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.folder.name, 'missing', 'x.db')}")
+        self.assertEqual(await self.replicas._measure(down), float("inf"))
+        await down.dispose()
+
+    async def test_sticky_writes_expire(self):
+        sticky = StickyWrites(ttl=0.05)
+        await sticky.mark(1)
+        self.assertTrue(await sticky.is_sticky(1))
+        self.assertFalse(await sticky.is_sticky(2))
+        sticky._until[1] = 0
+        self.assertFalse(await sticky.is_sticky(1))
+
+    async def test_expired_marks_are_dropped(self):
+        sticky = StickyWrites(ttl=60)
+        for user_id in range(3):
+            await sticky.mark(user_id)
+        sticky._until[0] = sticky._until[1] = 0
+        await sticky.mark(1)
+        self.assertEqual(list(sticky._until), [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import logging
+import sys
+import unittest
+
+from src.logger import DebugSampler, JsonFormatter, _QueueHandler, get_logger
+
+
+def make_record(level=logging.INFO, msg="hello %s", args=("world",), lineno=10, **extra):
+    record = logging.LogRecord("src.test", level, "/app/src/test.py", lineno, msg, args, None, func="handler")
+    record.__dict__.update(extra)
+    return record
+
+
+class TestJsonFormatter(unittest.TestCase):
+
+    def test_format(self):
+        entry = json.loads(JsonFormatter().format(make_record(user_id=7)))
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], "src.test")
+        self.assertEqual(entry["message"], "hello world")
+        self.assertEqual((entry["function"], entry["line"]), ("handler", 10))
+        self.assertEqual(entry["user_id"], 7)
+        self.assertTrue(entry["time"].endswith("+00:00"))
+
+    def test_queued_exception_is_kept(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = make_record(level=logging.ERROR, exc_info=None)
+            record.exc_info = sys.exc_info()
+        queued = _QueueHandler(None).prepare(record)
+        self.assertIsNone(queued.exc_info)
+        entry = json.loads(JsonFormatter().format(queued))
+        self.assertEqual(entry["message"], "hello world")
+        self.assertIn("ValueError: boom", entry["exception"])
+
+
+class TestDebugSampler(unittest.TestCase):
+
+    def test_keeps_one_debug_record_in_every(self):
+        sampler = DebugSampler(every=3)
+        kept = [sampler.filter(make_record(level=logging.DEBUG)) for _ in range(7)]
+        self.assertEqual(kept, [True, False, False, True, False, False, True])
+        self.assertTrue(sampler.filter(make_record(level=logging.DEBUG, lineno=11)))
+        self.assertTrue(all(sampler.filter(make_record(level=logging.WARNING)) for _ in range(3)))
+
+
+class TestGetLogger(unittest.TestCase):
+
+    def test_setup_is_idempotent(self):
+        logger = get_logger("tests.idempotent")
+        self.assertIs(get_logger("tests.idempotent"), logger)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertIsInstance(logger.handlers[0], _QueueHandler)
+        self.assertIs(get_logger("tests.other").handlers[0], logger.handlers[0])
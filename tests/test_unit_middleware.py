@@ -0,0 +1,62 @@
+import unittest
+
+from fastapi.testclient import TestClient
+
+from src.middleware import AccessControlMiddleware
+from src.services.banned_ips import BannedIPSet
+from src.services.user_agent_bans import UserAgentBans
+
+
+class TestAccessControlMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.ips = BannedIPSet()
+        self.ips.load(["10.0.0.0/24"])
+        self.user_agents = UserAgentBans([r"Python-urllib"], cache_size=16)
+        self.calls = 0
+
+        async def app(scope, receive, send):
+            self.calls += 1
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        self.app = AccessControlMiddleware(app, ips=self.ips, user_agents=self.user_agents)
+
+    async def request(self, client, headers):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": headers, "client": client}
+        await self.app(scope, receive, send)
+        return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+    async def test_banned_ip_is_rejected_before_the_app(self):
+        status, body = await self.request(("10.0.0.7", 5000), [(b"user-agent", b"Mozilla/5.0")])
+        self.assertEqual(status, 403)
+        self.assertIn(b"Not allowed IP address", body)
+        self.assertEqual(self.calls, 0)
+
+    async def test_banned_user_agent_is_rejected(self):
+        status, body = await self.request(("10.0.1.7", 5000), [(b"user-agent", b"Python-urllib/3.11")])
+        self.assertEqual(status, 403)
+        self.assertIn(b"You are banned", body)
+
+    async def test_allowed_requests_reach_the_app(self):
+        self.assertEqual(await self.request(("10.0.1.7", 5000), [(b"user-agent", b"Mozilla/5.0")]), (200, b"ok"))
+        self.assertEqual(await self.request(None, []), (200, b"ok"))
+        self.assertEqual(self.calls, 2)
+
+    def test_main_app_uses_the_middleware(self):
+        from main import app
+        client = TestClient(app)
+        self.assertEqual(client.get("/", headers={"User-Agent": "Python-urllib/3.11"}).status_code, 403)
+        self.assertEqual(client.get("/", headers={"User-Agent": "Mozilla/5.0"}).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
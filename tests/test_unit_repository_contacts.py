@@ -2,9 +2,10 @@ import datetime
 import unittest
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
 
-from src.database.models import Contact, User
+from src.database.models import Base, Contact, User
 from src.schemas import ContactBase, ContactUpdate, ContactResponse
 from src.repository.contacts import (
     get_contacts,
@@ -20,29 +21,32 @@ from src.repository.contacts import (
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().offset().limit().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await get_contacts(skip=0, limit=10, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_find_contact_found(self):
         contact = Contact()
-        self.session.query().filter().filter().all.return_value = contact
+        self.session.get_bind().dialect.name = "postgresql"
+        self.result.scalars().all.return_value = contact
         result = await find_contacts(user=self.user, db=self.session, firstname="Andrii")
         print(result)
         self.assertEqual(result, contact)
@@ -64,12 +68,12 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     async def test_remove_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
@@ -93,8 +97,8 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
         contact = await create_contact(body, user=user, db=self.session)
         print(f"CONTACT:{contact.firstname}")
-        self.session.query().filter().first.return_value = contact
-        self.session.query().filter().all.return_value = user
+        self.result.scalars().first.return_value = contact
+        self.result.scalars().all.return_value = user
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=body_update, user=user, db=self.session)
         print(f"RESULT:{result.user_id}")
@@ -107,7 +111,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
                              email="test-email",
                              description="test contact",
                              date_of_birth=datetime.date(1990, 1, 1))
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
@@ -120,11 +124,75 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
                           description="test contact",
                           date_of_birth=datetime.date(1990, 7, 13))
         # self.session.query.return_value.filter.return_value.first.return_value = contact
-        self.session.query().filter().all.return_value = [contact]
+        self.result.scalars().all.return_value = [contact]
         result = await find_contacts_bday(days=7, user=self.user, db=self.session)
         self.assertEqual(result, [contact])
         self.assertEqual(result[0].firstname, contact.firstname)
 
 
+class TestContactsQueries(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(id=1, username="andrii", email="andrii@gmail.com", password="andrii123")
+        self.session.add(self.user)
+        for name, birthday in [("new-year", datetime.date(1990, 1, 2)), ("leap", datetime.date(1992, 2, 29)),
+                               ("december", datetime.date(1985, 12, 30)), ("summer", datetime.date(1990, 7, 13))]:
+            self.session.add(Contact(firstname=name, lastname="test-name", phone_number="test-phone-number",
+                                     email="test-email", description="test contact", date_of_birth=birthday,
+                                     user_id=self.user.id))
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def names(self, days, today):
+        result = await find_contacts_bday(days=days, user=self.user, db=self.session, today=today)
+        return [contact.firstname for contact in result]
+
+    async def test_window_inside_a_year(self):
+        self.assertEqual(await self.names(7, datetime.date(2023, 7, 9)), ["summer"])
+
+    async def test_window_crosses_new_year(self):
+        self.assertEqual(await self.names(7, datetime.date(2023, 12, 28)), ["december", "new-year"])
+
+    async def test_leap_day_in_common_year(self):
+        self.assertEqual(await self.names(0, datetime.date(2023, 2, 28)), ["leap"])
+        self.assertEqual(await self.names(0, datetime.date(2023, 3, 1)), [])
+
+    async def test_leap_day_in_leap_year(self):
+        self.assertEqual(await self.names(0, datetime.date(2024, 2, 28)), [])
+        self.assertEqual(await self.names(0, datetime.date(2024, 2, 29)), ["leap"])
+
+    async def test_negative_days(self):
+        self.assertEqual(await self.names(-1, datetime.date(2023, 7, 13)), [])
+
+    async def test_find_contacts_in_index(self):
+        result = await find_contacts(db=self.session, user=self.user, firstname="E")
+        self.assertEqual([c.firstname for c in result], ["new-year", "leap", "december", "summer"])
+        result = await find_contacts(db=self.session, user=self.user, firstname="mer", lastname="name")
+        self.assertEqual([c.firstname for c in result], ["summer"])
+        result = await find_contacts(db=self.session, user=self.user, firstname="ear", limit=1)
+        self.assertEqual([c.firstname for c in result], ["new-year"])
+
+    async def test_find_contacts_sees_new_contacts(self):
+        self.assertEqual(await find_contacts(db=self.session, user=self.user, firstname="autumn"), [])
+        body = ContactBase(firstname="autumn", lastname="test-name", phone_number="test-phone-number",
+                           email="test-email", description="test contact", date_of_birth=datetime.date(1990, 10, 1))
+        await create_contact(body=body, user=self.user, db=self.session)
+        result = await find_contacts(db=self.session, user=self.user, firstname="autumn")
+        self.assertEqual([c.firstname for c in result], ["autumn"])
+
+    async def test_keyset_pages(self):
+        first = await get_contacts(skip=0, limit=3, user=self.user, db=self.session)
+        second = await get_contacts(skip=0, limit=3, user=self.user, db=self.session, after_id=first[-1].id)
+        self.assertEqual([c.firstname for c in first], ["new-year", "leap", "december"])
+        self.assertEqual([c.firstname for c in second], ["summer"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,7 +2,7 @@ import datetime
 import unittest
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel, TokenModel
@@ -20,12 +20,14 @@ from src.repository.users import (
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
 
 
     async def test_get_user_by_email(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await get_user_by_email(email="andrii@gmail.com", db=self.session)
         self.assertEqual(result, user)
 
@@ -42,7 +44,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     async def test_bun_user_by_id(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.session.get.return_value = user
         result = await bun_user_by_id(user_id=1, db=self.session)
         self.assertEqual(result, user)
         self.assertTrue(result.bunned, user.bunned)
@@ -51,7 +53,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     async def test_unbun_user_by_id(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.session.get.return_value = user
         result = await unbun_user_by_id(user_id=1, db=self.session)
         self.assertEqual(result, user)
         self.assertFalse(result.bunned, user.bunned)
@@ -64,7 +66,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         user2 = User()
 
         users = [user, user2]
-        self.session.query().filter().filter().all.return_value = users
+        self.result.scalars().all.return_value = users
         # self.session.query().filter().offset().limit().all.return_value = user
         # result = get_user_by_bunned_field()
         result = True
@@ -79,7 +81,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
         user = User(id=1)
         # print(user.refresh_token)
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         self.session.commit.return_value = None
         await update_token(user=user, token=body.refresh_token, db=self.session)
         # print(user.refresh_token)
@@ -92,7 +94,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     async def test_confirmed_email(self):
         user = User(email="andrii@gmail.com", confirmed=False)
         # print(user.confirmed)
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         await confirmed_email("andrii@gmail.com", db=self.session)
         # print(user.confirmed)
         self.assertTrue(user.confirmed)
@@ -106,7 +108,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         user = User(email="andrii@gmail.com", avatar="WWW.GOOGLE.COM")
         print(user.avatar)
 
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         self.session.commit.return_value = None
         result = await update_avatar(email="andrii@gmail.com", url="https://www.facebook.com", db=self.session)
         print(result.avatar)
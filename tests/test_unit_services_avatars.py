@@ -0,0 +1,87 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from src.database.models import User
+from src.services.avatars import AvatarPipeline, LocalStorage, check_image, resize_to_webp
+from tests.conftest import DatabaseTestCase
+
+
+def image_bytes(size=(640, 480), mode="RGB", fmt="PNG") -> bytes:
+    output = io.BytesIO()
+    Image.new(mode, size, "orange").save(output, format=fmt)
+    return output.getvalue()
+
+
+class TestAvatarImages(unittest.TestCase):
+
+    def test_resize_to_square_webp(self):
+        for mode in ("RGB", "RGBA", "P", "L"):
+            with Image.open(io.BytesIO(resize_to_webp(image_bytes(mode=mode), 250))) as avatar:
+                self.assertEqual((avatar.format, avatar.size), ("WEBP", (250, 250)))
+
+    def test_check_image(self):
+        check_image(image_bytes(), 1_000_000)
+        with self.assertRaises(ValueError):
+            check_image(b"not an image", 1_000_000)
+        with self.assertRaises(ValueError):
+            check_image(image_bytes(size=(2000, 2000)), 1_000_000)
+
+    def test_local_storage_stays_in_its_directory(self):
+        with tempfile.TemporaryDirectory() as folder:
+            storage = LocalStorage(Path(folder), "/static/avatars/")
+            self.assertTrue(storage.save("Users/andrii", b"webp").startswith("/static/avatars/Users/andrii.webp?v="))
+            self.assertEqual(Path(folder, "Users", "andrii.webp").read_bytes(), b"webp")
+            with self.assertRaises(ValueError):
+                storage.save("../outside", b"webp")
+
+
+class TestAvatarPipeline(DatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.folder = tempfile.TemporaryDirectory()
+        self.pipeline = AvatarPipeline(LocalStorage(Path(self.folder.name), "/static/avatars/"), 250, 1,
+                                       session_maker=self.session_maker)
+
+    async def asyncTearDown(self):
+        await self.pipeline.stop()
+        await super().asyncTearDown()
+        self.folder.cleanup()
+
+    async def test_job_resizes_stores_and_saves_the_url(self):
+        job_id = await self.pipeline.submit("andrii@gmail.com", "Users/andrii", image_bytes())
+        self.assertEqual((await self.pipeline.status(job_id))["status"], "pending")
+        await self.pipeline.stop()
+        job = await self.pipeline.status(job_id)
+        self.assertEqual(job["status"], "done")
+        async with self.session_maker() as db:
+            user = (await db.execute(select(User))).scalar_one()
+        self.assertEqual(user.avatar, job["url"])
+        self.assertTrue(Path(self.folder.name, "Users", "andrii.webp").exists())
+
+    async def test_failed_job_is_reported(self):
+        job_id = await self.pipeline.submit("andrii@gmail.com", "Users/andrii", b"broken")
+        await self.pipeline.stop()
+        self.assertEqual((await self.pipeline.status(job_id))["status"], "failed")
+
+    async def test_uploads_beyond_max_pending_are_rejected(self):
+        self.pipeline.max_pending = 1
+        first = await self.pipeline.submit("andrii@gmail.com", "Users/andrii", image_bytes())
+        with self.assertRaises(HTTPException) as raised:
+            await self.pipeline.submit("andrii@gmail.com", "Users/andrii", image_bytes())
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(self.pipeline.rejected, 1)
+        await self.pipeline.stop()
+        self.assertEqual((await self.pipeline.status(first))["status"], "done")
+        self.assertEqual(self.pipeline.pending, 0)
+        await self.pipeline.submit("andrii@gmail.com", "Users/andrii", image_bytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import json
+import unittest
+from unittest.mock import AsyncMock
+
+from src.services.banned_ips import BannedIPSet
+
+
+class TestBannedIPSet(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.banned = BannedIPSet()
+
+    def test_load_addresses_and_ranges(self):
+        self.banned.load(["10.0.0.1", "192.168.0.0/16", "2001:db8::/32", "localhost", None])
+        self.assertTrue(self.banned.is_banned("10.0.0.1"))
+        self.assertTrue(self.banned.is_banned("192.168.12.7"))
+        self.assertTrue(self.banned.is_banned("2001:db8::1"))
+        self.assertTrue(self.banned.is_banned("::ffff:10.0.0.1"))
+        self.assertFalse(self.banned.is_banned("10.0.0.2"))
+        self.assertFalse(self.banned.is_banned("testclient"))
+        self.assertFalse(self.banned.is_banned(None))
+
+    async def test_shared_address_stays_banned(self):
+        await self.banned.ban("127.0.0.1")
+        await self.banned.ban("127.0.0.1")
+        await self.banned.unban("127.0.0.1")
+        self.assertTrue(self.banned.is_banned("127.0.0.1"))
+        await self.banned.unban("127.0.0.1")
+        self.assertFalse(self.banned.is_banned("127.0.0.1"))
+
+    async def test_unban_range(self):
+        await self.banned.ban("172.16.0.0/12")
+        self.assertTrue(self.banned.is_banned("172.20.1.1"))
+        await self.banned.unban("172.16.0.0/12")
+        self.assertFalse(self.banned.is_banned("172.20.1.1"))
+
+    async def test_changes_are_published(self):
+        redis = AsyncMock()
+        self.banned._redis = redis
+        await self.banned.ban("10.1.1.1")
+        channel, message = redis.publish.call_args.args
+        self.assertEqual(channel, BannedIPSet.CHANNEL)
+        self.assertEqual(json.loads(message), {"op": "ban", "ip": "10.1.1.1", "node": self.banned.node_id})
+
+
+if __name__ == '__main__':
+    unittest.main()
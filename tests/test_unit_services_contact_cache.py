@@ -0,0 +1,33 @@
+import unittest
+
+from src.services.contact_cache import ContactCache, etag_matches
+
+
+class TestContactCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_bump_changes_only_the_user_version(self):
+        cache = ContactCache(response_cache=False, ttl=60)
+        first, other = await cache.version(1), await cache.version(2)
+        self.assertEqual(await cache.version(1), first)
+        await cache.bump(1)
+        self.assertNotEqual(await cache.version(1), first)
+        self.assertEqual(await cache.version(2), other)
+
+    async def test_etag_depends_on_user_version_and_request(self):
+        cache = ContactCache(response_cache=False, ttl=60)
+        etag = cache.etag(1, 5, "contact:3")
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(etag, cache.etag(1, 5, "contact:3"))
+        self.assertEqual(len({etag, cache.etag(2, 5, "contact:3"), cache.etag(1, 6, "contact:3"),
+                              cache.etag(1, 5, "contact:4")}), 4)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('W/"abc"', 'W/"abc"'))
+        self.assertTrue(etag_matches('"x", "abc"', 'W/"abc"'))
+        self.assertTrue(etag_matches("*", 'W/"abc"'))
+        self.assertFalse(etag_matches('W/"abd"', 'W/"abc"'))
+        self.assertFalse(etag_matches(None, 'W/"abc"'))
+
+
+if __name__ == '__main__':
+    unittest.main()
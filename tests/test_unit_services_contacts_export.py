@@ -0,0 +1,51 @@
+import datetime
+import io
+import json
+import unittest
+
+from src.database.models import Contact, User
+from src.services.contacts_export import export_contacts
+from src.services.contacts_import import import_contacts
+from tests.conftest import DatabaseTestCase
+
+
+class TestContactsExport(DatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.other = User(id=2, username="kate", email="kate@gmail.com", password="kate123")
+        self.session.add(self.other)
+        for i in range(5):
+            self.session.add(Contact(firstname=f"first{i}", lastname="Osadchyi", phone_number="380501234567",
+                                     email=f"c{i}@gmail.com", description="friend, \"best\"; ok",
+                                     date_of_birth=datetime.date(1990, 1, i + 1), user_id=self.user.id))
+        self.session.add(Contact(firstname="hidden", lastname="x", phone_number="1", email="x@gmail.com",
+                                 description="x", date_of_birth=datetime.date(1990, 1, 1), user_id=self.other.id))
+        await self.session.commit()
+
+    async def export(self, fmt, batch_size=2):
+        chunks = [chunk async for chunk in export_contacts(fmt, self.user, self.session, batch_size)]
+        return chunks, "".join(chunks)
+
+    async def test_ndjson_streams_in_batches(self):
+        chunks, text = await self.export("ndjson")
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual([row["firstname"] for row in rows], [f"first{i}" for i in range(5)])
+        self.assertEqual(rows[0]["date_of_birth"], "1990-01-01")
+
+    async def test_vcard_escapes_text(self):
+        _, text = await self.export("vcard")
+        self.assertEqual(text.count("BEGIN:VCARD"), 5)
+        self.assertIn("N:Osadchyi;first0;;;\r\n", text)
+        self.assertIn("NOTE:friend\\, \"best\"\\; ok\r\n", text)
+        self.assertNotIn("hidden", text)
+
+    async def test_csv_export_can_be_imported_back(self):
+        _, text = await self.export("csv")
+        report = await import_contacts(io.BytesIO(text.encode()), "csv", self.other, self.session)
+        self.assertEqual((report.imported, report.failed), (5, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import io
+import json
+import threading
+import unittest
+
+from sqlalchemy import select
+
+from src.database.models import Contact
+from src.services.contacts_import import detect_format, import_contacts
+from tests.conftest import DatabaseTestCase
+
+CSV = (
+    "firstname,lastname,phone_number,email,date_of_birth,description\n"
+    "Andrii,Osadchyi,380501234567,andrii@gmail.com,1990-07-13,friend\n"
+    "Kate,Smith,380501234568,kate@gmail.com,not-a-date,colleague\n"
+    "Olena,Koval,380501234569,olena@gmail.com,1992-02-29,\"sister, \"\"Lena\"\"\"\n"
+)
+
+
+class TestContactsImport(DatabaseTestCase):
+
+    async def contacts(self):
+        result = await self.session.execute(select(Contact).order_by(Contact.id))
+        return result.scalars().all()
+
+    async def test_csv_rows_are_imported_and_errors_reported(self):
+        report = await import_contacts(io.BytesIO(CSV.encode()), "csv", self.user, self.session, batch_size=1)
+        self.assertEqual((report.imported, report.failed), (2, 1))
+        self.assertEqual(report.errors[0].row, 2)
+        self.assertTrue(report.errors[0].errors[0].startswith("date_of_birth"))
+        contacts = await self.contacts()
+        self.assertEqual([c.firstname for c in contacts], ["Andrii", "Olena"])
+        self.assertEqual(contacts[1].description, 'sister, "Lena"')
+        self.assertEqual(contacts[1].birth_md, 229)
+
+    async def test_ndjson_errors_are_capped(self):
+        good = {"firstname": "Andrii", "lastname": "Osadchyi", "phone_number": "1", "email": "a@gmail.com",
+                "date_of_birth": "1990-07-13", "description": "friend"}
+        lines = [json.dumps(good), "", "{broken", "[1, 2]", json.dumps(dict(good, firstname="x" * 51))]
+        data = "\n".join(lines).encode()
+        report = await import_contacts(io.BytesIO(data), "ndjson", self.user, self.session, max_errors=2)
+        self.assertEqual((report.imported, report.failed), (1, 3))
+        self.assertEqual([error.row for error in report.errors], [3, 4])
+        self.assertEqual(len(await self.contacts()), 1)
+
+    async def test_undecodable_file_stops_the_import(self):
+        report = await import_contacts(io.BytesIO(b"firstname\n\xff\xfe\n"), "csv", self.user, self.session)
+        self.assertEqual((report.imported, report.failed), (0, 1))
+
+    async def test_file_is_parsed_off_the_event_loop(self):
+        readers = set()
+
+        class Upload(io.BytesIO):
+            def read1(self, *args):
+                readers.add(threading.get_ident())
+                return super().read1(*args)
+
+            def read(self, *args):
+                readers.add(threading.get_ident())
+                return super().read(*args)
+
+        report = await import_contacts(Upload(CSV.encode()), "csv", self.user, self.session, batch_size=1)
+        self.assertEqual(report.imported, 2)
+        self.assertTrue(readers)
+        self.assertNotIn(threading.get_ident(), readers)
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format("contacts.CSV", None), "csv")
+        self.assertEqual(detect_format("contacts.jsonl", "application/octet-stream"), "ndjson")
+        self.assertEqual(detect_format("upload", "text/csv; charset=utf-8"), "csv")
+        self.assertIsNone(detect_format("contacts.xlsx", "application/octet-stream"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import socket
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.services.email_outbox import EmailOutbox
+from src.services.email_service import SMTPPool, render_confirmation
+from src.services.email_worker import process
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class RecordingHandler:
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("refused"):
+            return "550 no such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.sessions.add(id(session))
+        return "250 Message accepted for delivery"
+
+
+def job(email: str) -> str:
+    return json.dumps({"kind": "confirm_email", "email": email, "username": "Andrii", "host": "http://test/",
+                       "id": email, "attempts": 0})
+
+
+@unittest.skipIf(Controller is None, "aiosmtpd is not installed")
+class TestEmailDelivery(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.handler = RecordingHandler()
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=port)
+        self.controller.start()
+        self.pool = SMTPPool(1, hostname="127.0.0.1", port=port, use_tls=False, start_tls=False)
+        self.outbox = AsyncMock(spec=EmailOutbox)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        self.controller.stop()
+
+    async def test_batch_reuses_one_connection(self):
+        jobs = [job(f"user{i}@example.com") for i in range(3)]
+        self.assertEqual(await process(jobs, "test", self.outbox, self.pool), 3)
+        self.assertEqual(len(self.handler.messages), 3)
+        self.assertEqual(len(self.handler.sessions), 1)
+        self.assertEqual(self.outbox.ack.await_count, 3)
+        self.assertIn(b"api/auth/confirmed_email/", self.handler.messages[0].original_content)
+
+    async def test_failed_jobs_are_retried(self):
+        jobs = [job("refused@example.com"), job("user@example.com"), json.dumps({"kind": "unknown"})]
+        self.assertEqual(await process(jobs, "test", self.outbox, self.pool), 1)
+        self.assertEqual([c.args[1] for c in self.outbox.retry.await_args_list], [jobs[0], jobs[2]])
+        self.outbox.ack.assert_awaited_once_with("test", jobs[1])
+
+    async def test_connection_closed_by_the_server_is_replaced(self):
+        await self.pool.send(render_confirmation("user@example.com", "Andrii", "http://test/"))
+        self.pool._idle[0].close()
+        await self.pool.send(render_confirmation("user@example.com", "Andrii", "http://test/"))
+        self.assertEqual(len(self.handler.messages), 2)
+
+
+class TestEmailOutbox(unittest.IsolatedAsyncioTestCase):
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        outbox = EmailOutbox(max_attempts=5, backoff=2, backoff_max=10)
+        with patch("random.uniform", return_value=1):
+            self.assertEqual([outbox.delay(attempts) for attempts in range(1, 5)], [2, 4, 8, 10])
+
+    async def test_send_email_only_enqueues(self):
+        from src.services import email_service
+        redis = AsyncMock()
+        outbox = EmailOutbox(max_attempts=5, backoff=2, backoff_max=10)
+        await outbox.start(redis)
+        with patch.object(email_service, "email_outbox", outbox), \
+                patch.object(email_service, "deliver") as deliver:
+            await email_service.send_email("user@example.com", "Andrii", "http://test/")
+        deliver.assert_not_called()
+        key, raw = redis.lpush.await_args.args
+        self.assertEqual(key, EmailOutbox.QUEUE)
+        self.assertEqual(json.loads(raw)["email"], "user@example.com")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.services.email_templates import EmailTemplates, email_templates
+
+VALUES = {"host": "http://localhost:8000/", "username": "<b>Andrii & \"Kate\"</b>", "token": "eyJ.abc-_.xyz"}
+
+
+class TestEmailTemplates(unittest.TestCase):
+
+    def test_split_rendering_matches_jinja(self):
+        email_templates.load("email_template.html", tuple(VALUES))
+        self.assertIsNotNone(email_templates._segments["email_template.html"])
+        expected = email_templates.environment.get_template("email_template.html").render(VALUES)
+        self.assertEqual(email_templates.render("email_template.html", **VALUES), expected)
+        self.assertIn("Hi &lt;b&gt;Andrii &amp; &#34;Kate&#34;&lt;/b&gt;,", expected)
+
+    def test_template_transforming_a_variable_falls_back_to_jinja(self):
+        with tempfile.TemporaryDirectory() as folder:
+            Path(folder, "upper.html").write_text("<p>{{ username | upper }} {{ token }}</p>")
+            templates = EmailTemplates(Path(folder))
+            templates.load("upper.html", ("username", "token"))
+            self.assertIsNone(templates._segments["upper.html"])
+            self.assertEqual(templates.render("upper.html", username="kate", token="t"), "<p>KATE t</p>")
+
+
+if __name__ == '__main__':
+    unittest.main()
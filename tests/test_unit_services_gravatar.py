@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+from sqlalchemy import select
+
+from src.database.models import User
+from src.services.gravatar import GravatarResolver, gravatar_hash, gravatar_url
+from tests.conftest import DatabaseTestCase
+
+
+def response(status_code: int) -> MagicMock:
+    return MagicMock(status_code=status_code)
+
+
+class TestGravatar(DatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.session.add(User(id=2, username="kate", email="kate@gmail.com", password="x", avatar="uploaded"))
+        await self.session.commit()
+        self.resolver = GravatarResolver(negative_size=10, negative_ttl=60, timeout=1,
+                                         session_maker=self.session_maker)
+
+    async def avatars(self):
+        async with self.session_maker() as db:
+            return {user.email: user.avatar for user in (await db.execute(select(User))).scalars()}
+
+    def test_hash_is_normalised(self):
+        self.assertEqual(gravatar_hash(" Andrii@Gmail.com "), gravatar_hash("andrii@gmail.com"))
+        self.assertEqual(gravatar_url("andrii@gmail.com"),
+                         "https://www.gravatar.com/avatar/" + gravatar_hash("andrii@gmail.com"))
+
+    async def test_found_image_fills_only_missing_avatars(self):
+        with patch.object(httpx.AsyncClient, "head", AsyncMock(return_value=response(200))):
+            await self.resolver.fill_avatar("andrii@gmail.com")
+            await self.resolver.fill_avatar("kate@gmail.com")
+        self.assertEqual(await self.avatars(), {"andrii@gmail.com": gravatar_url("andrii@gmail.com"),
+                                                "kate@gmail.com": "uploaded"})
+
+    async def test_missing_image_is_cached(self):
+        head = AsyncMock(return_value=response(404))
+        with patch.object(httpx.AsyncClient, "head", head):
+            self.assertIsNone(await self.resolver.resolve("andrii@gmail.com"))
+            self.assertIsNone(await self.resolver.resolve("andrii@gmail.com"))
+        self.assertEqual(head.await_count, 1)
+
+    async def test_network_errors_are_not_cached(self):
+        head = AsyncMock(side_effect=httpx.ConnectError("down"))
+        with patch.object(httpx.AsyncClient, "head", head):
+            await self.resolver.fill_avatar("andrii@gmail.com")
+            await self.resolver.fill_avatar("andrii@gmail.com")
+        self.assertEqual(head.await_count, 2)
+        self.assertIsNone((await self.avatars())["andrii@gmail.com"])
+
+
+if __name__ == '__main__':
+    unittest.main()
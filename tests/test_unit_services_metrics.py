@@ -0,0 +1,166 @@
+import os
+import tempfile
+from datetime import date
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY, CollectorRegistry, Histogram, generate_latest
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.database.models import Base, Contact, User
+from src.database.pool import Histogram as PoolHistogram
+from src.middleware import MetricsMiddleware
+from src.repository.contacts import stream_contacts
+from src.repository.users import get_user_by_email
+from src.services import metrics
+from src.services.metrics import CounterCollector, HistogramCollector, TimedPipeline, TimedRedis
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+
+    def test_requests_are_labelled_by_route_template(self):
+        app = FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def item(item_id: int):
+            return {"id": item_id}
+
+        registry = CollectorRegistry()
+        histogram = Histogram("latency", "Latency.", ("method", "route", "status"), registry=registry)
+        app.add_middleware(MetricsMiddleware, histogram=histogram)
+        client = TestClient(app)
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/nothing")
+        self.assertEqual(registry.get_sample_value(
+            "latency_count", {"method": "GET", "route": "/items/{item_id}", "status": "200"}), 2)
+        self.assertEqual(registry.get_sample_value(
+            "latency_count", {"method": "GET", "route": MetricsMiddleware.UNMATCHED, "status": "404"}), 1)
+
+    def test_main_app_exposes_metrics(self):
+        from main import app
+        client = TestClient(app)
+        client.get("/")
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version="))
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/",status="200"}', response.text)
+        self.assertIn("# TYPE bcrypt_pool_saturation gauge", response.text)
+        self.assertIn("# TYPE bcrypt_pool_rejected_total counter", response.text)
+        self.assertIn("# TYPE db_pool_checkout_wait_seconds histogram", response.text)
+        self.assertIn("# TYPE rate_limiter_redis_seconds histogram", response.text)
+        self.assertIn("# TYPE redis_command_duration_seconds histogram", response.text)
+
+
+class TestUserCacheMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_hits_misses_and_size_are_exposed(self):
+        import src.routes.metrics  # noqa: F401, registers the component metrics
+        from src.services.user_cache import user_cache
+        user_cache.clear()
+        hits = sample("user_cache_requests_total", result="local")
+        misses = sample("user_cache_requests_total", result="miss")
+        self.assertIsNone(await user_cache.get("metrics@example.com"))
+        await user_cache.set(User(id=7, username="metrics", email="metrics@example.com", password="x"))
+        self.assertEqual((await user_cache.get("metrics@example.com")).id, 7)
+        self.assertEqual(sample("user_cache_requests_total", result="miss"), misses + 1)
+        self.assertEqual(sample("user_cache_requests_total", result="local"), hits + 1)
+        self.assertEqual(sample("user_cache_size"), 1)
+        user_cache.clear()
+
+
+class TestCollectors(unittest.TestCase):
+
+    def test_component_values_are_exposed(self):
+        registry = CollectorRegistry()
+        waits = PoolHistogram()
+        waits.observe(0.002)
+        registry.register(HistogramCollector("wait_seconds", "Waits.", waits))
+        registry.register(CounterCollector("leaked", "Leaked.", lambda: 3))
+        self.assertEqual(registry.get_sample_value("wait_seconds_count"), 1)
+        self.assertEqual(registry.get_sample_value("wait_seconds_bucket", {"le": "+Inf"}), 1)
+        self.assertEqual(registry.get_sample_value("leaked_total"), 3)
+        registry.register(CounterCollector("lookups", "Lookups.", lambda: {("hit",): 2, ("miss",): 1}, ("result",)))
+        self.assertEqual(registry.get_sample_value("lookups_total", {"result": "hit"}), 2)
+        self.assertEqual(registry.get_sample_value("lookups_total", {"result": "miss"}), 1)
+        self.assertIn(b"# TYPE leaked_total counter", generate_latest(registry))
+
+
+class TestQueryMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.folder.name, 'metrics.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        metrics.instrument_engine(self.engine)
+
+    async def asyncTearDown(self):
+        for name, listener in (("before_cursor_execute", metrics._before_cursor_execute),
+                               ("after_cursor_execute", metrics._after_cursor_execute),
+                               ("handle_error", metrics._handle_error)):
+            event.remove(self.engine.sync_engine, name, listener)
+        await self.engine.dispose()
+        self.folder.cleanup()
+
+    async def test_queries_are_attributed_to_repository_functions(self):
+        before = sample("db_queries_total", function="users.get_user_by_email")
+        others = sample("db_queries_total", function="other")
+        async with AsyncSession(self.engine) as db:
+            db.add(User(username="andrii", email="andrii@gmail.com", password="x"))
+            await db.commit()
+            self.assertEqual((await get_user_by_email("andrii@gmail.com", db)).username, "andrii")
+            await db.execute(text("SELECT 1"))
+        self.assertEqual(sample("db_queries_total", function="users.get_user_by_email"), before + 1)
+        self.assertGreater(sample("db_query_duration_seconds_count", function="users.get_user_by_email"), 0)
+        self.assertGreater(sample("db_queries_total", function="other"), others)
+        self.assertEqual(metrics.current_function.get(), "other")
+
+    async def test_queries_of_async_generators_are_attributed_to_them(self):
+        async with AsyncSession(self.engine) as db:
+            user = User(username="andrii", email="andrii@gmail.com", password="x")
+            db.add(user)
+            await db.flush()
+            db.add_all([Contact(firstname=f"a{i}", lastname="b", email=f"a{i}@example.com",
+                                phone_number=f"{i}", date_of_birth=date(1990, 1, 1), description="",
+                                user_id=user.id) for i in range(3)])
+            await db.commit()
+            await db.refresh(user)
+            before = sample("db_queries_total", function="contacts.stream_contacts")
+            batches = [batch async for batch in stream_contacts(user, db, batch_size=2)]
+        self.assertEqual(sum(map(len, batches)), 3)
+        self.assertGreater(sample("db_queries_total", function="contacts.stream_contacts"), before)
+        self.assertEqual(metrics.current_function.get(), "other")
+
+    async def test_failed_queries_do_not_skew_the_timings(self):
+        async with self.engine.connect() as conn:
+            with self.assertRaises(Exception):
+                await conn.execute(text("SELECT * FROM missing"))
+            await conn.execute(text("SELECT 1"))
+            self.assertEqual(conn.sync_connection.info["query_started"], [])
+
+
+class TestRedisMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_commands_and_pipelines_are_timed(self):
+        redis = TimedRedis()
+        commands = sample("redis_command_duration_seconds_count", command="GET")
+        pipelines = sample("redis_command_duration_seconds_count", command="PIPELINE")
+        with patch.object(Redis, "execute_command", AsyncMock(return_value=b"1")), \
+                patch.object(Pipeline, "execute", AsyncMock(return_value=[1])):
+            self.assertEqual(await redis.get("key"), b"1")
+            pipe = redis.pipeline()
+            self.assertIsInstance(pipe, TimedPipeline)
+            self.assertEqual(await pipe.execute(), [1])
+        self.assertEqual(sample("redis_command_duration_seconds_count", command="GET"), commands + 1)
+        self.assertEqual(sample("redis_command_duration_seconds_count", command="PIPELINE"), pipelines + 1)
+        await redis.close()
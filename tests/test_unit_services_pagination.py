@@ -0,0 +1,20 @@
+import unittest
+
+from src.services.pagination import encode_cursor, decode_cursor
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_round_trip(self):
+        cursor = encode_cursor(12345)
+        self.assertNotIn("12345", cursor)
+        self.assertEqual(decode_cursor(cursor), 12345)
+
+    def test_invalid_cursor(self):
+        for cursor in ["", "not-a-cursor", encode_cursor(1)[:-2], "djI6MQ"]:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import unittest
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from src.services.auth import Auth
+from src.services.password_pool import PasswordPool
+
+
+class TestPasswordPool(unittest.IsolatedAsyncioTestCase):
+
+    async def test_run_and_stats(self):
+        pool = PasswordPool(workers=2, max_queue=2)
+        result = await pool.run(lambda a, b: a + b, 1, 2)
+        self.assertEqual(result, 3)
+        self.assertEqual(pool.stats()["completed"], 1)
+        self.assertEqual(pool.stats()["queued"], 0)
+
+    async def test_full_queue_is_rejected(self):
+        pool = PasswordPool(workers=1, max_queue=1)
+        release = threading.Event()
+        jobs = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with self.assertRaises(HTTPException) as error:
+            await pool.run(release.wait)
+        self.assertEqual(error.exception.status_code, 503)
+        release.set()
+        await asyncio.gather(*jobs)
+        self.assertEqual(pool.stats()["rejected"], 1)
+        self.assertEqual(pool.stats()["max_queued"], 1)
+
+    async def test_cancelled_job_leaves_the_queue(self):
+        pool = PasswordPool(workers=1, max_queue=1)
+        release = threading.Event()
+        running = asyncio.create_task(pool.run(release.wait))
+        waiting = asyncio.create_task(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        self.assertEqual(pool.stats()["queued"], 1)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(pool.stats()["queued"], 0)
+        release.set()
+        await running
+        self.assertEqual(await pool.run(lambda: 1), 1)
+        self.assertEqual((pool.stats()["active"], pool.stats()["queued"]), (0, 0))
+
+
+class TestRehashOnLogin(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.auth = Auth()
+        self.auth.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5)
+
+    async def test_outdated_cost_is_rehashed(self):
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("andrii123")
+        verified, new_hash = await self.auth.verify_and_update_password("andrii123", old_hash)
+        self.assertTrue(verified)
+        self.assertTrue(new_hash.startswith("$2b$05$"))
+
+    async def test_current_cost_is_kept(self):
+        current_hash = await self.auth.get_password_hash("andrii123")
+        verified, new_hash = await self.auth.verify_and_update_password("andrii123", current_hash)
+        self.assertTrue(verified)
+        self.assertIsNone(new_hash)
+
+    async def test_wrong_password(self):
+        current_hash = await self.auth.get_password_hash("andrii123")
+        self.assertEqual(await self.auth.verify_and_update_password("wrongpass", current_hash), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+from redis.exceptions import ConnectionError
+
+from src.services.rate_limit import RateLimit, RateLimiterEngine
+
+
+def request(authorization: str | None = None, host: str = "10.0.0.1") -> MagicMock:
+    headers = {"authorization": authorization} if authorization else {}
+    return MagicMock(method="GET", scope={"route": MagicMock(path="/api/contacts/")}, headers=headers,
+                     client=MagicMock(host=host))
+
+
+class TestRateLimiterEngine(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.engine = RateLimiterEngine(budget=0.05, local_fraction=0.5, local_ttl=60, cache_size=100)
+        self.script = AsyncMock(return_value=[1, 9, 0])
+        redis = MagicMock(register_script=MagicMock(return_value=self.script))
+        asyncio.run(self.engine.start(redis))
+
+    async def test_not_started_lets_everything_through(self):
+        engine = RateLimiterEngine(budget=0.05, local_fraction=0.5, local_ttl=60, cache_size=100)
+        self.assertEqual(await engine.hit(["rate_limit:ip:a"], 1, 10, 5), (True, 0))
+
+    async def test_clearly_under_the_limit_is_served_locally(self):
+        for _ in range(5):
+            self.assertEqual(await self.engine.hit(["rate_limit:ip:a"], 1, 10, 5), (True, 0))
+        # 9 left after the first call, 4 served locally, the next one would leave less than half the burst
+        self.assertEqual(self.engine.local_hits, 4)
+        await self.engine.hit(["rate_limit:ip:a"], 1, 10, 5)
+        self.assertEqual(self.script.await_count, 2)
+        self.assertEqual(self.script.await_args.kwargs["args"][0], 4)
+
+    async def test_rejected_request_has_retry_after(self):
+        self.script.return_value = [0, 0, 2500]
+        self.assertEqual(await self.engine.hit(["rate_limit:ip:a"], 1, 10, 5), (False, 3))
+
+    async def test_ip_bucket_is_larger(self):
+        await self.engine.hit(["rate_limit:ip:a", "rate_limit:user:b"], 2, 10, 5)
+        self.assertEqual(self.script.await_args.kwargs["args"], [0, 0.01, 50, 0.002, 10])
+
+    async def test_fails_open_when_redis_is_slow_or_down(self):
+        async def slow(**kwargs):
+            await asyncio.sleep(1)
+
+        self.script.side_effect = slow
+        self.assertEqual(await self.engine.hit(["rate_limit:ip:a"], 1, 10, 5), (True, 0))
+        self.script.side_effect = ConnectionError("down")
+        self.assertEqual(await self.engine.hit(["rate_limit:ip:b"], 1, 10, 5), (True, 0))
+        self.assertEqual(self.engine.failures, 2)
+
+
+    async def test_decisions_are_counted(self):
+        def decisions(decision):
+            return REGISTRY.get_sample_value("rate_limiter_requests_total", {"decision": decision}) or 0
+
+        before = {decision: decisions(decision) for decision in ("allowed", "limited", "local")}
+        await self.engine.hit(["rate_limit:ip:a"], 1, 10, 5)
+        await self.engine.hit(["rate_limit:ip:a"], 1, 10, 5)
+        self.script.return_value = [0, 0, 2500]
+        await self.engine.hit(["rate_limit:ip:b"], 1, 10, 5)
+        self.assertEqual(decisions("allowed"), before["allowed"] + 1)
+        self.assertEqual(decisions("local"), before["local"] + 1)
+        self.assertEqual(decisions("limited"), before["limited"] + 1)
+
+class TestRateLimit(unittest.IsolatedAsyncioTestCase):
+
+    async def test_keys_per_ip_and_user(self):
+        engine = MagicMock(hit=AsyncMock(return_value=(True, 0)))
+        limit = RateLimit(times=20, seconds=60, engine=engine)
+        limit._user = MagicMock(return_value="andrii@gmail.com")
+        await limit(request("Bearer token"))
+        keys, rate, burst, _ = engine.hit.await_args.args
+        self.assertEqual(keys, ["rate_limit:ip:10.0.0.1:GET:/api/contacts/",
+                                "rate_limit:user:andrii@gmail.com:GET:/api/contacts/"])
+        self.assertEqual((rate, burst), (20 / 60, 20))
+
+    async def test_anonymous_request_is_limited_by_ip(self):
+        engine = MagicMock(hit=AsyncMock(return_value=(False, 7)))
+        with self.assertRaises(HTTPException) as error:
+            await RateLimit(times=2, seconds=60, burst=1, engine=engine)(request())
+        self.assertEqual(len(engine.hit.await_args.args[0]), 1)
+        self.assertEqual(error.exception.status_code, 429)
+        self.assertEqual(error.exception.headers["Retry-After"], "7")
+
+
+if __name__ == '__main__':
+    unittest.main()
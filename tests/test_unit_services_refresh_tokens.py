@@ -0,0 +1,70 @@
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.services import refresh_tokens
+from src.services.refresh_tokens import RefreshTokenStore
+
+
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.store = RefreshTokenStore(ttl=60)
+        self.revoke = AsyncMock()
+        patcher = patch.object(refresh_tokens.token_cache, "revoke", self.revoke)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_rotation_accepts_each_token_once(self):
+        sid, jti = await self.store.create("andrii@gmail.com", "Firefox")
+        new_jti = await self.store.rotate(sid, jti, "andrii@gmail.com")
+        self.assertNotIn(new_jti, (None, jti))
+        self.assertIsNotNone(await self.store.rotate(sid, new_jti, "andrii@gmail.com"))
+
+    async def test_reuse_closes_the_session(self):
+        sid, jti = await self.store.create("andrii@gmail.com", "Firefox")
+        new_jti = await self.store.rotate(sid, jti, "andrii@gmail.com")
+        self.assertIsNone(await self.store.rotate(sid, jti, "andrii@gmail.com"))
+        self.assertIsNone(await self.store.rotate(sid, new_jti, "andrii@gmail.com"))
+        self.revoke.assert_awaited_once_with(sid)
+
+    async def test_sessions_expire(self):
+        sid, jti = await self.store.create("andrii@gmail.com", "Firefox")
+        with patch.object(refresh_tokens.time, "time", return_value=time.time() + 61):
+            self.assertIsNone(await self.store.rotate(sid, jti, "andrii@gmail.com"))
+        self.revoke.assert_not_awaited()
+
+    async def test_sessions_per_device(self):
+        phone, _ = await self.store.create("andrii@gmail.com", "Android")
+        laptop, _ = await self.store.create("andrii@gmail.com", "Firefox")
+        await self.store.create("kate@gmail.com", "Safari")
+        sessions = await self.store.sessions("andrii@gmail.com")
+        self.assertEqual({session["sid"]: session["device"] for session in sessions},
+                         {phone: "Android", laptop: "Firefox"})
+        await self.store.revoke(phone)
+        self.assertEqual([session["sid"] for session in await self.store.sessions("andrii@gmail.com")], [laptop])
+        await self.store.revoke_all("andrii@gmail.com")
+        self.assertEqual(await self.store.sessions("andrii@gmail.com"), [])
+        self.assertEqual(len(await self.store.sessions("kate@gmail.com")), 1)
+
+    async def test_rotation_keeps_the_user_index_alive(self):
+        sid, jti = await self.store.create("andrii@gmail.com", "Firefox")
+        later = time.time() + 45
+        with patch.object(refresh_tokens.time, "time", return_value=later):
+            jti = await self.store.rotate(sid, jti, "andrii@gmail.com")
+        with patch.object(refresh_tokens.time, "time", return_value=later + 45):
+            self.assertEqual([session["sid"] for session in await self.store.sessions("andrii@gmail.com")], [sid])
+            await self.store.revoke_all("andrii@gmail.com")
+            self.assertIsNone(await self.store.rotate(sid, jti, "andrii@gmail.com"))
+
+    async def test_rotation_script_refreshes_the_user_set(self):
+        rotate = AsyncMock(return_value=1)
+        self.store._redis, self.store._rotate = AsyncMock(), rotate
+        await self.store.rotate("sid1", "jti1", "andrii@gmail.com")
+        keys = rotate.await_args.kwargs["keys"]
+        self.assertEqual(keys, [RefreshTokenStore.KEY + "sid1", RefreshTokenStore.USER_KEY + "andrii@gmail.com"])
+        self.assertEqual(rotate.await_args.kwargs["args"][3:], [60, "sid1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from src.services.search import TrigramIndex, similarity
+
+
+class TestTrigramIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TrigramIndex()
+        self.index.add(1, {"firstname": "Andrii", "lastname": "Osadchyi", "email": "andrii@gmail.com"})
+        self.index.add(2, {"firstname": "Andrew", "lastname": "Smith", "email": "andrew@ukr.net"})
+        self.index.add(3, {"firstname": "Kate", "lastname": "Andrews", "email": "kate@gmail.com"})
+
+    def test_substring_search_is_case_insensitive(self):
+        self.assertEqual(sorted(self.index.search({"firstname": "ANDR"}, 10)), [1, 2])
+        self.assertEqual(self.index.search({"lastname": "drew"}, 10), [3])
+        self.assertEqual(self.index.search({"firstname": "zzz"}, 10), [])
+
+    def test_best_match_first_and_limit(self):
+        self.assertEqual(self.index.search({"firstname": "andrew"}, 10), [2])
+        self.assertEqual(self.index.search({"email": "gmail"}, 1), [3])
+        self.assertEqual(self.index.search({"firstname": "andr", "email": "gmail"}, 10), [1])
+
+    def test_similarity(self):
+        self.assertEqual(similarity("andrii", "andrii"), 1.0)
+        self.assertGreater(similarity("andrii", "andri"), similarity("andrii", "andr"))
+        self.assertEqual(similarity("", "andr"), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from jose import JWTError, jwt
+
+from src.services.signing_keys import KeyRing, activate_key, generate_key, read_active_kid
+
+
+class TestKeyRing(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_tokens_verify_with_the_published_key(self):
+        for algorithm in ("RS256", "ES256"):
+            with self.subTest(algorithm=algorithm), tempfile.TemporaryDirectory() as folder:
+                kid = generate_key(folder, algorithm)
+                ring = KeyRing(algorithm, "unused", folder)
+                token = ring.encode({"sub": "andrii@gmail.com"})
+                self.assertEqual(jwt.get_unverified_header(token)["kid"], kid)
+                jwks = json.loads(ring.jwks())
+                self.assertEqual([key["kid"] for key in jwks["keys"]], [kid])
+                self.assertNotIn("d", jwks["keys"][0])
+                self.assertEqual(jwt.decode(token, jwks, algorithms=[algorithm])["sub"], "andrii@gmail.com")
+
+    def test_rotation_keeps_old_tokens_valid(self):
+        old = generate_key(self.folder.name)
+        ring = KeyRing("RS256", "unused", self.folder.name)
+        old_token = ring.encode({"sub": "andrii@gmail.com"})
+        etag = ring.etag
+        new = generate_key(self.folder.name)
+        ring.reload()
+        # Published only: in the JWKS, but the old key still signs
+        self.assertEqual(ring.kid, old)
+        self.assertNotEqual(ring.etag, etag)
+        self.assertIn(new, [key["kid"] for key in json.loads(ring.jwks())["keys"]])
+        activate_key(self.folder.name, new)
+        ring.reload()
+        self.assertEqual(ring.kid, new)
+        self.assertEqual(jwt.get_unverified_header(ring.encode({"sub": "x"}))["kid"], new)
+        self.assertEqual(ring.decode(old_token)["sub"], "andrii@gmail.com")
+        self.assertEqual(KeyRing("RS256", "unused", self.folder.name, active_kid=old).kid, old)
+
+    def test_key_is_activated_after_the_jwks_max_age(self):
+        old = generate_key(self.folder.name)
+        new = generate_key(self.folder.name)
+        with self.assertRaises(ValueError):
+            activate_key(self.folder.name, new, min_age=3600)
+        with self.assertRaises(ValueError):
+            activate_key(self.folder.name, "missing")
+        self.assertEqual(read_active_kid(self.folder.name), old)
+        published = time.time() - 3601
+        os.utime(os.path.join(self.folder.name, f"{new}.pem"), (published, published))
+        activate_key(self.folder.name, new, min_age=3600)
+        self.assertEqual(KeyRing("RS256", "unused", self.folder.name).kid, new)
+
+    def test_keys_generated_before_the_active_file_keep_signing(self):
+        old = generate_key(self.folder.name)
+        os.remove(os.path.join(self.folder.name, "active"))
+        generate_key(self.folder.name)
+        self.assertEqual(KeyRing("RS256", "unused", self.folder.name).kid, old)
+
+    def test_unknown_kid_is_rejected(self):
+        generate_key(self.folder.name)
+        with tempfile.TemporaryDirectory() as other:
+            generate_key(other)
+            token = KeyRing("RS256", "unused", other).encode({"sub": "andrii@gmail.com"})
+        with self.assertRaises(JWTError):
+            KeyRing("RS256", "unused", self.folder.name).decode(token)
+
+    def test_shared_secret_without_keys(self):
+        ring = KeyRing("HS256", "secret")
+        self.assertEqual(ring.decode(ring.encode({"sub": "andrii@gmail.com"}))["sub"], "andrii@gmail.com")
+        self.assertEqual(json.loads(ring.jwks()), {"keys": []})
+        with self.assertRaises(ValueError):
+            KeyRing("RS256", "unused").reload()
+
+
+class TestKeyReload(unittest.IsolatedAsyncioTestCase):
+
+    async def test_published_reload_picks_up_a_new_key(self):
+        with tempfile.TemporaryDirectory() as folder:
+            generate_key(folder)
+            ring = KeyRing("RS256", "unused", folder)
+            ring.reload()
+            messages = asyncio.Queue()
+
+            async def listen():
+                while True:
+                    yield await messages.get()
+
+            pubsub = MagicMock(subscribe=AsyncMock(), unsubscribe=AsyncMock(), listen=listen)
+            await ring.start(MagicMock(pubsub=lambda: pubsub))
+            new = generate_key(folder)
+            activate_key(folder, new)
+            await messages.put({"type": "subscribe"})
+            await messages.put({"type": "message", "data": "reload"})
+            while messages.qsize():
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            self.assertEqual(ring.kid, new)
+            await ring.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from jose import JWTError, jwt
+
+from src.services import auth as auth_module
+from src.services.auth import auth_service
+from src.services.token_cache import AccessTokenCache
+
+
+def claims(sub="andrii@gmail.com", iat=None, exp=None) -> dict:
+    now = int(time.time())
+    return {"sub": sub, "scope": "access_token", "iat": now if iat is None else iat,
+            "exp": now + 900 if exp is None else exp}
+
+
+class TestAccessTokenCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = AccessTokenCache(maxsize=2, revocation_ttl=900)
+
+    def test_claims_are_kept_until_exp(self):
+        self.cache.put("a", claims())
+        self.cache.put("b", claims(exp=int(time.time()) - 1))
+        self.assertEqual(self.cache.get("a")["sub"], "andrii@gmail.com")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNone(self.cache.get("c"))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put("a", claims())
+        self.cache.put("b", claims())
+        self.cache.get("a")
+        self.cache.put("c", claims())
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_disabled_cache_keeps_nothing(self):
+        cache = AccessTokenCache(maxsize=0, revocation_ttl=900)
+        cache.put("a", claims())
+        self.assertIsNone(cache.get("a"))
+
+    async def test_revoke_rejects_older_tokens_only(self):
+        now = int(time.time())
+        await self.cache.revoke("andrii@gmail.com")
+        self.assertTrue(self.cache.is_revoked(claims(iat=now - 60)))
+        self.assertTrue(self.cache.is_revoked(claims(iat=now)))
+        self.assertFalse(self.cache.is_revoked(claims(iat=now + 1)))
+        self.assertFalse(self.cache.is_revoked(claims(sub="kate@gmail.com", iat=now - 60)))
+
+    async def test_expired_revocations_are_dropped(self):
+        now = time.time()
+        for sid in ("sid-1", "sid-2"):
+            await self.cache.revoke(sid)
+        with patch("src.services.token_cache.time.time", return_value=now + 901):
+            await self.cache.revoke("sid-3")
+        self.assertEqual(list(self.cache._revoked), ["sid-3"])
+
+
+class TestDecodeAccessToken(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = AccessTokenCache(maxsize=10, revocation_ttl=900)
+        patcher = patch.object(auth_module, "token_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_signature_is_verified_once(self):
+        token = jwt.encode(claims(), auth_service.SECRET_KEY, algorithm=auth_service.ALGORITHM)
+        with patch.object(auth_module.key_ring, "decode", wraps=auth_module.key_ring.decode) as decode:
+            auth_service.decode_access_token(token)
+            self.assertEqual(auth_service.decode_access_token(token)["sub"], "andrii@gmail.com")
+        self.assertEqual(decode.call_count, 1)
+
+    def test_refresh_token_is_not_an_access_token(self):
+        token = jwt.encode(dict(claims(), scope="refresh_token"), auth_service.SECRET_KEY,
+                           algorithm=auth_service.ALGORITHM)
+        with self.assertRaises(JWTError):
+            auth_service.decode_access_token(token)
+        self.assertIsNone(self.cache.get(token))
+
+    async def test_cached_token_is_rejected_after_revocation(self):
+        token = jwt.encode(claims(iat=int(time.time()) - 60), auth_service.SECRET_KEY,
+                           algorithm=auth_service.ALGORITHM)
+        auth_service.decode_access_token(token)
+        await self.cache.revoke("andrii@gmail.com")
+        with self.assertRaises(JWTError):
+            auth_service.decode_access_token(token)
+
+
+if __name__ == '__main__':
+    unittest.main()
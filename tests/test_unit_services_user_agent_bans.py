@@ -0,0 +1,80 @@
+import re
+import unittest
+from unittest.mock import AsyncMock
+
+from src.services.user_agent_bans import AhoCorasick, InvalidRules, UserAgentBans
+
+
+class TestUserAgentBans(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.bans = UserAgentBans([r"Python-urllib", "curl/", r"(?i)sqlmap", r"^Go-http-client/\d"], cache_size=2)
+
+    def test_literals_and_patterns(self):
+        self.assertTrue(self.bans.is_banned("Python-urllib/3.11"))
+        self.assertTrue(self.bans.is_banned("curl/8.1.2"))
+        self.assertTrue(self.bans.is_banned("SQLMap/1.7"))
+        self.assertTrue(self.bans.is_banned("Go-http-client/1.1"))
+        self.assertFalse(self.bans.is_banned("Mozilla/5.0 Go-http-client/1.1"))
+        self.assertFalse(self.bans.is_banned("Mozilla/5.0 (X11; Linux x86_64) Firefox/115.0"))
+
+    def test_missing_header_is_not_banned(self):
+        self.assertFalse(self.bans.is_banned(None))
+        self.assertFalse(self.bans.is_banned(""))
+
+    def test_verdicts_are_cached_and_reset_on_load(self):
+        self.bans.is_banned("curl/8.1.2")
+        self.bans.is_banned("Mozilla/5.0")
+        self.bans.is_banned("Wget/1.21")
+        self.assertEqual(list(self.bans._verdicts), ["Mozilla/5.0", "Wget/1.21"])
+        self.bans.load(["Wget"])
+        self.assertTrue(self.bans.is_banned("Wget/1.21"))
+        self.assertFalse(self.bans.is_banned("curl/8.1.2"))
+
+    def test_invalid_rule_keeps_the_current_rules(self):
+        with self.assertRaises(re.error):
+            self.bans.load(["(unclosed"])
+        self.assertTrue(self.bans.is_banned("curl/8.1.2"))
+
+    def test_rules_are_checked_one_by_one(self):
+        with self.assertRaises(InvalidRules) as raised:
+            self.bans.load([r"(a)\1", r"(?P<v>bot)/\d", r"(?P<v>spider)", "(unclosed", r"(?:crawl|scan)er"])
+        self.assertEqual(set(raised.exception.errors), {r"(a)\1", r"(?P<v>bot)/\d", r"(?P<v>spider)", "(unclosed"})
+        self.assertIn("capturing groups", raised.exception.errors[r"(a)\1"])
+
+    async def test_invalid_runtime_rules_are_not_stored(self):
+        redis = AsyncMock()
+        self.bans._redis = redis
+        with self.assertRaises(InvalidRules):
+            await self.bans.add_rules(["HeadlessChrome", "(bad)"])
+        redis.sadd.assert_not_awaited()
+
+    async def test_invalid_stored_rules_are_skipped(self):
+        redis = AsyncMock()
+        redis.smembers.return_value = {"HeadlessChrome", "(old)"}
+        self.bans._redis = redis
+        await self.bans.reload()
+        self.assertTrue(self.bans.is_banned("HeadlessChrome/115.0"))
+        self.assertTrue(self.bans.is_banned("curl/8.1.2"))
+        self.assertNotIn("(old)", self.bans.rules)
+
+    async def test_runtime_rules_are_stored_in_redis(self):
+        redis = AsyncMock()
+        redis.pubsub = lambda: AsyncMock()
+        redis.smembers.return_value = {"HeadlessChrome"}
+        self.bans._redis = redis
+        await self.bans.add_rules(["HeadlessChrome"])
+        redis.sadd.assert_awaited_with(UserAgentBans.KEY, "HeadlessChrome")
+        redis.publish.assert_awaited()
+        self.assertTrue(self.bans.is_banned("Mozilla/5.0 HeadlessChrome/115.0"))
+        self.assertTrue(self.bans.is_banned("curl/8.1.2"))
+
+    def test_aho_corasick_overlapping_words(self):
+        automaton = AhoCorasick(["he", "she", "hers", "abcd", "bc"])
+        self.assertTrue(automaton.search("ushers"))
+        self.assertTrue(automaton.search("xabcx"))
+        self.assertFalse(automaton.search("abx"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import datetime
+import json
+import unittest
+from unittest.mock import AsyncMock
+
+from src.database.models import User
+from src.services.user_cache import UserCache
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = UserCache(maxsize=2, ttl=60, redis_ttl=300)
+        self.user = User(id=1, username="Andrii", email="andrii@gmail.com", password="hash", refresh_token="token",
+                         avatar="https://www.google.com", created_at=datetime.datetime(2023, 7, 1, 12, 0))
+
+    async def test_hit_and_miss(self):
+        self.assertIsNone(await self.cache.get("andrii@gmail.com"))
+        await self.cache.set(self.user)
+        result = await self.cache.get("andrii@gmail.com")
+        self.assertIsNot(result, self.user)
+        self.assertEqual(result.id, self.user.id)
+        self.assertEqual(result.created_at, self.user.created_at)
+        self.assertIsNone(result.password)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    async def test_expired_entry_is_a_miss(self):
+        self.cache.ttl = 0
+        await self.cache.set(self.user)
+        self.assertIsNone(await self.cache.get("andrii@gmail.com"))
+
+    async def test_least_recently_used_is_evicted(self):
+        for i in range(3):
+            await self.cache.set(User(id=i, email=f"user{i}@gmail.com"))
+        self.assertIsNone(await self.cache.get("user0@gmail.com"))
+        self.assertIsNotNone(await self.cache.get("user2@gmail.com"))
+
+    async def test_redis_tier_and_invalidation(self):
+        redis = AsyncMock()
+        redis.get.return_value = json.dumps(UserCache._to_dict(self.user))
+        self.cache._redis = redis
+        result = await self.cache.get("andrii@gmail.com")
+        self.assertEqual(result.username, "Andrii")
+        self.assertEqual(self.cache.stats()["redis_hits"], 1)
+        await self.cache.invalidate("andrii@gmail.com")
+        redis.delete.assert_awaited_with("user:andrii@gmail.com")
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()